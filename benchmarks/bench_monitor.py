@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+# -*- coding=utf-8 -*-
+r"""
+overhead of a function that is wrapped with monitor()
+
+$ python benchmarks/bench_monitor.py [--number 200000] [--repeat 5]
+
+- bare: the function without the decorator
+- wrapper: the function behind a plain (*args, **kwargs) wrapper. the least that any decorator costs
+- disconnected: no server receives the messages. only the wrapper and client.receiving() (nothing is formatted)
+- connected: a local server receives them (non_blocking. so the formatting is done by the writer-thread)
+"""
+import os
+import sys
+import socket
+import timeit
+import functools
+import argparse
+import tempfile
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))  # noqa
+from debuglib.core import DebugServer  # noqa: E402
+from debuglib.decorator import Decorator  # noqa: E402
+
+
+def function(a, b=2):
+    return a + b
+
+
+@functools.wraps(function)
+def wrapped(*args, **kwargs):
+    return function(*args, **kwargs)
+
+
+def measure(fn, number: int, repeat: int) -> float:
+    r"""
+    nanoseconds per call (best of `repeat`)
+    """
+    return min(timeit.repeat(lambda: fn(1, b=2), number=number, repeat=repeat)) / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200_000, help="calls per measurement")
+    parser.add_argument('--repeat', type=int, default=5, help="measurements (the fastest one counts)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="debuglib-bench-") as directory:
+        run(directory, args.number, args.repeat)
+    os._exit(0)  # don't wait for the queued messages
+
+
+def run(directory: str, number: int, repeat: int):
+    if hasattr(socket, 'AF_UNIX'):
+        unreachable = f"unix://{os.path.join(directory, 'nobody.sock')}"
+        server_info = f"unix://{os.path.join(directory, 'debuglib.sock')}"
+    else:  # windows
+        unreachable, server_info = ("localhost", 1), ("localhost", 35354)
+
+    print(f"bare          {measure(function, number, repeat):8.0f} ns/call")
+    print(f"wrapper       {measure(wrapped, number, repeat):8.0f} ns/call")
+
+    decorator = Decorator(server_info=unreachable)
+    disconnected = decorator.monitor()(function)
+    decorator._client.flush()  # waits for the first connection-attempt (it fails)
+    print(f"disconnected  {measure(disconnected, number, repeat):8.0f} ns/call")
+
+    server = DebugServer(server_info=server_info)
+    received = []
+    server.on_message(lambda message, client: received.append(None))
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    decorator = Decorator(server_info=server_info, non_blocking=True)
+    connected = decorator.monitor()(function)
+    decorator._client.flush()  # waits for the first connection-attempt
+    print(f"connected     {measure(connected, number, repeat):8.0f} ns/call"
+          f" ({decorator._client.dropped} dropped as the queue was full)")
+
+    server.shutdown()
+    server.close()
+
+if __name__ == '__main__':
+    main()
@@ -18,9 +18,9 @@ parser.set_defaults(fn=parser.print_help)
 subparser = parser.add_subparsers()
 
 
-def cmd_listen(host: str = None, port: int = None):
+def cmd_listen(host: str = None, port: int = None, unix: str = None, trace: str = None):
     from ._cli import CLIListener
-    listener = CLIListener((host, port))
+    listener = CLIListener(f"unix://{unix}" if unix else (host, port), trace=trace)
     listener.run()
 
 
@@ -34,6 +34,59 @@ listen_parser.add_argument('--host', type=str, default=DEFAULT_SERVER_HOST,
                            help='host to bind to')
 listen_parser.add_argument('--port', type=int, default=DEFAULT_SERVER_PORT,
                            help="port to listen on")
+listen_parser.add_argument('--unix', type=str, default=None, metavar="PATH",
+                           help="listen on a unix domain socket instead (clients use server_info='unix://PATH')")
+listen_parser.add_argument('--trace', type=str, default=None, metavar="FILE",
+                           help="write the spans of the monitored calls as chrome trace (perfetto) to FILE on exit")
+
+
+def cmd_profile(host: str = None, port: int = None, unix: str = None, output: str = None, top: int = None):
+    from ._cli.profiler import CLIProfiler
+    profiler = CLIProfiler(f"unix://{unix}" if unix else (host, port), output=output, top=top)
+    profiler.run()
+
+
+profile_parser = subparser.add_parser(
+    name="profile",
+    description="receive the samples of debuglib.profiler, show the top functions and write the folded stacks",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter,
+)
+profile_parser.set_defaults(fn=cmd_profile)
+profile_parser.add_argument('--host', type=str, default=DEFAULT_SERVER_HOST,
+                            help='host to bind to')
+profile_parser.add_argument('--port', type=int, default=DEFAULT_SERVER_PORT,
+                            help="port to listen on")
+profile_parser.add_argument('--unix', type=str, default=None, metavar="PATH",
+                            help="listen on a unix domain socket instead")
+profile_parser.add_argument('--output', '-o', type=str, default=None, metavar="FILE",
+                            help="write the folded stacks (for flamegraph.pl or speedscope) to FILE on exit")
+profile_parser.add_argument('--top', type=int, default=15,
+                            help="number of functions that are shown")
+
+
+def cmd_relay(host: str = None, port: int = None, unix: str = None, upstream: str = None, spool: bool = False):
+    from .core.server.relay import Relay
+    relay = Relay(f"unix://{unix}" if unix else (host, port), upstream=upstream, spool=spool)
+    print(f"Relaying from {relay.address} to {upstream}")
+    relay.run()
+
+
+relay_parser = subparser.add_parser(
+    name="relay",
+    description="forward the messages of all local processes (e.g. worker-pools) over one connection to the server",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter,
+)
+relay_parser.set_defaults(fn=cmd_relay)
+relay_parser.add_argument('--host', type=str, default=DEFAULT_SERVER_HOST,
+                          help='host to bind to')
+relay_parser.add_argument('--port', type=int, default=DEFAULT_SERVER_PORT,
+                          help="port to listen on")
+relay_parser.add_argument('--unix', type=str, default=None, metavar="PATH",
+                          help="listen on a unix domain socket instead (recommended)")
+relay_parser.add_argument('--upstream', type=str, required=True, metavar="SERVER",
+                          help="the debug-server (host, tcp://host:port or unix://PATH)")
+relay_parser.add_argument('--spool', action='store_true',
+                          help="keep the messages on disk while the server is unreachable")
 
 
 def main():
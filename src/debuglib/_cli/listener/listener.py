@@ -3,47 +3,81 @@ r"""
 
 """
 import socket
+import typing as t
 from datetime import datetime
 from ...core.server import DebugServer
+from ...core.server.trace import TraceRecorder
+from ...core.server.relay import source_of
 from ...core.common import extract_server_info
-from ..._typing import ServerInfoRaw, Message
+from ...core.common.exception import render_traceback
+from ...core.common.record import render_message
+from ..._typing import ServerInfoRaw, Message, LatencySummary, MemoryInfo
+from ...decorator._util import format_bytes
 from ..._packages import format_exception
 
 
 class CLIListener:
-    def __init__(self, server_info: ServerInfoRaw = None):
+    def __init__(self, server_info: ServerInfoRaw = None, trace: str = None):
         self.server_info = server_info = extract_server_info(server_info)
         self._server = DebugServer(server_info=server_info)
         self._server.on_connection_open(self.on_connection_open)
         self._server.on_connection_closed(self.on_connection_closed)
         self._server.on_message(self.on_message)
         self._server.on_error(self.on_error)
+        self._trace = trace
+        self._recorder = None
+        if trace:  # spans are collected and written to the file when the listener stops
+            self._recorder = TraceRecorder()
+            self._server.on_message(self._recorder.on_message)
 
     def run(self):
-        print(f"Listening on {self.server_info[0]}:{self.server_info[1]}")
+        print(f"Listening on {self._server.address}")
         try:
             self._server.serve_forever()
         except KeyboardInterrupt:
             self._server.shutdown()
         finally:
             self._server.close()
+            if self._recorder is not None:
+                self._recorder.export(self._trace)
+                print(f"Wrote {len(self._recorder)} spans to {self._trace}")
 
     @staticmethod
     def on_connection_open(client: str):
-        print(f"New Connection from {client} ({socket.getfqdn(client.partition(':')[0])})")
+        print(f"New Connection from {describe_client(client)}")
 
     @staticmethod
     def on_connection_closed(client: str):
-        print(f"Connection closed from {client} ({socket.getfqdn(client.partition(':')[0])})")
+        print(f"Connection closed from {describe_client(client)}")
 
     @staticmethod
     def on_message(message: Message, client: str):
         ts = datetime.fromtimestamp(message['timestamp']).strftime("%H:%M:%S.%f")
+        client = source_of(message, client)  # the process behind a relay
         level = message['level'][:3].upper()
-        print(f"{ts} | {client} | {level:.3} | {message['message']}")
+        repeats = message.get('repeats')
+        if repeats:  # repeated exception (see core/client/_dedup.py)
+            times = "time" if repeats == 1 else "times"
+            print(f"{ts} | {client} | {level:.3} | {message['message']} (seen {repeats} more {times})")
+            for value in message.get('values', ()):
+                print(f"    also with: {value}")
+            return
+        record = message.get('record')
+        if record:  # structured log-record. formatted here instead of by the client
+            print(f"{ts} | {client} | {level:.3} | [{record['logger']}] {render_message(message)}")
+        else:
+            print(f"{ts} | {client} | {level:.3} | {message['message']}")
+        latencies = message.get('latencies')
+        if latencies:  # Decorator.monitor(aggregate=True)
+            print(format_latency_table(latencies))
+            print("-" * 80)
+        memory = message.get('memory')
+        if memory and memory['top']:  # debuglib.profiler.MemoryTracker
+            print(format_memory_table(memory))
+            print("-" * 80)
         exception_info = message['exception_info']
         if exception_info:
-            print(exception_info['traceback'])
+            print(render_traceback(exception_info))
             print(f"{exception_info['type']}: {exception_info['value']}")
             print("-" * 80)
 
@@ -52,3 +86,44 @@ class CLIListener:
         print("-", "<Server Error>", '-' * 62)
         print('\n'.join(format_exception(error)))  # file=sys.stderr?
         print("-" * 80)
+
+
+LATENCY_COLUMNS = ("mean", "p50", "p90", "p99", "max")
+
+
+def format_latency_table(latencies: t.Mapping[str, LatencySummary]) -> str:
+    width = max(len("function"), *map(len, latencies))
+    lines = [
+        f"{'function':<{width}} {'count':>8} {'errors':>7} " + " ".join(f"{column:>9}" for column in LATENCY_COLUMNS)
+    ]
+    for name, latency in sorted(latencies.items(), key=lambda item: -item[1]['count'] * item[1]['mean']):
+        lines.append(
+            f"{name:<{width}} {latency['count']:>8} {latency['errors']:>7} "
+            + " ".join(f"{format_ns(latency[column]):>9}" for column in LATENCY_COLUMNS)
+        )
+    return '\n'.join(lines)
+
+
+def format_memory_table(memory: MemoryInfo) -> str:
+    lines = [f"{'size':>10} {'change':>10} {'blocks':>8} {'change':>8}  site"]
+    for site in memory['top']:
+        size_diff = ('+' if site['size_diff'] > 0 else '') + format_bytes(site['size_diff'])
+        lines.append(
+            f"{format_bytes(site['size']):>10} {size_diff:>10} "
+            f"{site['count']:>8} {site['count_diff']:>+8}  {site['site']}"
+        )
+    return '\n'.join(lines)
+
+
+def format_ns(value: int) -> str:
+    for factor, unit in ((1_000_000_000, "s"), (1_000_000, "ms"), (1_000, "μs")):
+        if value >= factor:
+            return f"{value / factor:.3g}{unit}"
+    return f"{value}ns"
+
+
+def describe_client(client: str) -> str:
+    host = client.partition(':')[0]
+    if host == "unix":  # unix domain socket. see core.common.transport
+        return client
+    return f"{client} ({socket.getfqdn(host)})"
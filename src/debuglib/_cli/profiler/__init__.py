@@ -0,0 +1,5 @@
+# -*- coding=utf-8 -*-
+r"""
+
+"""
+from .profiler import CLIProfiler
@@ -0,0 +1,82 @@
+# -*- coding=utf-8 -*-
+r"""
+receives the samples of debuglib.profiler, shows the top functions and writes the folded stacks
+(input of flamegraph.pl, speedscope, ...)
+"""
+import time
+import collections
+import typing as t
+from ...core.server import DebugServer
+from ...core.common import extract_server_info
+from ..._typing import ServerInfoRaw, Message
+from ..listener.listener import describe_client, CLIListener
+
+
+class CLIProfiler:
+    def __init__(self, server_info: ServerInfoRaw = None, output: str = None, top: int = 15,
+                 refresh: float = 2.0):
+        self.server_info = server_info = extract_server_info(server_info)
+        self.output = output
+        self.top = top
+        self.refresh = refresh
+        self._server = DebugServer(server_info=server_info)
+        self._server.on_connection_open(self.on_connection_open)
+        self._server.on_connection_closed(self.on_connection_closed)
+        self._server.on_message(self.on_message)
+        self._server.on_error(CLIListener.on_error)
+        self._stacks: t.Counter[str] = collections.Counter()  # folded stack -> samples
+        self._own: t.Counter[str] = collections.Counter()  # function -> samples where it's the leaf
+        self._total: t.Counter[str] = collections.Counter()  # function -> samples where it's on the stack
+        self._samples = 0
+        self._next_refresh = 0.0
+
+    def run(self):
+        print(f"Listening on {self._server.address}")
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            self._server.shutdown()
+        finally:
+            self._server.close()
+            self.print_top()
+            if self.output:
+                self.write_folded(self.output)
+                print(f"Wrote {len(self._stacks)} stacks to {self.output}")
+
+    @staticmethod
+    def on_connection_open(client: str):
+        print(f"New Connection from {describe_client(client)}")
+
+    @staticmethod
+    def on_connection_closed(client: str):
+        print(f"Connection closed from {describe_client(client)}")
+
+    def on_message(self, message: Message, client: str):
+        profile = message.get('profile')
+        if not profile:
+            return
+        frames = profile['frames']
+        for path, count in profile['stacks']:
+            names = [frames[index] for index in path]
+            self._stacks[';'.join(names)] += count
+            if names:
+                self._own[names[-1]] += count
+            for name in set(names):  # recursion counts once
+                self._total[name] += count
+            self._samples += count
+        if time.monotonic() >= self._next_refresh:
+            self._next_refresh = time.monotonic() + self.refresh
+            self.print_top()
+
+    def print_top(self):
+        if not self._samples:
+            return
+        print(f"{'own':>7} {'total':>7}  function ({self._samples} samples)")
+        for name, own in self._own.most_common(self.top):
+            print(f"{own / self._samples:>7.1%} {self._total[name] / self._samples:>7.1%}  {name}")
+        print("-" * 80)
+
+    def write_folded(self, path: str):
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self._stacks.most_common():
+                file.write(f"{stack} {count}\n")
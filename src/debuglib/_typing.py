@@ -8,18 +8,114 @@ import typing as t
 DEFAULT_VALUE = object()
 
 
-ServerInfo = t.Tuple[str, int]
+class TransportServerInfo(t.NamedTuple):
+    scheme: str  # e.g. unix
+    address: str  # e.g. /path/to/socket
+
+
+ServerInfo = t.Union[t.Tuple[str, int], TransportServerInfo]
 ServerInfoRaw = t.Union[None, str, int, ServerInfo]
 
 
+class _FrameInfo(t.TypedDict):
+    filename: str  # code.co_filename
+    lineno: int
+    name: str  # code.co_qualname
+
+
+class FrameInfo(_FrameInfo, total=False):
+    locals: t.Dict[str, str]  # bounded reprs (only if captured)
+
+
 class ExceptionInfo(t.TypedDict):
     type: str  # type(exception)
     value: str  # str(exception)
-    traceback: str  # format_traceback(exception)
+    traceback: str  # format_traceback(exception) or empty if structured
+
+
+class StructuredExceptionInfo(ExceptionInfo):
+    frames: t.List[FrameInfo]  # outermost first. rendered by the receiver
+    omitted: int  # outer frames that were left out (depth-limit)
+
+
+class LatencySummary(t.TypedDict):
+    count: int  # calls in the interval
+    errors: int  # calls that raised
+    mean: int  # nanoseconds
+    p50: int  # nanoseconds (percentiles are accurate to ~3%)
+    p90: int
+    p99: int
+    max: int
+
+
+class SpanInfo(t.TypedDict):
+    id: int
+    parent: t.Optional[int]  # span of the monitored call that is calling this one
+    name: str  # the monitored function
+    start: int  # time.time_ns()
+    duration: int  # nanoseconds
+    thread: int  # native id of the thread (or id of the asyncio-task)
+
 
+class ProfileInfo(t.TypedDict):
+    frames: t.List[str]  # labels of the functions. the stacks refer to them by their index
+    stacks: t.List[t.Tuple[t.List[int], int]]  # (frames from the root to the leaf, number of samples)
+    samples: int  # taken in this report (per thread)
+    interval: float  # seconds between the samples
 
-class Message(t.TypedDict):
+
+class CallMemory(t.TypedDict):
+    allocated: int  # bytes that are still allocated at the end of the call (can be negative)
+    peak: int  # highest traced memory during the call (in bytes above the start)
+
+
+class AllocationSite(t.TypedDict):
+    site: str  # filename:lineno (or the traceback with the most recent frame first)
+    size: int  # bytes
+    size_diff: int  # since the last report
+    count: int  # memory blocks
+    count_diff: int
+
+
+class MemoryInfo(t.TypedDict):
+    current: int  # traced bytes
+    peak: int
+    top: t.List[AllocationSite]  # biggest changes since the last report
+
+
+class _LogRecordInfo(t.TypedDict):
+    logger: str
+    pathname: str
+    lineno: int
+    func: str
+    process: int
+    thread: int
+    thread_name: str
+
+
+class LogRecordInfo(_LogRecordInfo, total=False):
+    args: t.Union[t.List[t.Any], t.Dict[str, t.Any]]  # the message is the %-template (see render_message())
+    extra: t.Dict[str, str]  # bounded reprs of the attributes that were passed with logging's extra=
+
+
+class _Message(t.TypedDict):
     message: str
     level: str
-    exception_info: t.Optional[ExceptionInfo]
+    exception_info: t.Optional[t.Union[ExceptionInfo, StructuredExceptionInfo]]
     timestamp: float
+
+
+class Message(_Message, total=False):
+    fingerprint: str  # identifies a repeated exception (see core/client/_dedup.py)
+    repeats: int  # only a counter: the exception with the fingerprint occurred this many times more
+    values: t.List[str]  # of the repeats that differ from the value of the sent exception
+    suppressed: t.Dict[str, int]  # number of messages per level[/origin] that were dropped by the rate-limit
+    latencies: t.Dict[str, LatencySummary]  # per function. aggregated by Decorator.monitor(aggregate=True)
+    interval: float  # seconds that are covered by the latencies
+    span: SpanInfo  # the monitored call as part of a trace (see core/server/trace.py)
+    profile: ProfileInfo  # stacks sampled since the last report (see debuglib.profiler)
+    call_memory: CallMemory  # Decorator.monitor(memory=True)
+    memory: MemoryInfo  # allocation-sites of the process (see debuglib.profiler.MemoryTracker)
+    record: LogRecordInfo  # structured log-record (see core/common/record.py)
+    peer: str  # connection of the sending process at the relay (see core/server/relay.py)
+    pid: int  # process-id of the sending process (added by the relay if it's known)
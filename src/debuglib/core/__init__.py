@@ -3,4 +3,6 @@ r"""
 
 """
 from .client import DebugClient
+from .client.async_client import AsyncDebugClient
 from .server import DebugServer
+from .pool import ClientPool, acquire_client, release_client, shutdown_clients
@@ -2,137 +2,605 @@
 r"""
 Handshake Message:
 - response of '1' means "connection accepted"
-> DEBUGLIB\0{len:1}{version}\0
-< 1
+- the client offers features and the server responds with the accepted ones (see common/protocol.py)
+> DEBUGLIB\0{len:1}{version}\0{len:1}{features}
+< 1{len:1}{features}
+> {pid:4}  (if p was accepted)
 
 Normal Message:
-- m: msgpack encoded body
+- m: msgpack encoded body (reserved)
 - j: json encoded body
-{m|j}{len:2}{body}
+- b: binary encoded body (if negotiated. see common/codec.py)
+{m|j|b}{len:2}{body}
+
+Batching:
+- if enabled multiple messages are collected and written with one call
+- the buffer is written once it reaches `batch_size` bytes, `batch_count` messages or after `batch_delay` seconds
+- buffered messages are written on flush(), close() and at interpreter exit
+
+Non-Blocking:
+- send() only puts the message into a bounded queue. formatting and sending is done by a background-thread
+- the background-thread builds and encodes everything that is queued and writes it with one call
+- if the queue is full the message is dropped (or waits for space). see `overflow`
+- the background-thread takes the queued messages after `queue_delay` seconds or once there are enough of them
+- the number of dropped messages is periodically reported to the server
+
+Connecting:
+- the constructor doesn't connect. the first connection-attempt is done by the background-thread
+- messages that are sent during the first attempt are held back and written (or spooled or dropped) once it's done.
+  a sender that would exceed `MAX_HELD_BACK` waits for the attempt instead (like a connecting constructor)
+  (flush() waits for the first attempt. bounded by `connect_timeout`)
+- reconnecting is done by the background-thread with exponential backoff (+ jitter) up to `max_connection_attempt_delta`
+- while there is no connection send() drops the messages without formatting them
+
+Spool:
+- optionally the messages are written to disk while there is no connection (see _spool.py)
+- after the next handshake they are sent before any newer message
+
+Thread-Safety:
+- every thread builds its own messages (incl. formatting of the traceback). only complete messages are handed over
+- one thread at a time encodes and writes all pending messages (of all threads). the others don't wait for it
+- encoding happens in write-order as it depends on the connection (negotiated features)
+- (re-)connecting is only done by the background-thread
 """
-import sys
 import time
+import atexit
 import socket
+import weakref
+import threading
+import collections
 import typing as t
-# noinspection PyPep8Naming
-from ... import __version__ as DEBUGLIB_VERSION
-from ..._packages import json, format_traceback, format_exception
-from ..._typing import DEFAULT_VALUE, ServerInfo, ServerInfoRaw, Message
-from ..common import extract_server_info
+from ..._typing import DEFAULT_VALUE, ServerInfoRaw
+from ..._typing import Message
+from ..common import Encoder
+from ._base import BaseClient
+from ._buffer import WriteBuffer, sendall_vectored
+from ._ring import RingBuffer, OVERFLOW_DROP_NEWEST
+from ._spool import Spool
 
 
-T_CB_ON_ERROR = t.Callable[[Exception], None]
+MAX_HELD_BACK = 10_000  # messages that are kept during the first connection-attempt without waiting for it
 
 
-class DebugClient:
-    _server_info: ServerInfo
-    _timeout: float
+class DebugClient(BaseClient):
     _conn: t.Optional[socket.socket]
-    _on_error: t.List[T_CB_ON_ERROR]
-    _print_on_error: bool
-    _connection_attempt_delta: float
-    _next_connection_attempt: float
+    _encoder: t.Optional[Encoder]
+    _lock: threading.Lock
+    _pending: t.Deque[Message]
+    _buffer: t.Optional[WriteBuffer]
+    _queue: t.Optional[RingBuffer]
+    _wakeup: threading.Event
+    _writer: t.Optional[threading.Thread]
+    _drop_report_interval: float
+    _next_drop_report: float
+    _reported_drops: int
+    _spool: t.Optional[Spool]
+    _reported_evictions: int
+    _closed: bool
+    _connecting: bool  # the first connection-attempt isn't done yet
+    _first_attempt: threading.Event  # set once the first connection-attempt is done (for flush())
 
     def __init__(self, *, server_info: ServerInfoRaw = DEFAULT_VALUE, timeout: float = DEFAULT_VALUE,
-                 connection_attempt_delta: float = DEFAULT_VALUE):
+                 connect_timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
+                 max_connection_attempt_delta: float = DEFAULT_VALUE,
+                 capture_locals: bool = DEFAULT_VALUE, max_frames: int = DEFAULT_VALUE,
+                 max_repr_length: int = DEFAULT_VALUE,
+                 deduplicate: bool = DEFAULT_VALUE, deduplicate_window: float = DEFAULT_VALUE,
+                 rate_limit: t.Union[float, t.Mapping[str, float]] = DEFAULT_VALUE, rate_burst: float = DEFAULT_VALUE,
+                 sample_rate: float = DEFAULT_VALUE,
+                 batch: bool = DEFAULT_VALUE, batch_size: int = DEFAULT_VALUE, batch_count: int = DEFAULT_VALUE,
+                 batch_delay: float = DEFAULT_VALUE,
+                 non_blocking: bool = DEFAULT_VALUE, queue_size: int = DEFAULT_VALUE, overflow: str = DEFAULT_VALUE,
+                 block_timeout: float = DEFAULT_VALUE, queue_delay: float = DEFAULT_VALUE,
+                 drop_report_interval: float = DEFAULT_VALUE,
+                 spool: t.Union[bool, str] = DEFAULT_VALUE, spool_size: int = DEFAULT_VALUE,
+                 spool_segment_size: int = DEFAULT_VALUE):
         r"""
 
         :param server_info: information about the server (host|port|(host, port))
         :param timeout: socket timeout
-        :param connection_attempt_delta: delta between connection attempts
+        :param connect_timeout: timeout for the connection-attempt and the handshake (default: timeout or 1s)
+        :param connection_attempt_delta: delta between connection attempts (doubled after every failed attempt)
+        :param max_connection_attempt_delta: maximum delta between connection attempts
+        :param capture_locals: include (bounded) reprs of the local variables in the tracebacks
+        :param max_frames: maximum number of frames captured per traceback (the innermost are kept)
+        :param max_repr_length: maximum length of the repr of a local variable
+        :param deduplicate: send repeated exceptions (same type and traceback) only once per window with a counter
+            (off by default)
+        :param deduplicate_window: seconds in which an exception is only counted after it was sent
+        :param rate_limit: messages per second per level and origin (one value or per level. e.g. {"DEBUG": 10})
+        :param rate_burst: how many messages can be sent at once before the rate-limit applies
+        :param sample_rate: fraction of the messages that is sent (0..1). ERROR and CRITICAL are always sent
+        :param batch: collect messages and write them together (reduces the number of syscalls)
+        :param batch_size: write the collected messages once they reach this amount of bytes
+        :param batch_count: write the collected messages once there are this many
+        :param batch_delay: maximum time in seconds a message is held back
+        :param non_blocking: only queue the messages and send them from a background-thread
+        :param queue_size: maximum number of queued messages (non_blocking)
+        :param overflow: what to do if the queue is full (drop-newest|drop-oldest|block)
+        :param block_timeout: maximum time to wait for space in the queue (overflow=block)
+        :param queue_delay: maximum time in seconds a queued message waits for more (non_blocking)
+        :param drop_report_interval: minimum time between two reports about dropped messages
+        :param spool: keep the messages on disk while there is no connection (True or the directory to use)
+        :param spool_size: maximum size of the spool in bytes (the oldest messages are deleted first)
+        :param spool_segment_size: size of the files the spool consists of
         """
-        self._server_info = extract_server_info(server_info)
-        self._timeout = None if timeout is DEFAULT_VALUE else timeout
-        self._connection_attempt_delta = 0.1 if connection_attempt_delta is DEFAULT_VALUE else connection_attempt_delta
-        self._next_connection_attempt = 0.0
-        self._print_on_error = False
-        self._on_error = []
-        self._conn = self.create_connection()
+        super().__init__(
+            server_info=server_info, timeout=timeout, connect_timeout=connect_timeout,
+            connection_attempt_delta=connection_attempt_delta,
+            max_connection_attempt_delta=max_connection_attempt_delta,
+            capture_locals=capture_locals, max_frames=max_frames, max_repr_length=max_repr_length,
+            deduplicate=deduplicate, deduplicate_window=deduplicate_window,
+            rate_limit=rate_limit, rate_burst=rate_burst, sample_rate=sample_rate,
+        )
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._wakeup = threading.Event()
+        self._buffer = WriteBuffer(
+            max_size=65536 if batch_size is DEFAULT_VALUE else batch_size,
+            max_count=512 if batch_count is DEFAULT_VALUE else batch_count,
+            max_delay=0.05 if batch_delay is DEFAULT_VALUE else batch_delay,
+        ) if batch is not DEFAULT_VALUE and batch else None
+        queue_size = 10_000 if queue_size is DEFAULT_VALUE else queue_size
+        self._queue = RingBuffer(
+            capacity=queue_size,
+            overflow=OVERFLOW_DROP_NEWEST if overflow is DEFAULT_VALUE else overflow,
+            block_timeout=None if block_timeout is DEFAULT_VALUE else block_timeout,
+            wakeup=self._wakeup,
+            delay=0.01 if queue_delay is DEFAULT_VALUE else queue_delay,
+            wakeup_size=max(min(256, queue_size // 4), 1),  # long before it's full
+        ) if non_blocking is not DEFAULT_VALUE and non_blocking else None
+        self._drop_report_interval = 5.0 if drop_report_interval is DEFAULT_VALUE else drop_report_interval
+        self._next_drop_report = 0.0
+        self._reported_drops = 0
+        self._spool = Spool(
+            directory=None if spool is True else spool,
+            max_size=16 * 1024 * 1024 if spool_size is DEFAULT_VALUE else spool_size,
+            segment_size=1024 * 1024 if spool_segment_size is DEFAULT_VALUE else spool_segment_size,
+        ) if spool is not DEFAULT_VALUE and spool else None
+        self._reported_evictions = 0
+        self._writer = None
+        self._encoder = None
+        self._closed = False
+        self._conn = None
+        self._connecting = True
+        self._first_attempt = threading.Event()
+        _clients.add(self)
+        self._start_writer()  # connects (not the calling thread)
 
     def __del__(self):
         self.close()
+        self._wakeup.set()  # lets the writer-thread exit
+
+    def _after_fork(self):
+        super()._after_fork()
+        # locks could have been held by threads of the parent. these threads don't exist in the child
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending.clear()
+        if self._buffer is not None:
+            self._buffer.take()
+        if self._queue is not None:
+            self._queue._after_fork(wakeup=self._wakeup)
+        if self._spool is not None:
+            self._spool._after_fork()
+        self._reported_evictions = 0
+        connection, self._conn = self._conn, None
+        self._encoder = None
+        if connection is not None:
+            try:
+                connection.close()  # only closes the file-descriptor of the child
+            except OSError:
+                pass
+        self._closed = False
+        self._connecting = True
+        self._first_attempt = threading.Event()
+        self._start_writer()  # connects on its own
 
     def close(self):
-        if self._conn is not None:
-            self._conn.close()
-            self._conn = None
+        r"""
+        writes everything and closes the connection. sending again reconnects in the background
+        """
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._disconnect()
+        if self._spool is not None:
+            try:
+                self._spool.close()  # what is left is sent after the next connect (or by the next process)
+            except OSError as error:
+                self._handle_error(error)
+
+    def flush(self):
+        r"""
+        writes all pending, queued and buffered messages to the server
+        """
+        if self._connecting:  # e.g. a short program that only sends a few messages
+            self._first_attempt.wait(self._first_attempt_timeout())
+        with self._lock:
+            self._write_pending()
+            if self._queue is not None:
+                self._drain_queue()
+                self._report_drops(force=True)
+            notices = self._notices_due(everything=True)
+            if notices:
+                self._send_messages(notices)
+            if self._buffer is not None:
+                self._flush_buffer()
+        if self._spool is not None:
+            try:
+                self._spool.flush()
+            except OSError as error:  # e.g. the disk is full
+                self._handle_error(error)
+        self._combine()
+
+    @property
+    def dropped(self) -> int:
+        r"""
+        number of messages that were dropped because the queue was full
+        """
+        return 0 if self._queue is None else self._queue.dropped
+
+    def receiving(self) -> bool:
+        r"""
+        whether a message that is sent now reaches the server (or the spool).
+        so front-ends can skip formatting it if nobody would receive it
+        """
+        if self._conn is not None or self._spool is not None or self._connecting:
+            return True
+        if self._closed:  # like send(). the next usage after close() reconnects in the background
+            with self._lock:
+                self._schedule_reconnect()
+        return False
+
+    def _delivers(self) -> bool:
+        # whether a message that is sent now is written, spooled or held back (receiving() without side-effects)
+        return self._conn is not None or self._spool is not None or self._connecting
+
+    def _first_attempt_timeout(self) -> t.Optional[float]:
+        # the connection-attempt and the handshake are each bounded by connect_timeout
+        return None if self._connect_timeout is None else 2 * self._connect_timeout + 0.5
+
+    def _start_writer(self):
+        self._writer = threading.Thread(
+            target=_writer_loop, args=(weakref.ref(self), self._wakeup),
+            name="debuglib-writer", daemon=True,
+        )
+        self._writer.start()
+
+    def _writer_step(self) -> t.Optional[float]:
+        r"""
+        does the work of the writer-thread and returns how long it can sleep till the next step
+        """
+        wait = self._reconnect() if self._conn is None else None
+        with self._lock:
+            if self._spool and self._conn is not None:  # spooled while this thread connected
+                self._replay_spool()
+            if self._notices:
+                self._pending.extend(self._notices_due())
+                next_notice = self._next_notice()
+                if next_notice != float('inf'):
+                    wait = _earliest(wait, max(next_notice - time.monotonic(), 0.0))
+            self._write_pending()
+            if self._queue is not None:
+                due_in = self._queue.due_in()
+                if due_in is not None and due_in <= 0:
+                    self._drain_queue()
+                else:
+                    wait = _earliest(wait, due_in)
+                wait = _earliest(wait, self._report_drops())
+            if self._buffer is not None:
+                due_in = self._buffer.due_in()
+                if due_in is not None and due_in <= 0:
+                    self._flush_buffer()
+                    due_in = None
+                wait = _earliest(wait, due_in)
+        self._combine()
+        return wait
+
+    def _reconnect(self) -> t.Optional[float]:
+        r"""
+        connects if the next attempt is due and returns how long to wait till the next attempt
+        (runs without the lock so the other threads are not blocked while connecting)
+        """
+        if self._closed:
+            self._first_attempt_done()
+            return None
+        wait = self._next_connection_attempt - time.monotonic()
+        if wait > 0:
+            return wait
+        try:
+            connected = self.create_connection()
+        except BaseException:
+            self._first_attempt_done()
+            raise
+        if connected is None:
+            self._first_attempt_done()  # what was held back is spooled or dropped by _writer_step()
+            return max(self._next_connection_attempt - time.monotonic(), 0.0)
+        connection, encoder = connected
+        with self._lock:
+            self._first_attempt_done()
+            if self._conn is None and not self._closed:
+                # published together. the other threads only use the encoder while _conn is set
+                self._conn, self._encoder = connection, encoder
+                if self._spool:
+                    self._replay_spool()
+                return None
+        connection.close()
+        return None
 
-    def on_error(self, callback: T_CB_ON_ERROR):
-        self._on_error.append(callback)
-        return callback
+    def _first_attempt_done(self):
+        if self._connecting:
+            self._connecting = False
+            self._first_attempt.set()
 
-    def print_on_error(self, enable: bool = True):
-        self._print_on_error = enable
+    def _spool_messages(self, messages: t.List[Message]):
+        # the errors of the disk are handled like the ones of the connection (not raised into the application)
+        try:
+            self._spool.append(messages)
+        except (OSError, TypeError, ValueError) as error:  # e.g. the disk is full or a message isn't serializable
+            self._handle_error(error)
 
-    def _handle_error(self, error: Exception):
-        if self._print_on_error:
-            sys.stderr.write('\n'.join(format_exception(type(error), error, error.__traceback__)))
+    def _replay_spool(self):
+        # requires the lock and a connection. the spooled messages are older than everything that is pending
+        while self._conn is not None:
+            messages = self._spool.take()
+            if not messages:
+                break
+            self._send_messages(messages)  # spooled again if the connection is lost
+        if self._buffer is not None:
+            self._flush_buffer()
+        evicted = self._spool.evicted
+        if evicted != self._reported_evictions and self._conn is not None:
+            count = evicted - self._reported_evictions
+            self._reported_evictions = evicted
+            self._send_messages([self.build_message(
+                message=f"deleted {count} spooled message{'s' if count != 1 else ''} as the spool was full",
+                level="WARNING",
+            )])
 
-        for callback in self._on_error:
+    def _schedule_reconnect(self):
+        # requires the lock
+        self._closed = False
+        if self._writer is None:
+            self._start_writer()
+        else:
+            self._wakeup.set()
+
+    def _combine(self):
+        r"""
+        the thread that gets the lock writes the pending messages of all threads.
+        the others don't wait as their messages are written by the lock-holder.
+        a message that is added while the lock-holder is about to release the lock is picked up by this loop
+        """
+        pending = self._pending
+        while pending and self._lock.acquire(blocking=False):
             try:
-                callback(error)
-            except Exception as cb_err:
-                sys.stderr.write('\n'.join(format_exception(type(cb_err), cb_err, cb_err.__traceback__)))
+                self._write_pending()
+            finally:
+                self._lock.release()
 
-    def send(self, message: str,
-             *, level: t.Optional[str] = None, exception: t.Optional[BaseException] = None,
-             timestamp: float = None):
-        self._conn = conn = self._conn or self.create_connection()
-        if conn is None:
+    def _write_pending(self):
+        # requires the lock
+        pending = self._pending
+        messages = []
+        try:
+            for _ in range(len(pending)):
+                messages.append(pending.popleft())
+        except IndexError:  # pragma: no cover
+            pass
+        if messages:
+            self._send_messages(messages)
+
+    def _drain_queue(self):
+        # requires the lock
+        items = self._queue.take()
+        if not items:
+            return
+        if self._conn is None and self._spool is None:  # no need to build the messages if nobody receives them
+            self._forget_admitted(items)
             return
-        message = self.build_message(message=message, level=level, exception=exception, timestamp=timestamp)
-        body = self.format_message(message)
+        self._send_messages([
+            item if isinstance(item, dict) else self.build_message(*item)  # see send_message()
+            for item in items
+        ])
+
+    def _report_drops(self, force: bool = False) -> t.Optional[float]:
+        r"""
+        informs the server about dropped messages and returns the time till the next report is possible
+        """
+        # requires the lock
+        dropped = self._queue.dropped
+        if dropped == self._reported_drops:
+            return None
+        now = time.monotonic()
+        if not force and now < self._next_drop_report:
+            return self._next_drop_report - now
+        self._next_drop_report = now + self._drop_report_interval
+        count = dropped - self._reported_drops
+        self._reported_drops = dropped
+        self._send_messages([self.build_message(
+            message=f"dropped {count} message{'s' if count != 1 else ''} as the queue was full ({dropped} in total)",
+            level="WARNING",
+        )])
+        return None
+
+    def _send_messages(self, messages: t.List[Message]):
+        # requires the lock
+        if self._conn is None:  # dropped (or spooled). the writer-thread reconnects
+            if self._spool is not None:
+                self._spool_messages(messages)
+            return
+        frames = []
+        for message in messages:
+            try:
+                frames.append(self._encoder.encode(message))
+            except (OverflowError, TypeError, ValueError) as error:  # e.g. too big or not serializable
+                self._handle_error(error)
+        if self._buffer is not None:
+            self._buffer_frames(frames)
+        else:
+            self._write(frames)
+
+    def _buffer_frames(self, frames: t.List[bytes]):
+        # requires the lock
+        was_empty = not self._buffer
+        for frame in frames:
+            if self._buffer.append(frame):
+                self._flush_buffer()
+                if self._conn is None:  # the remaining frames were encoded for the lost connection
+                    return
+        if was_empty and self._buffer:
+            self._wakeup.set()  # so the writer-thread knows about the deadline
+
+    def _flush_buffer(self):
+        # requires the lock
+        frames = self._buffer.take()
+        if frames and self._conn is not None:
+            self._write(frames)
+
+    def _write(self, frames: t.List[bytes]):
+        # requires the lock and a connection. complete frames are written at once so they can't interleave
         try:
-            conn.sendall(body)
+            sendall_vectored(self._conn, frames)
         except socket.error:
+            self._disconnect()
+
+    def _disconnect(self):
+        # requires the lock
+        if self._conn is not None:
+            self._conn.close()
             self._conn = None
+            if not self._closed:  # the connection was lost
+                self._connection_failed()
+                self._schedule_reconnect()
+        self._encoder = None
+        if self._buffer is not None:
+            self._buffer.take()  # these frames were encoded for the old connection
 
-    @staticmethod
-    def build_message(
-            message: str,
-            level: t.Optional[str] = None,
-            exception: t.Optional[BaseException] = None,
-            timestamp: float = None,
-    ) -> Message:
-        level = (level or ("INFO" if exception is None else "ERROR"))[:3].upper()  # DEB|INF|WAR|ERR|CRI
-        return Message(
-            message=message,
-            level=level,
-            exception_info=dict(
-                type=type(exception).__name__,
-                value=str(exception),
-                traceback='\n'.join(format_traceback(exception.__traceback__)),
-            ) if isinstance(exception, BaseException) else None,
-            timestamp=time.time() if timestamp is None else timestamp,
-        )
+    def send(self, message: str,
+             *, level: t.Optional[str] = None, exception: t.Optional[BaseException] = None,
+             timestamp: float = None, origin: t.Optional[str] = None, limit: bool = True,
+             extra: t.Optional[dict] = None, args: t.Optional[t.Union[tuple, t.Mapping[str, t.Any]]] = None):
+        r"""
+        sends a message to the server (thread-safe)
+
+        the message is built by the calling thread and then handed over
+        to whichever thread currently writes to the connection
+
+        :param origin: where the message comes from (logger, function, ...). has its own rate-limit
+        :param limit: False if accepts() was already asked
+        :param extra: additional fields of the message (see _typing.Message)
+        :param args: the message is a %-template that is formatted together with the rest of the message
+        """
+        if limit and self._limiter is not None and not self.accepts(
+                level or ("ERROR" if exception is not None else None), origin):
+            return  # before anything is formatted
+        if self._notices:
+            if time.monotonic() >= self._next_notice():
+                self._pending.extend(self._notices_due())
+                self._wakeup.set()
+            # only once the message is going to be sent. otherwise the first occurrence would get lost
+            if exception is not None and self._dedup is not None and self._delivers():
+                extra = self._deduplicate(exception, level, extra)
+                if extra is None:  # repeated exception. only counted
+                    return
+        if self._queue is not None:
+            # formatting is done by the writer-thread
+            item = (message, level, exception, time.time() if timestamp is None else timestamp, extra, args)
+            if not self._queue.put(item):  # full
+                self._forget_admitted((item,))
+            return
+        if self._conn is None:  # no need to format the message if nobody receives it
+            if self._connecting:
+                self._hold_back(self.build_message(message, level, exception, timestamp, extra, args))
+                return
+            if self._closed:
+                with self._lock:
+                    self._schedule_reconnect()
+            if self._spool is not None:
+                self._spool_messages([self.build_message(message, level, exception, timestamp, extra, args)])
+            return
+        self._pending.append(self.build_message(message, level, exception, timestamp, extra, args))
+        self._combine()
 
-    @staticmethod
-    def format_message(message: Message) -> bytes:
-        body = json.dumps(message)
-        if isinstance(body, str):
-            body = body.encode()
-        return b'j' + len(body).to_bytes(2, byteorder='big', signed=False) + body
+    def _hold_back(self, message: Message):
+        r"""
+        keeps the message till the first connection-attempt is done (then the writer-thread writes the pending messages)
+        """
+        if len(self._pending) >= MAX_HELD_BACK:  # a burst. nothing is lost, but the sender has to wait
+            self._first_attempt.wait(self._first_attempt_timeout())
+        self._pending.append(message)
+        if not self._connecting:  # the attempt ended meanwhile. the writer-thread may have missed it
+            self._combine()
 
-    def create_connection(self) -> t.Optional[socket.socket]:
+    def send_message(self, message: Message):
         r"""
-        creates a connection and executes the handshake
+        sends an already built message (e.g. one that was received by a relay).
+        it's neither rate-limited nor deduplicated
+        """
+        if self._queue is not None:
+            self._queue.put(message)
+            return
+        if self._conn is None:
+            if self._connecting:
+                self._hold_back(message)
+                return
+            if self._closed:
+                with self._lock:
+                    self._schedule_reconnect()
+            if self._spool is not None:
+                self._spool_messages([message])
+            return
+        self._pending.append(message)
+        self._combine()
+
+    def create_connection(self) -> t.Optional[t.Tuple[t.Any, Encoder]]:
+        r"""
+        creates a connection and executes the handshake. returns the connection and its encoder
         if the server cannot be found or rejects the connection this function returns None
         """
-        now = time.time()
-        if now < self._next_connection_attempt:
+        if time.monotonic() < self._next_connection_attempt:
             return None
         try:
-            self._next_connection_attempt = now + self._connection_attempt_delta
-            sock = socket.create_connection(self._server_info, timeout=self._timeout)
-            version = DEBUGLIB_VERSION.encode()
-            version_bytes = len(version).to_bytes(1, byteorder='big', signed=False) + version
-            handshake = b'DEBUGLIB\0' + version_bytes + b'\0'
-            sock.sendall(handshake)
-            if sock.recv(1) != b'1':
-                self._handle_error(PermissionError("connection was refused"))
-                sock.close()
-                return None
-            return sock
-        except (socket.error, socket.timeout, TimeoutError) as error:
+            connected = self._open_connection()
+        except (socket.error, socket.timeout, TimeoutError) as error:  # incl. PermissionError of a refusal
+            self._connection_failed()
             self._handle_error(error)
             return None
+        self._connection_succeeded()
+        return connected
+
+
+def _earliest(a: t.Optional[float], b: t.Optional[float]) -> t.Optional[float]:
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _writer_loop(client_ref: "weakref.ReferenceType[DebugClient]", wakeup: threading.Event):
+    # only holds a weak reference so the client can still be garbage-collected
+    while True:
+        client = client_ref()
+        if client is None:
+            return
+        try:
+            wait = client._writer_step()
+        except Exception as error:
+            client._handle_error(error)
+            # keeps the timer of the reconnects (instead of sleeping till the next send())
+            wait = max(client._next_connection_attempt - time.monotonic(), client._connection_attempt_delta)
+        del client
+        wakeup.wait(wait)
+        wakeup.clear()
+
+
+_clients: "weakref.WeakSet[DebugClient]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_clients():
+    # the writer-threads are daemons and die with the interpreter
+    for client in list(_clients):
+        try:
+            client.flush()
+        except Exception:  # noqa
+            pass
@@ -0,0 +1,263 @@
+# -*- coding=utf-8 -*-
+r"""
+configuration and error-handling shared by the sync and the async client
+"""
+import os
+import sys
+import time
+import random
+import weakref
+import typing as t
+from ..._packages import json, format_exception
+from ..._typing import DEFAULT_VALUE, ServerInfo, ServerInfoRaw, Message
+from ..common import (
+    extract_server_info, get_transport, Transport, build_handshake, build_process_id, recv_exactly, Encoder,
+    HANDSHAKE_ACCEPTED, CLIENT_FEATURES, FEATURE_PROCESS_ID,
+)
+from ..common.exception import CaptureOptions, capture_exception
+from ._dedup import Deduplicator, Repeat
+from ._limit import RateLimiter, normalize_level, format_suppressed, suppression_key
+
+
+T_CB_ON_ERROR = t.Callable[[Exception], None]
+
+
+class BaseClient:
+    _server_info: ServerInfo
+    _transport: Transport
+    _address: t.Any
+    _timeout: t.Optional[float]
+    _on_error: t.List[T_CB_ON_ERROR]
+    _print_on_error: bool
+    _connect_timeout: t.Optional[float]
+    _connection_attempt_delta: float
+    _max_connection_attempt_delta: float
+    _failed_connection_attempts: int
+    _next_connection_attempt: float  # time.monotonic()
+    _capture_options: CaptureOptions
+    _dedup: t.Optional[Deduplicator]
+    _limiter: t.Optional[RateLimiter]
+    _notices: bool  # deduplication or rate-limiting sends additional messages
+
+    def __init__(self, *, server_info: ServerInfoRaw = DEFAULT_VALUE, timeout: float = DEFAULT_VALUE,
+                 connect_timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
+                 max_connection_attempt_delta: float = DEFAULT_VALUE,
+                 capture_locals: bool = DEFAULT_VALUE, max_frames: int = DEFAULT_VALUE,
+                 max_repr_length: int = DEFAULT_VALUE,
+                 deduplicate: bool = DEFAULT_VALUE, deduplicate_window: float = DEFAULT_VALUE,
+                 rate_limit: t.Union[float, t.Mapping[str, float]] = DEFAULT_VALUE, rate_burst: float = DEFAULT_VALUE,
+                 sample_rate: float = DEFAULT_VALUE):
+        self._server_info = extract_server_info(server_info)
+        self._transport, self._address = get_transport(self._server_info)
+        self._timeout = None if timeout is DEFAULT_VALUE else timeout
+        if connect_timeout is DEFAULT_VALUE:
+            connect_timeout = 1.0 if self._timeout is None else self._timeout
+        self._connect_timeout = connect_timeout
+        self._connection_attempt_delta = 0.1 if connection_attempt_delta is DEFAULT_VALUE else connection_attempt_delta
+        self._max_connection_attempt_delta = \
+            30.0 if max_connection_attempt_delta is DEFAULT_VALUE else max_connection_attempt_delta
+        self._failed_connection_attempts = 0
+        self._next_connection_attempt = 0.0
+        defaults = CaptureOptions()
+        self._capture_options = CaptureOptions(
+            max_frames=defaults.max_frames if max_frames is DEFAULT_VALUE else max_frames,
+            capture_locals=defaults.capture_locals if capture_locals is DEFAULT_VALUE else capture_locals,
+            max_repr_length=defaults.max_repr_length if max_repr_length is DEFAULT_VALUE else max_repr_length,
+        )
+        self._dedup = Deduplicator(
+            window=5.0 if deduplicate_window is DEFAULT_VALUE else deduplicate_window,
+        ) if deduplicate is not DEFAULT_VALUE and deduplicate else None  # opt-in: repeats are only counted
+        rate_limit = None if rate_limit is DEFAULT_VALUE else rate_limit
+        sample_rate = 1.0 if sample_rate is DEFAULT_VALUE else sample_rate
+        self._limiter = RateLimiter(
+            rate=rate_limit, burst=None if rate_burst is DEFAULT_VALUE else rate_burst, sample_rate=sample_rate,
+        ) if rate_limit is not None or sample_rate < 1.0 else None
+        self._notices = self._dedup is not None or self._limiter is not None
+        self._print_on_error = False
+        self._on_error = []
+        _instances.add(self)
+
+    def _after_fork(self):
+        r"""
+        called in the child-process after os.fork(). the connection belongs to the parent
+        """
+        self._failed_connection_attempts = 0
+        self._next_connection_attempt = 0.0
+        if self._dedup is not None:
+            self._dedup._after_fork()
+        if self._limiter is not None:
+            self._limiter._after_fork()
+
+    def _connection_failed(self):
+        r"""
+        exponential backoff (with jitter so many clients don't retry at the same time)
+        """
+        self._failed_connection_attempts += 1
+        exponent = min(self._failed_connection_attempts - 1, 32)
+        delay = min(self._connection_attempt_delta * 2 ** exponent, self._max_connection_attempt_delta)
+        self._next_connection_attempt = time.monotonic() + random.uniform(delay / 2, delay)
+
+    def _connection_succeeded(self):
+        self._failed_connection_attempts = 0
+        self._next_connection_attempt = 0.0
+
+    def _open_connection(self) -> t.Tuple[t.Any, Encoder]:
+        r"""
+        connects and executes the handshake (blocking). returns the connection and its encoder
+        raises OSError (PermissionError if the server refuses the connection)
+        """
+        sock = self._transport.connect(self._address, timeout=self._connect_timeout)
+        try:
+            sock.sendall(build_handshake(CLIENT_FEATURES + self._transport.client_features))
+            if recv_exactly(sock, 1) != HANDSHAKE_ACCEPTED:
+                raise PermissionError("connection was refused")
+            features_length = int.from_bytes(recv_exactly(sock, 1), byteorder='big', signed=False)
+            features = recv_exactly(sock, features_length)
+            if FEATURE_PROCESS_ID in features:
+                sock.sendall(build_process_id())
+            sock.settimeout(self._timeout)
+            connection = self._transport.activate(sock, features, timeout=self._timeout)
+        except BaseException:
+            sock.close()
+            raise
+        return connection, Encoder(features=features)
+
+    def on_error(self, callback: T_CB_ON_ERROR):
+        self._on_error.append(callback)
+        return callback
+
+    def print_on_error(self, enable: bool = True):
+        self._print_on_error = enable
+
+    def _handle_error(self, error: Exception):
+        if self._print_on_error:
+            sys.stderr.write('\n'.join(format_exception(type(error), error, error.__traceback__)))
+
+        for callback in self._on_error:
+            try:
+                callback(error)
+            except Exception as cb_err:
+                sys.stderr.write('\n'.join(format_exception(type(cb_err), cb_err, cb_err.__traceback__)))
+
+    def build_message(
+            self,
+            message: str,
+            level: t.Optional[str] = None,
+            exception: t.Optional[BaseException] = None,
+            timestamp: float = None,
+            extra: t.Optional[dict] = None,
+            args: t.Optional[t.Union[tuple, t.Mapping[str, t.Any]]] = None,
+    ) -> Message:
+        r"""
+        the traceback of the exception is only captured (see common/exception.py). the receiver formats it
+
+        :param args: the message is a %-template (like logging) that is formatted here
+        """
+        if args or not isinstance(message, str):  # e.g. logging.info(some_object)
+            message = format_args(message, args)
+        level = (level or ("INFO" if exception is None else "ERROR"))[:3].upper()  # DEB|INF|WAR|ERR|CRI
+        built = Message(
+            message=message,
+            level=level,
+            exception_info=capture_exception(exception, self._capture_options)
+            if isinstance(exception, BaseException) else None,
+            timestamp=time.time() if timestamp is None else timestamp,
+        )
+        if extra:
+            built.update(extra)
+        return built
+
+    def accepts(self, level: t.Optional[str] = None, origin: t.Optional[str] = None) -> bool:
+        r"""
+        whether a message would pass the rate-limiting and sampling. ask before the message is formatted
+        (this already counts as the attempt. so send it with send(..., limit=False) afterwards)
+
+        :param level: level of the message (INFO by default)
+        :param origin: where the message comes from (e.g. name of the logger or function)
+        """
+        return self._limiter is None or self._limiter.admit(normalize_level(level or "INFO"), origin)
+
+    def _deduplicate(self, exception: BaseException, level: t.Optional[str],
+                     extra: t.Optional[dict] = None) -> t.Optional[dict]:
+        r"""
+        returns None if the exception is a repeat (then it's only counted) or the extra-fields for the message
+        """
+        fingerprint = self._dedup.admit(exception, level or "ERROR", time.monotonic())
+        return None if fingerprint is None else dict(extra or (), fingerprint=fingerprint)
+
+    def _forget_admitted(self, items: t.Iterable):
+        r"""
+        the queued items (message, level, exception, timestamp, extra, args) weren't sent after all.
+        so the next occurrences of their exceptions have to be sent in full
+        """
+        if self._dedup is None:
+            return
+        for item in items:
+            if isinstance(item, tuple) and item[2] is not None and item[4] and 'fingerprint' in item[4]:
+                self._dedup.forget(item[2])
+
+    def _next_notice(self) -> float:
+        r"""
+        time.monotonic() when _notices_due() has something to send
+        """
+        return min(
+            self._dedup.next_due if self._dedup is not None else float('inf'),
+            self._limiter.next_due if self._limiter is not None else float('inf'),
+        )
+
+    def _notices_due(self, everything: bool = False) -> t.List[Message]:
+        r"""
+        messages with the repeat-counts and suppressed messages whose time has come
+        """
+        now = time.monotonic()
+        notices = []
+        if self._dedup is not None:
+            notices.extend(self._build_repeat(repeat) for repeat in self._dedup.take_due(now, everything))
+        if self._limiter is not None:
+            suppressed = self._limiter.take_suppressed(now, everything)
+            if suppressed:
+                notices.append(self.build_message(
+                    message=format_suppressed(suppressed), level="WARNING",
+                    extra=dict(suppressed={
+                        suppression_key(level, origin): count for (level, origin), count in suppressed.items()
+                    }),
+                ))
+        return notices
+
+    def _build_repeat(self, repeat: Repeat) -> Message:
+        extra = dict(fingerprint=repeat.fingerprint, repeats=repeat.repeats)
+        if repeat.values:  # the repeats weren't all the same (e.g. another id)
+            extra['values'] = repeat.values
+        return self.build_message(message=repeat.summary, level=repeat.level, extra=extra)
+
+    @staticmethod
+    def format_message(message: Message) -> bytes:
+        body = json.dumps(message)
+        if isinstance(body, str):
+            body = body.encode()
+        return b'j' + len(body).to_bytes(2, byteorder='big', signed=False) + body
+
+
+def format_args(template: t.Any, args: t.Optional[t.Union[tuple, t.Mapping[str, t.Any]]]) -> str:
+    r"""
+    like logging.LogRecord.getMessage(). a broken template doesn't lose the message
+    """
+    try:
+        return str(template) % args if args else str(template)
+    except Exception as error:
+        return f"{template} % {args!r} ({type(error).__name__}: {error})"
+
+
+_instances: "weakref.WeakSet[BaseClient]" = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for client in list(_instances):
+        try:
+            client._after_fork()
+        except Exception as error:  # noqa
+            client._handle_error(error)
+
+
+if hasattr(os, 'register_at_fork'):  # not on windows
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,82 @@
+# -*- coding=utf-8 -*-
+r"""
+write-buffer to coalesce multiple frames into one write-call
+"""
+import os
+import time
+import socket
+import typing as t
+
+
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+
+class WriteBuffer:
+    r"""
+    collects encoded frames till one of the limits (bytes, messages, time) is reached
+    """
+    frames: t.List[bytes]
+    size: int
+    deadline: float
+
+    def __init__(self, max_size: int, max_count: int, max_delay: float):
+        self.max_size = max_size
+        self.max_count = max_count
+        self.max_delay = max_delay
+        self.frames = []
+        self.size = 0
+        self.deadline = 0.0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, frame: bytes) -> bool:
+        r"""
+        adds a frame to the buffer and returns whether the buffer should be flushed now
+        """
+        if not self.frames:
+            self.deadline = time.monotonic() + self.max_delay
+        self.frames.append(frame)
+        self.size += len(frame)
+        return self.size >= self.max_size or len(self.frames) >= self.max_count
+
+    def due_in(self) -> t.Optional[float]:
+        r"""
+        seconds till the buffer has to be flushed (None if the buffer is empty)
+        """
+        if not self.frames:
+            return None
+        return self.deadline - time.monotonic()
+
+    def take(self) -> t.List[bytes]:
+        frames = self.frames
+        self.frames = []
+        self.size = 0
+        return frames
+
+
+def sendall_vectored(sock: socket.socket, buffers: t.List[bytes]) -> None:
+    r"""
+    like socket.sendall() but for multiple buffers with scatter-gather (sendmsg) if the platform supports it
+    """
+    if not hasattr(sock, 'sendmsg'):  # e.g. windows
+        sock.sendall(b''.join(buffers))
+        return
+    views = [memoryview(buffer) for buffer in buffers]
+    index = 0
+    while index < len(views):
+        sent = sock.sendmsg(views[index:index + IOV_MAX])
+        # skip everything that was fully sent and cut the partially sent buffer
+        while sent:
+            remaining = len(views[index])
+            if sent >= remaining:
+                sent -= remaining
+                index += 1
+            else:
+                views[index] = views[index][sent:]
+                sent = 0
@@ -0,0 +1,151 @@
+# -*- coding=utf-8 -*-
+r"""
+deduplication of repeated exceptions (e.g. a loop that fails again and again)
+
+fingerprint = type of the exception + the code-locations of its traceback
+
+- the first occurrence is sent in full (with the fingerprint)
+- further occurrences within `window` seconds are only counted
+- once the window is over the count is sent as one message ({'fingerprint': ..., 'repeats': N})
+  with the values of the repeats that differ from the sent one ({'values': [...]}, at most MAX_VALUES)
+"""
+import threading
+import collections
+import typing as t
+
+
+MAX_VALUES = 5  # distinct values of the repeats per report
+MAX_VALUE_LENGTH = 200
+
+
+class _Entry:
+    __slots__ = ('fingerprint', 'sent_at', 'repeats', 'level', 'summary', 'value', 'values')
+
+    def __init__(self, fingerprint: str, sent_at: float, level: str, value: str, summary: str):
+        self.fingerprint = fingerprint
+        self.sent_at = sent_at
+        self.repeats = 0
+        self.level = level
+        self.value = value  # of the sent exception
+        self.summary = summary  # type: value
+        self.values: t.List[str] = []  # of the counted repeats if they differ from the sent one
+
+    def count(self, value: str):
+        self.repeats += 1
+        if value != self.value and value not in self.values and len(self.values) < MAX_VALUES:
+            self.values.append(value)
+
+    def take(self) -> "Repeat":
+        repeat = Repeat(self.fingerprint, self.repeats, self.level, self.summary, self.values)
+        self.repeats = 0
+        self.values = []
+        return repeat
+
+
+class Repeat(t.NamedTuple):
+    fingerprint: str
+    repeats: int
+    level: str
+    summary: str
+    values: t.List[str]  # the differing values (e.g. other ids in the same failing line)
+
+
+class Deduplicator:
+    next_due: float  # time.monotonic() when the next repeat-count has to be sent
+
+    def __init__(self, window: float = 5.0, capacity: int = 1024):
+        self.window = window
+        self.capacity = capacity
+        self.next_due = float('inf')
+        self._lock = threading.Lock()
+        self._entries: t.OrderedDict[tuple, _Entry] = collections.OrderedDict()  # least recently used first
+        self._evicted: t.List[Repeat] = []  # counts of entries that were removed from the cache
+
+    @staticmethod
+    def key(exception: BaseException) -> tuple:
+        locations = []
+        tb = exception.__traceback__
+        while tb is not None:
+            locations.append((tb.tb_frame.f_code, tb.tb_lineno))
+            tb = tb.tb_next
+        return type(exception), tuple(locations)
+
+    def admit(self, exception: BaseException, level: str, now: float) -> t.Optional[str]:
+        r"""
+        returns the fingerprint if the exception has to be sent or None if it was only counted
+        """
+        key = self.key(exception)
+        value = self.value(exception)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if now - entry.sent_at < self.window:
+                    entry.count(value)
+                    if entry.repeats == 1:
+                        self.next_due = min(self.next_due, entry.sent_at + self.window)
+                    return None
+                if entry.repeats:  # normally already taken by take_due()
+                    self._evicted.append(entry.take())
+                    self.next_due = now
+                entry.sent_at = now
+                entry.value = value
+                entry.summary = f"{type(exception).__name__}: {value}"
+                return entry.fingerprint
+            fingerprint = f"{hash(key) & 0xFFFFFFFFFFFF:012x}"
+            self._entries[key] = _Entry(
+                fingerprint=fingerprint, sent_at=now, level=level, value=value,
+                summary=f"{type(exception).__name__}: {value}",
+            )
+            if len(self._entries) > self.capacity:
+                _, evicted = self._entries.popitem(last=False)
+                if evicted.repeats:  # keep the count. it's sent with the next take_due()
+                    self._evicted.append(evicted.take())
+                    self.next_due = now
+            return fingerprint
+
+    @staticmethod
+    def value(exception: BaseException) -> str:
+        try:
+            value = str(exception)
+        except Exception as error:  # a broken __str__ mustn't break the client
+            value = f"<unprintable {type(exception).__name__} ({type(error).__name__})>"
+        return value if len(value) <= MAX_VALUE_LENGTH else value[:MAX_VALUE_LENGTH - 3] + "..."
+
+    def forget(self, exception: BaseException):
+        r"""
+        removes the entry of an admitted exception that wasn't sent after all (e.g. the queue was full).
+        so the next occurrence is sent in full. repeats that were counted meanwhile are still reported
+        """
+        key = self.key(exception)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry.repeats:
+                self._evicted.append(entry.take())
+                self.next_due = 0.0
+
+    def take_due(self, now: float, everything: bool = False) -> t.List[Repeat]:
+        r"""
+        returns (and resets) the repeat-counts whose window is over
+        """
+        with self._lock:
+            if not everything and now < self.next_due:
+                return []
+            repeats, self._evicted = self._evicted, []
+            next_due = float('inf')
+            for entry in self._entries.values():
+                if not entry.repeats:
+                    continue
+                due = entry.sent_at + self.window
+                if everything or due <= now:
+                    repeats.append(entry.take())
+                else:
+                    next_due = min(next_due, due)
+            self.next_due = next_due
+            return repeats
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._entries.clear()
+        self._evicted = []
+        self.next_due = float('inf')
@@ -0,0 +1,124 @@
+# -*- coding=utf-8 -*-
+r"""
+rate-limiting and sampling of the messages (decided before anything is formatted)
+
+- every (level, origin) has its own token-bucket. origin is e.g. the name of the logger or the monitored function
+- `rate` is the number of messages per second (one for all levels or per level) and `burst` the size of the bucket
+- sampling keeps only `sample_rate` (0..1) of the messages that passed the bucket
+- ERROR and CRITICAL are always sent
+- the number of suppressed messages is sent every `summary_interval` seconds
+"""
+import time
+import random
+import threading
+import collections
+import typing as t
+
+
+ALWAYS_SENT = frozenset(("ERR", "CRI"))
+
+
+def normalize_level(level: str) -> str:
+    return level[:3].upper()  # DEB|INF|WAR|ERR|CRI
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    next_due: float  # time.monotonic() when the summary of suppressed messages has to be sent
+
+    def __init__(self, rate: t.Union[None, float, t.Mapping[str, float]] = None, burst: float = None,
+                 sample_rate: float = 1.0, summary_interval: float = 10.0, max_buckets: int = 1024):
+        if isinstance(rate, t.Mapping):
+            self._rates: t.Dict[str, t.Optional[float]] = {normalize_level(lvl): value for lvl, value in rate.items()}
+            self._default_rate = None  # levels without a rate aren't limited
+        else:
+            self._rates = {}
+            self._default_rate = rate
+        self.burst = burst
+        self.sample_rate = sample_rate
+        self.summary_interval = summary_interval
+        self.max_buckets = max_buckets
+        self.next_due = float('inf')
+        self._lock = threading.Lock()
+        self._buckets: t.OrderedDict[t.Tuple[str, t.Optional[str]], _Bucket] = collections.OrderedDict()
+        self._suppressed: t.Counter[t.Tuple[str, t.Optional[str]]] = collections.Counter()
+
+    def admit(self, level: str, origin: t.Optional[str] = None) -> bool:
+        r"""
+        returns whether the message should be sent. level has to be normalized (see normalize_level())
+        """
+        if level in ALWAYS_SENT:
+            return True
+        rate = self._rates.get(level, self._default_rate)
+        if rate is None and self.sample_rate >= 1.0:
+            return True
+        key = (level, origin)
+        with self._lock:
+            if rate is not None and not self._take_token(key, rate):
+                self._suppress(key)
+                return False
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                self._suppress(key)
+                return False
+            return True
+
+    def take_suppressed(self, now: float, everything: bool = False) -> t.Dict[t.Tuple[str, t.Optional[str]], int]:
+        r"""
+        returns (and resets) the numbers of suppressed messages if the summary is due
+        """
+        with self._lock:
+            if not self._suppressed or (not everything and now < self.next_due):
+                return {}
+            suppressed, self._suppressed = dict(self._suppressed), collections.Counter()
+            self.next_due = float('inf')
+            return suppressed
+
+    def _take_token(self, key: t.Tuple[str, t.Optional[str]], rate: float) -> bool:
+        # requires the lock
+        now = time.monotonic()
+        burst = max(rate, 1.0) if self.burst is None else self.burst
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(tokens=burst, updated=now)
+            if len(self._buckets) > self.max_buckets:  # a forgotten bucket is full again anyway
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens < 1.0:
+            return False
+        bucket.tokens -= 1.0
+        return True
+
+    def _suppress(self, key: t.Tuple[str, t.Optional[str]]):
+        # requires the lock
+        if not self._suppressed:
+            self.next_due = time.monotonic() + self.summary_interval
+        self._suppressed[key] += 1
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._buckets.clear()
+        self._suppressed.clear()
+        self.next_due = float('inf')
+
+
+def format_suppressed(suppressed: t.Mapping[t.Tuple[str, t.Optional[str]], int]) -> str:
+    total = sum(suppressed.values())
+    ranked = sorted(suppressed.items(), key=lambda item: -item[1])
+    parts = ', '.join(f"{suppression_key(level, origin)}: {count}" for (level, origin), count in ranked[:10])
+    if len(ranked) > 10:
+        parts += ", ..."
+    return f"suppressed {total} message{'s' if total != 1 else ''} (rate-limit/sampling): {parts}"
+
+
+def suppression_key(level: str, origin: t.Optional[str]) -> str:
+    return f"{level}/{origin}" if origin else level
@@ -0,0 +1,111 @@
+# -*- coding=utf-8 -*-
+r"""
+bounded buffer between the sending threads and the writer-thread
+"""
+import time
+import threading
+import collections
+import typing as t
+
+
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_BLOCK = "block"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK)
+
+
+class RingBuffer:
+    r"""
+    fixed-capacity buffer with one consumer
+
+    - drop-newest: new items are discarded while the buffer is full
+    - drop-oldest: the oldest item is discarded to make room for the new one
+    - block: waits (up to block_timeout seconds) for free space and discards the new item otherwise
+
+    the number of discarded items is counted in `dropped`.
+    the producers share a small lock. so the capacity and the counter are exact (also without the GIL)
+
+    the consumer isn't woken for every item. only for the first one (to know the deadline, see due_in())
+    and once `wakeup_size` items are waiting. so it takes them in batches
+    """
+    dropped: int
+    since: float  # time.monotonic() of the first item after the buffer was empty
+
+    def __init__(self, capacity: int, overflow: str = OVERFLOW_DROP_NEWEST,
+                 block_timeout: t.Optional[float] = None, wakeup: threading.Event = None,
+                 delay: float = 0.0, wakeup_size: int = 1):
+        if capacity <= 0:
+            raise ValueError("capacity has to be positive")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow!r} (allowed: {', '.join(OVERFLOW_POLICIES)})")
+        self.capacity = capacity
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.delay = delay
+        self.wakeup_size = wakeup_size
+        self.since = 0.0
+        # deque.popleft() is atomic. so the consumer doesn't need the lock of the producers
+        self._items = collections.deque(maxlen=capacity if overflow == OVERFLOW_DROP_OLDEST else None)
+        self._wakeup = threading.Event() if wakeup is None else wakeup
+        self._space = threading.Condition(threading.Lock())  # also the lock of the producers
+
+    def __len__(self):
+        return len(self._items)
+
+    def _after_fork(self, wakeup: threading.Event = None):
+        # the items belong to the parent-process and the condition could have been held by one of its threads
+        self._items.clear()
+        self._wakeup = threading.Event() if wakeup is None else wakeup
+        self._space = threading.Condition(threading.Lock())
+
+    def put(self, item) -> bool:
+        r"""
+        adds an item and returns whether it was accepted
+        """
+        items = self._items
+        with self._space:  # the check of the capacity, the append and the counter belong together
+            if len(items) >= self.capacity:
+                if self.overflow == OVERFLOW_DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                elif self.overflow == OVERFLOW_DROP_OLDEST:
+                    self.dropped += 1  # the deque discards the oldest item on its own
+                elif not self._space.wait_for(lambda: len(items) < self.capacity, timeout=self.block_timeout):
+                    self.dropped += 1
+                    return False
+            items.append(item)
+            size = len(items)
+            if size == 1:
+                self.since = time.monotonic()
+        if size == 1 or size >= self.wakeup_size:
+            if not self._wakeup.is_set():
+                self._wakeup.set()
+        return True
+
+    def due_in(self) -> t.Optional[float]:
+        r"""
+        seconds till the items should be taken (None if the buffer is empty)
+        """
+        size = len(self._items)
+        if not size:
+            return None
+        if size >= self.wakeup_size:
+            return 0.0
+        return self.since + self.delay - time.monotonic()
+
+    def take(self) -> list:
+        r"""
+        removes and returns all items that are currently in the buffer (oldest first)
+        """
+        items = self._items
+        taken = []
+        try:
+            for _ in range(len(items)):
+                taken.append(items.popleft())
+        except IndexError:  # pragma: no cover
+            pass
+        if taken and self.overflow == OVERFLOW_BLOCK:
+            with self._space:
+                self._space.notify_all()
+        return taken
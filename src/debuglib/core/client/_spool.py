@@ -0,0 +1,354 @@
+# -*- coding=utf-8 -*-
+r"""
+messages that were sent while there was no connection. they are replayed after the next handshake
+
+the spool is a directory with append-only segment-files and one lock-file per spool (owner)
+{owner}.lock
+    locked (flock. msvcrt.locking on windows) as long as the owner exists
+{owner}-{sequence}.spool
+    {len:4}{json-body}...  (json as the encoding of the connection isn't known yet)
+
+- a new segment is started once the current one reaches `segment_size` bytes
+- the segments of all processes in the directory together are limited to `max_size` bytes.
+  the own oldest segments are deleted first. if the segments of the others already fill it new messages are dropped
+- segments whose owner doesn't hold its lock anymore are taken over (e.g. the crash of the last run).
+  the lock instead of the pid as pids are reused (e.g. every container starts with the same ones)
+"""
+import os
+import time
+import struct
+import secrets
+import threading
+import tempfile
+import typing as t
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+from ..._typing import Message
+from ..common.codec import encode_json, decode_json
+
+
+_LENGTH = struct.Struct('>I')
+_O_BINARY = getattr(os, 'O_BINARY', 0)  # windows
+SUFFIX = ".spool"
+LOCK_SUFFIX = ".lock"
+BUFFER_SIZE = 64 * 1024
+FULL_CHECK_INTERVAL = 1.0  # seconds between checks whether the others freed space (while the spool is full)
+
+
+def default_spool_directory() -> str:
+    return os.path.join(tempfile.gettempdir(), "debuglib-spool")
+
+
+class _Segment(t.NamedTuple):
+    path: str
+    size: int
+    count: int
+
+
+class Spool:
+    r"""
+    thread-safe. appending is buffered. flush() writes the buffer to the file
+    (own buffer instead of a buffered file so a forked child can't write the buffer of the parent a second time)
+    """
+    evicted: int  # messages that were deleted (or not spooled) because of max_size
+
+    def __init__(self, directory: str = None, max_size: int = 16 * 1024 * 1024, segment_size: int = 1024 * 1024):
+        if segment_size <= 0 or max_size < segment_size:
+            raise ValueError("max_size has to be at least segment_size")
+        self.directory = default_spool_directory() if directory is None else directory
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._segments: t.List[_Segment] = []  # closed segments (oldest first)
+        self._fd: t.Optional[int] = None
+        self._pending = bytearray()  # not yet written to the file
+        self._current: t.Optional[_Segment] = None
+        self._sequence = 0
+        self._full_until: t.Optional[float] = None  # time.monotonic() of the next check while the spool is full
+        os.makedirs(self.directory, exist_ok=True)
+        self._owner, self._lock_fd = _create_owner(self.directory)
+        self._adopt_orphans()
+        self._evict()
+
+    def __del__(self):
+        # the segments that are left can then be taken over
+        lock_fd, self._lock_fd = getattr(self, '_lock_fd', None), None
+        if lock_fd is not None:
+            os.close(lock_fd)
+            _remove(os.path.join(self.directory, self._owner + LOCK_SUFFIX))
+
+    def __len__(self):
+        r"""
+        number of spooled messages
+        """
+        return sum(segment.count for segment in self._segments) + (self._current.count if self._current else 0)
+
+    def __bool__(self):
+        return bool(self._segments) or self._current is not None
+
+    def append(self, messages: t.Iterable[Message]):
+        r"""
+        raises OSError if the disk fails. TypeError or ValueError of a message that isn't serializable
+        (after the others were appended)
+        """
+        error = None
+        with self._lock:
+            for message in messages:
+                if self._full_until is not None and not self._has_space():
+                    self.evicted += 1
+                    continue
+                try:
+                    body = encode_json(message)
+                except (TypeError, ValueError) as exc:
+                    error = exc
+                    continue
+                if self._current is None:
+                    self._open_segment()
+                self._pending += _LENGTH.pack(len(body))
+                self._pending += body
+                if len(self._pending) >= BUFFER_SIZE:
+                    self._write_pending()
+                path, size, count = self._current
+                self._current = _Segment(path, size + _LENGTH.size + len(body), count + 1)
+                if self._current.size >= self.segment_size:
+                    self._close_segment()
+                    self._evict()
+        if error is not None:
+            raise error
+
+    def flush(self):
+        with self._lock:
+            self._write_pending()
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def take(self) -> t.List[Message]:
+        r"""
+        removes the oldest segment and returns its messages
+        """
+        with self._lock:
+            if not self._segments:
+                self._close_segment()
+            if not self._segments:
+                return []
+            segment = self._segments.pop(0)
+        messages = list(_read_segment(segment.path))
+        _remove(segment.path)
+        return messages
+
+    def _after_fork(self):
+        # the segments belong to the parent-process
+        self._lock = threading.Lock()
+        self._segments = []
+        if self._fd is not None:
+            os.close(self._fd)  # only the file-descriptor of the child
+        self._fd = None
+        self._pending = bytearray()
+        self._current = None
+        self._sequence = 0
+        self._full_until = None
+        self.evicted = 0
+        os.close(self._lock_fd)  # the lock stays with the parent
+        self._owner, self._lock_fd = _create_owner(self.directory)
+
+    def _next_path(self) -> str:
+        self._sequence += 1
+        return os.path.join(self.directory, f"{self._owner}-{self._sequence:08d}{SUFFIX}")
+
+    def _open_segment(self):
+        # requires the lock
+        while True:
+            path = self._next_path()
+            try:
+                self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND | _O_BINARY, 0o600)
+            except FileExistsError:  # pragma: no cover (the owner is unique)
+                continue
+            self._current = _Segment(path, 0, 0)
+            return
+
+    def _close_segment(self):
+        # requires the lock
+        if self._fd is None:
+            return
+        self._write_pending()
+        os.close(self._fd)
+        self._fd = None
+        if self._current.count:
+            self._segments.append(self._current)
+        else:
+            _remove(self._current.path)
+        self._current = None
+
+    def _write_pending(self):
+        # requires the lock
+        if self._fd is None or not self._pending:
+            return
+        view = memoryview(self._pending)
+        while view:
+            view = view[os.write(self._fd, view):]
+        view.release()
+        self._pending.clear()
+
+    def _evict(self):
+        # requires the lock and that there is no current segment.
+        # deletes the own oldest segments till the next segment fits into the directory (incl. the segments of others)
+        total = sum(segment.size for segment in self._segments) + self._size_of_others()
+        while total + self.segment_size > self.max_size and self._segments:
+            segment = self._segments.pop(0)
+            total -= segment.size
+            self.evicted += segment.count
+            _remove(segment.path)
+        full = total + self.segment_size > self.max_size  # the others fill the directory
+        self._full_until = time.monotonic() + FULL_CHECK_INTERVAL if full else None
+
+    def _has_space(self) -> bool:
+        # requires the lock. called while the spool is full
+        if self._current is not None:  # opened before it was full
+            return True
+        if time.monotonic() >= self._full_until:  # the others may have sent or deleted their segments
+            self._evict()
+        return self._full_until is None
+
+    def _size_of_others(self) -> int:
+        # segments of the other processes (and the own ones that aren't tracked. e.g. of a parent-process)
+        own = {segment.path for segment in self._segments}
+        if self._current is not None:
+            own.add(self._current.path)
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(SUFFIX) and path not in own:
+                try:
+                    total += os.stat(path).st_size
+                except FileNotFoundError:  # taken meanwhile
+                    pass
+        return total
+
+    def _adopt_orphans(self):
+        # takes over the segments whose owner doesn't exist anymore (rename is atomic. so only one process gets it)
+        names = os.listdir(self.directory)
+        owners = {name[:-len(LOCK_SUFFIX)] for name in names if name.endswith(LOCK_SUFFIX)}
+        released = []  # lock-files of owners that don't exist anymore (locked by this process meanwhile)
+        orphans = []
+        try:
+            for owner in owners:
+                if owner == self._owner:
+                    continue
+                fd = _try_lock(os.path.join(self.directory, owner + LOCK_SUFFIX))
+                if fd is not None:
+                    released.append((owner, fd))
+            released_owners = {owner for owner, _ in released}
+            for name in names:
+                if not name.endswith(SUFFIX):
+                    continue
+                owner = name[:-len(SUFFIX)].rpartition("-")[0]
+                if owner in owners and owner not in released_owners:  # alive (or this spool)
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    orphans.append((os.stat(path).st_mtime, path))
+                except FileNotFoundError:  # taken by another process
+                    pass
+            self._adopt(path for _, path in sorted(orphans))
+        finally:
+            for owner, fd in released:
+                os.close(fd)
+                _remove(os.path.join(self.directory, owner + LOCK_SUFFIX))
+
+    def _adopt(self, paths: t.Iterable[str]):
+        for path in paths:
+            adopted = self._next_path()
+            while os.path.exists(adopted):
+                adopted = self._next_path()
+            try:
+                os.rename(path, adopted)
+            except FileNotFoundError:  # taken by another process
+                continue
+            messages = sum(1 for _ in _read_segment(adopted))
+            if messages:
+                self._segments.append(_Segment(adopted, os.stat(adopted).st_size, messages))
+            else:
+                _remove(adopted)
+
+
+def _read_segment(path: str) -> t.Iterator[Message]:
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return
+    offset = 0
+    while offset + _LENGTH.size <= len(data):
+        length, = _LENGTH.unpack_from(data, offset)
+        start = offset + _LENGTH.size
+        if start + length > len(data):  # incomplete write (e.g. the process was killed)
+            return
+        try:
+            yield decode_json(data[start:start + length])
+        except ValueError:
+            return
+        offset = start + length
+
+
+def _lock(fd: int) -> bool:
+    r"""
+    locks the file without waiting. the lock is released once the process exits
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _try_lock(path: str) -> t.Optional[int]:
+    r"""
+    returns the file-descriptor of the locked file or None if the lock is held by somebody else
+    """
+    try:
+        fd = os.open(path, os.O_RDWR | _O_BINARY)
+    except OSError:  # e.g. removed meanwhile
+        return None
+    if _lock(fd):
+        return fd
+    os.close(fd)
+    return None
+
+
+def _create_owner(directory: str) -> t.Tuple[str, int]:
+    r"""
+    creates and locks the lock-file of a new owner and returns the name of the owner and the file-descriptor
+    """
+    owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+    path = os.path.join(directory, owner + LOCK_SUFFIX)
+    if fcntl is None:  # open files can't be removed on windows. so nobody can take it before it's locked
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL | _O_BINARY, 0o600)
+        _lock(fd)
+        return owner, fd
+    # only visible once it's locked. otherwise another process could take it for the lock of a process that is gone
+    temporary = os.path.join(directory, f".{owner}.tmp")
+    fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        _lock(fd)
+        os.rename(temporary, path)
+    except BaseException:
+        os.close(fd)
+        _remove(temporary)
+        raise
+    return owner, fd
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,394 @@
+# -*- coding=utf-8 -*-
+r"""
+client for asyncio based applications
+
+same handshake and messages as the DebugClient but built on asyncio-streams.
+send() only queues the message. the connection is established and the messages are written by a background-task
+
+- every event-loop that uses the client (threads or consecutive asyncio.run()) has its own queue, task and connection
+- the task writes what is still queued once its loop shuts down (asyncio.run() cancels it)
+- what is left from loops that were closed without that is written by close() (blocking)
+- repeat-counts, suppressed and dropped messages are also reported while nothing else is sent
+"""
+import time
+import asyncio
+import threading
+import typing as t
+from ..._typing import DEFAULT_VALUE, ServerInfoRaw
+from ..common import build_handshake, build_process_id, HANDSHAKE_ACCEPTED, FEATURE_PROCESS_ID, Encoder
+from ._base import BaseClient
+from ._ring import RingBuffer, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK
+
+
+class _LoopState:
+    r"""
+    everything that belongs to one event-loop
+    """
+    queue: RingBuffer
+    wakeup: asyncio.Event
+    write_lock: asyncio.Lock
+    task: t.Optional[asyncio.Task]
+    writer: t.Optional[asyncio.StreamWriter]
+    encoder: t.Optional[Encoder]
+    stopping: bool
+
+    def __init__(self, queue: RingBuffer):
+        self.queue = queue
+        self.wakeup = asyncio.Event()
+        self.write_lock = asyncio.Lock()
+        self.task = None
+        self.writer = None
+        self.encoder = None
+        self.stopping = False  # the task was cancelled and writes the rest
+
+
+class AsyncDebugClient(BaseClient):
+    _queue_size: int
+    _overflow: str
+    _lock: threading.Lock
+    _states: t.Dict[asyncio.AbstractEventLoop, _LoopState]
+    _left_over: list  # queued items of event-loops that were closed without writing them
+    _dropped: int  # by the queues of the states that are gone
+    _reported_drops: int
+    _drop_report_interval: float
+    _next_drop_report: float
+
+    def __init__(self, *, server_info: ServerInfoRaw = DEFAULT_VALUE, timeout: float = DEFAULT_VALUE,
+                 connect_timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
+                 max_connection_attempt_delta: float = DEFAULT_VALUE,
+                 capture_locals: bool = DEFAULT_VALUE, max_frames: int = DEFAULT_VALUE,
+                 max_repr_length: int = DEFAULT_VALUE,
+                 deduplicate: bool = DEFAULT_VALUE, deduplicate_window: float = DEFAULT_VALUE,
+                 rate_limit: t.Union[float, t.Mapping[str, float]] = DEFAULT_VALUE, rate_burst: float = DEFAULT_VALUE,
+                 sample_rate: float = DEFAULT_VALUE,
+                 queue_size: int = DEFAULT_VALUE, overflow: str = DEFAULT_VALUE,
+                 drop_report_interval: float = DEFAULT_VALUE):
+        r"""
+
+        :param server_info: information about the server (host|port|(host, port))
+        :param timeout: socket timeout
+        :param connect_timeout: timeout for the connection-attempt and the handshake (default: timeout or 1s)
+        :param connection_attempt_delta: delta between connection attempts (doubled after every failed attempt)
+        :param max_connection_attempt_delta: maximum delta between connection attempts
+        :param capture_locals: include (bounded) reprs of the local variables in the tracebacks
+        :param max_frames: maximum number of frames captured per traceback (the innermost are kept)
+        :param max_repr_length: maximum length of the repr of a local variable
+        :param deduplicate: send repeated exceptions (same type and traceback) only once per window with a counter
+            (off by default)
+        :param deduplicate_window: seconds in which an exception is only counted after it was sent
+        :param rate_limit: messages per second per level and origin (one value or per level. e.g. {"DEBUG": 10})
+        :param rate_burst: how many messages can be sent at once before the rate-limit applies
+        :param sample_rate: fraction of the messages that is sent (0..1). ERROR and CRITICAL are always sent
+        :param queue_size: maximum number of queued messages (per event-loop)
+        :param overflow: what to do if the queue is full (drop-newest|drop-oldest)
+        :param drop_report_interval: minimum seconds between the messages about dropped messages
+        """
+        super().__init__(
+            server_info=server_info, timeout=timeout, connect_timeout=connect_timeout,
+            connection_attempt_delta=connection_attempt_delta,
+            max_connection_attempt_delta=max_connection_attempt_delta,
+            capture_locals=capture_locals, max_frames=max_frames, max_repr_length=max_repr_length,
+            deduplicate=deduplicate, deduplicate_window=deduplicate_window,
+            rate_limit=rate_limit, rate_burst=rate_burst, sample_rate=sample_rate,
+        )
+        overflow = OVERFLOW_DROP_NEWEST if overflow is DEFAULT_VALUE else overflow
+        if overflow == OVERFLOW_BLOCK:
+            raise ValueError("the async client can't block on overflow")
+        self._queue_size = 10_000 if queue_size is DEFAULT_VALUE else queue_size
+        self._overflow = overflow
+        RingBuffer(capacity=self._queue_size, overflow=overflow)  # validates the options
+        self._lock = threading.Lock()
+        self._states = {}
+        self._left_over = []
+        self._dropped = 0
+        self._reported_drops = 0
+        self._drop_report_interval = 5.0 if drop_report_interval is DEFAULT_VALUE else drop_report_interval
+        self._next_drop_report = 0.0
+
+    def __del__(self):
+        self._stop_all()
+
+    def _after_fork(self):
+        super()._after_fork()
+        # the event-loops (and everything bound to them) belong to the parent
+        self._lock = threading.Lock()
+        self._states = {}
+        self._left_over = []
+        self._dropped = 0
+        self._reported_drops = 0
+        self._next_drop_report = 0.0
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped + sum(state.queue.dropped for state in list(self._states.values()))
+
+    @property
+    def connected(self) -> bool:
+        r"""
+        whether any event-loop is connected
+        """
+        return any(state.writer is not None for state in list(self._states.values()))
+
+    def receiving(self) -> bool:
+        r"""
+        whether a message that is sent now gets to the connection (see DebugClient.receiving()).
+        has to be called from within a running event-loop
+        """
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            self._start(loop)
+            return True
+        return state.writer is not None or time.monotonic() >= self._next_connection_attempt
+
+    def send(self, message: str,
+             *, level: t.Optional[str] = None, exception: t.Optional[BaseException] = None,
+             timestamp: float = None, origin: t.Optional[str] = None, limit: bool = True,
+             extra: t.Optional[dict] = None, args: t.Optional[t.Union[tuple, t.Mapping[str, t.Any]]] = None):
+        r"""
+        queues the message. has to be called from within a running event-loop
+
+        :param origin: where the message comes from (logger, function, ...). has its own rate-limit
+        :param limit: False if accepts() was already asked
+        :param extra: additional fields of the message (see _typing.Message)
+        :param args: the message is a %-template that is formatted together with the rest of the message
+        """
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._start(loop)
+        elif state.writer is None and time.monotonic() < self._next_connection_attempt:
+            return  # the server is unreachable at the moment
+        if limit and self._limiter is not None and not self.accepts(
+                level or ("ERROR" if exception is not None else None), origin):
+            return  # before anything is formatted
+        if exception is not None and self._dedup is not None:
+            extra = self._deduplicate(exception, level, extra)
+            if extra is None:  # repeated exception. only counted
+                return
+        item = (message, level, exception, time.time() if timestamp is None else timestamp, extra, args)
+        if not state.queue.put(item):  # full
+            self._forget_admitted((item,))
+            return
+        state.wakeup.set()
+
+    async def flush(self):
+        r"""
+        writes all messages that were queued by this event-loop to the server
+        """
+        state = self._states.get(asyncio.get_running_loop())
+        if state is None:
+            return
+        async with state.write_lock:
+            await self._write_queued(state, everything=True)
+
+    async def aclose(self):
+        r"""
+        writes what is queued and closes the connection of this event-loop (and stops the others. see close())
+        """
+        await self.flush()
+        state = self._states.get(asyncio.get_running_loop())
+        self.close()
+        if state is not None and state.task is not None:
+            await asyncio.wait((state.task,))  # closes the writer
+
+    def close(self):
+        r"""
+        stops the tasks (they write what is still queued first). sending again starts a new one.
+        what is left from event-loops that are already closed is written here (blocking)
+        """
+        self._stop_all()
+        self._write_left_over()
+
+    def _stop_all(self):
+        with self._lock:
+            for loop, state in list(self._states.items()):
+                self._stop(loop, state)
+
+    def _stop(self, loop: asyncio.AbstractEventLoop, state: _LoopState):
+        # requires the lock. the state is removed by the task once it's done (see _run())
+        # the task belongs to the loop. so it's only cancelled from within the loop (which may run in another thread)
+        if loop.is_closed():
+            del self._states[loop]
+            self._discard(state)
+            return
+        if state.stopping:  # a second cancel() would interrupt the writing of the rest
+            return
+        state.stopping = True
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        try:
+            if running is loop:
+                state.task.cancel()
+            else:
+                loop.call_soon_threadsafe(state.task.cancel)
+        except RuntimeError:  # closed meanwhile
+            del self._states[loop]
+            self._discard(state)
+
+    def _discard(self, state: _LoopState):
+        # the event-loop is gone without having written the queue (its writer went with it). requires the lock
+        self._left_over.extend(state.queue.take())
+        self._dropped += state.queue.dropped
+        state.writer = None
+
+    def _write_left_over(self):
+        # blocking. without a thread as it also happens at interpreter exit (where threads can't be started anymore)
+        items, self._left_over = self._left_over, []
+        if not items:
+            return
+        try:
+            connection, encoder = self._open_connection()
+        except OSError as error:
+            self._forget_admitted(items)
+            self._handle_error(error)
+            return
+        try:
+            messages = [self.build_message(*item) for item in items]
+            messages.extend(self._notices_due(everything=True))
+            frames = []
+            for message in messages:
+                try:
+                    frames.append(encoder.encode(message))
+                except (OverflowError, TypeError, ValueError) as error:  # e.g. too big or not serializable
+                    self._handle_error(error)
+            connection.sendall(b''.join(frames))
+        except OSError as error:
+            self._handle_error(error)
+        finally:
+            connection.close()
+
+    def _start(self, loop: asyncio.AbstractEventLoop) -> _LoopState:
+        # first usage from this event-loop
+        with self._lock:
+            state = self._states.get(loop)
+            if state is not None:
+                return state
+            for closed in [other for other in self._states if other.is_closed()]:
+                self._discard(self._states.pop(closed))  # written by the next close()
+            state = self._states[loop] = _LoopState(RingBuffer(capacity=self._queue_size, overflow=self._overflow))
+            state.task = loop.create_task(self._run(loop, state))
+            return state
+
+    async def _run(self, loop: asyncio.AbstractEventLoop, state: _LoopState):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(state.wakeup.wait(), self._next_wakeup())
+                except asyncio.TimeoutError:  # time for the notices
+                    pass
+                state.wakeup.clear()
+                try:
+                    async with state.write_lock:
+                        await self._write_queued(state)
+                except Exception as error:
+                    self._handle_error(error)
+        except asyncio.CancelledError:  # e.g. the end of asyncio.run() or close()
+            state.stopping = True
+            try:
+                # bounded as it delays the shutdown of the loop (the connection-attempt and the writing)
+                await asyncio.wait_for(self._write_queued(state, everything=True), 2 * self._connect_timeout)
+            except Exception as error:
+                self._handle_error(error)
+            raise
+        finally:
+            with self._lock:
+                if self._states.get(loop) is state:
+                    del self._states[loop]  # the next send() of this loop starts a new task
+                self._left_over.extend(state.queue.take())  # e.g. the connection-attempt took too long
+                self._dropped += state.queue.dropped
+            self._close_writer(state)
+
+    def _next_wakeup(self) -> t.Optional[float]:
+        # seconds till notices are due (None if there are none)
+        next_notice = self._next_notice()
+        if self._reported_drops != self.dropped:
+            next_notice = min(next_notice, self._next_drop_report)
+        return None if next_notice == float('inf') else max(next_notice - time.monotonic(), 0.0)
+
+    def _close_writer(self, state: _LoopState):
+        writer, state.writer = state.writer, None
+        if writer is not None:
+            try:
+                writer.close()
+            except RuntimeError:  # event loop is closed
+                pass
+
+    async def _write_queued(self, state: _LoopState, everything: bool = False):
+        if state.writer is None:
+            state.writer = await self.create_connection(state)
+            if state.writer is None:
+                self._forget_admitted(state.queue.take())  # nobody receives them
+                return
+        messages = [self.build_message(*item) for item in state.queue.take()]
+        messages.extend(self._notices_due(everything))  # repeat-counts and suppressed messages
+        drops = self._drop_notice(force=everything)
+        if drops is not None:
+            messages.append(drops)
+        if not messages:
+            return
+        frames = []
+        for message in messages:
+            try:
+                frames.append(state.encoder.encode(message))
+            except (OverflowError, TypeError, ValueError) as error:  # e.g. too big or not serializable
+                self._handle_error(error)
+        try:
+            state.writer.writelines(frames)
+            await state.writer.drain()
+        except (ConnectionError, OSError):
+            self._close_writer(state)
+            self._connection_failed()
+
+    def _drop_notice(self, force: bool = False):
+        r"""
+        message about the messages that were dropped since the last report (at most every drop_report_interval)
+        """
+        dropped = self.dropped
+        if dropped == self._reported_drops:
+            return None
+        now = time.monotonic()
+        if not force and now < self._next_drop_report:
+            return None
+        self._next_drop_report = now + self._drop_report_interval
+        count = dropped - self._reported_drops
+        self._reported_drops = dropped
+        return self.build_message(
+            message=f"dropped {count} message{'s' if count != 1 else ''} as the queue was full ({dropped} in total)",
+            level="WARNING",
+        )
+
+    async def create_connection(self, state: _LoopState) -> t.Optional[asyncio.StreamWriter]:
+        r"""
+        creates a connection and executes the handshake
+        if the server cannot be found or rejects the connection this function returns None
+        """
+        now = time.monotonic()
+        if now < self._next_connection_attempt:
+            return None
+        writer = None
+        try:
+            timeout = self._connect_timeout
+            reader, writer = await asyncio.wait_for(self._transport.open_connection(self._address), timeout)
+            writer.write(build_handshake())
+            await writer.drain()
+            if await asyncio.wait_for(reader.readexactly(1), timeout) != HANDSHAKE_ACCEPTED:
+                self._connection_failed()
+                self._handle_error(PermissionError("connection was refused"))
+                writer.close()
+                return None
+            features_length = int.from_bytes(await reader.readexactly(1), byteorder='big', signed=False)
+            features = await reader.readexactly(features_length)
+            if FEATURE_PROCESS_ID in features:
+                writer.write(build_process_id())
+            state.encoder = Encoder(features=features)
+            self._connection_succeeded()
+            return writer
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as error:
+            if writer is not None:
+                writer.close()
+            self._connection_failed()
+            self._handle_error(error)
+            return None
@@ -4,3 +4,9 @@ r"""
 """
 from .extract_server_info import extract_server_info
 from .prog import get_prog
+from .transport import Transport, register_transport, get_transport
+from .shm import ShmTransport
+from .protocol import (
+    HANDSHAKE_HEAD, HANDSHAKE_ACCEPTED, CLIENT_FEATURES, SERVER_FEATURES, FEATURE_PROCESS_ID, PROCESS_ID_SIZE,
+    build_handshake, build_handshake_response, build_process_id, negotiate_features, recv_exactly, Encoder, Decoder,
+)
@@ -0,0 +1,294 @@
+# -*- coding=utf-8 -*-
+r"""
+encoding and decoding of the message-bodies
+
+j: json
+b: binary
+    {level:1}{timestamp:8}{flags:1}{message:str}
+    [{type:str}{value:str}{traceback:str}]  # if flags & FLAG_EXCEPTION
+    [{omitted:varint}{count:varint}{frame}*]  # if flags & FLAG_FRAMES (structured traceback)
+        frame = {filename:str}{name:str}{lineno:varint}{count:varint}({name:str}{repr:str})*
+    [{level:str}]  # if level == LEVEL_CUSTOM
+    [{extra:str}]  # if flags & FLAG_EXTRA. json-encoded object with the remaining keys
+    [{logger:str}{pathname:str}{func:str}{lineno:varint}{process:varint}{thread:varint}{thread_name:str}
+     {rest:str}]  # if flags & FLAG_RECORD (structured log-record). rest: json-encoded args/extra or empty
+                  # only if the receiver accepts it (feature 'r'). otherwise the record is part of the extra
+
+    str = {len:varint}{utf-8}
+    varint = unsigned LEB128
+
+    with interning (negotiated per connection) every str starts with a tag instead
+    str = {tag:varint}...
+    - tag & 0b11 == 0: literal      {tag=len<<2}{utf-8}
+    - tag & 0b11 == 1: definition   {tag=id<<2|1}{len:varint}{utf-8}  the receiver stores the string under the id
+    - tag & 0b11 == 2: reference    {tag=id<<2|2}                     the string that was stored under the id
+    a string is only defined if it was seen before (so unique strings don't fill the table).
+    if the table is full the least recently used id is reused by the next definition
+"""
+import struct
+import collections
+import typing as t
+from ..._packages import json
+from ..._typing import Message
+
+
+FORMAT_JSON = b'j'
+FORMAT_BINARY = b'b'
+
+LEVELS = ("DEB", "INF", "WAR", "ERR", "CRI")
+LEVEL_IDS = {level: index for index, level in enumerate(LEVELS)}
+LEVEL_CUSTOM = 0xFF
+
+FLAG_EXCEPTION = 0b01
+FLAG_EXTRA = 0b10
+FLAG_FRAMES = 0b100
+FLAG_RECORD = 0b1000  # only with the feature 'r'. older receivers can't skip it (the strings may be interned)
+
+BASE_KEYS = frozenset(('message', 'level', 'exception_info', 'timestamp'))
+RECORD_KEYS = frozenset(('logger', 'pathname', 'func', 'lineno', 'process', 'thread', 'thread_name'))
+
+_HEAD = struct.Struct('>BdB')
+
+
+def encode_varint(value: int) -> bytes:
+    if value < 0x80:
+        return bytes((value,))
+    result = bytearray()
+    while value >= 0x80:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def decode_varint(data: t.Union[bytes, bytearray, memoryview], offset: int) -> t.Tuple[int, int]:
+    r"""
+    returns the value and the offset after it
+    raises IndexError if the data ends in the middle of the varint
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+STR_LITERAL = 0
+STR_DEFINE = 1
+STR_REFERENCE = 2
+
+
+class InternTable:
+    r"""
+    strings of the sending side of one connection that were assigned an id
+    """
+    def __init__(self, capacity: int = 4096, min_length: int = 8):
+        self.capacity = capacity
+        self.min_length = min_length  # shorter strings are cheaper to send as they are
+        self._ids: t.OrderedDict[str, int] = collections.OrderedDict()
+        self._seen: t.OrderedDict[int, None] = collections.OrderedDict()  # hashes of strings that were sent once
+        # definitions of the body that is being encoded: (string, id, string that had the id before)
+        self._journal: t.List[t.Tuple[str, int, t.Optional[str]]] = []
+
+    def commit(self):
+        r"""
+        the encoded body is sent. so the receiver learns its definitions
+        """
+        self._journal.clear()
+
+    def rollback(self):
+        r"""
+        the encoding failed and the body isn't sent. so its definitions are forgotten again
+        """
+        ids = self._ids
+        while self._journal:
+            value, string_id, replaced = self._journal.pop()
+            del ids[value]
+            if replaced is not None:
+                ids[replaced] = string_id
+                ids.move_to_end(replaced, last=False)
+
+    def encode(self, parts: t.List[bytes], value: str):
+        ids = self._ids
+        string_id = ids.get(value)
+        if string_id is not None:
+            ids.move_to_end(value)
+            parts.append(encode_varint(string_id << 2 | STR_REFERENCE))
+            return
+        raw = value.encode('utf-8', 'surrogatepass')
+        if len(value) >= self.min_length:
+            key = hash(value)
+            if key in self._seen:
+                del self._seen[key]
+                replaced = None
+                if len(ids) < self.capacity:
+                    string_id = len(ids)
+                else:  # reuse the id of the least recently used string
+                    replaced, string_id = ids.popitem(last=False)
+                ids[value] = string_id
+                self._journal.append((value, string_id, replaced))
+                parts.append(encode_varint(string_id << 2 | STR_DEFINE))
+                parts.append(encode_varint(len(raw)))
+                parts.append(raw)
+                return
+            self._seen[key] = None
+            if len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+        parts.append(encode_varint(len(raw) << 2 | STR_LITERAL))
+        parts.append(raw)
+
+
+def _encode_str(parts: t.List[bytes], value: str, table: t.Optional[InternTable] = None):
+    if table is not None:
+        table.encode(parts, value)
+        return
+    raw = value.encode('utf-8', 'surrogatepass')
+    parts.append(encode_varint(len(raw)))
+    parts.append(raw)
+
+
+def _decode_str(data: t.Union[bytes, memoryview], offset: int,
+                strings: t.Optional[t.Dict[int, str]] = None) -> t.Tuple[str, int]:
+    if strings is None:
+        length, offset = decode_varint(data, offset)
+        end = offset + length
+        return str(data[offset:end], 'utf-8', 'surrogatepass'), end
+    tag, offset = decode_varint(data, offset)
+    kind = tag & 0b11
+    if kind == STR_REFERENCE:
+        return strings[tag >> 2], offset
+    if kind == STR_DEFINE:
+        length, offset = decode_varint(data, offset)
+    else:
+        length = tag >> 2
+    end = offset + length
+    value = str(data[offset:end], 'utf-8', 'surrogatepass')
+    if kind == STR_DEFINE:
+        strings[tag >> 2] = value
+    return value, end
+
+
+def encode_json(message: Message) -> bytes:
+    body = json.dumps(message)
+    if isinstance(body, str):
+        body = body.encode()
+    return body
+
+
+def decode_json(body: t.Union[bytes, str, memoryview]) -> dict:
+    return json.loads(bytes(body) if isinstance(body, memoryview) else body)  # json can't read a memoryview
+
+
+def encode_binary(message: Message, table: t.Optional[InternTable] = None, records: bool = False) -> bytes:
+    r"""
+    :param table: interning of the strings (if negotiated)
+    :param records: the log-record has its own section (if negotiated). otherwise it's json-encoded with the extra
+    """
+    level = message['level']
+    level_id = LEVEL_IDS.get(level, LEVEL_CUSTOM)
+    exception_info = message['exception_info']
+    extra = {key: value for key, value in message.items() if key not in BASE_KEYS} if len(message) > 4 else None
+    record = extra.pop('record', None) if extra and records else None
+    frames = exception_info.get('frames') if exception_info else None
+    flags = (FLAG_EXCEPTION if exception_info else 0) | (FLAG_EXTRA if extra else 0) | \
+        (FLAG_FRAMES if frames is not None else 0) | (FLAG_RECORD if record is not None else 0)
+
+    parts = [_HEAD.pack(level_id, message['timestamp'], flags)]
+    _encode_str(parts, message['message'], table)
+    if exception_info:
+        _encode_str(parts, exception_info['type'], table)
+        _encode_str(parts, exception_info['value'], table)
+        _encode_str(parts, exception_info['traceback'], table)
+    if frames is not None:
+        parts.append(encode_varint(exception_info.get('omitted', 0)))
+        parts.append(encode_varint(len(frames)))
+        for frame in frames:
+            _encode_str(parts, frame['filename'], table)  # repeated filenames and names are interned
+            _encode_str(parts, frame['name'], table)
+            parts.append(encode_varint(frame['lineno']))
+            frame_locals = frame.get('locals') or {}
+            parts.append(encode_varint(len(frame_locals)))
+            for name, value in frame_locals.items():
+                _encode_str(parts, name, table)
+                _encode_str(parts, value, table)
+    if level_id == LEVEL_CUSTOM:
+        _encode_str(parts, level, table)
+    if extra:
+        _encode_str(parts, encode_json(extra).decode(), table)
+    if record is not None:
+        # repeated loggers, files, functions and threads are interned
+        _encode_str(parts, record['logger'], table)
+        _encode_str(parts, record['pathname'], table)
+        _encode_str(parts, record['func'], table)
+        parts.append(encode_varint(record['lineno']))
+        parts.append(encode_varint(record['process']))
+        parts.append(encode_varint(record['thread']))
+        _encode_str(parts, record['thread_name'], table)
+        rest = {key: value for key, value in record.items() if key not in RECORD_KEYS} if len(record) > 7 else None
+        _encode_str(parts, encode_json(rest).decode() if rest else "", table)
+    return b''.join(parts)
+
+
+def decode_binary(body: t.Union[bytes, memoryview], strings: t.Optional[t.Dict[int, str]] = None) -> dict:
+    level_id, timestamp, flags = _HEAD.unpack_from(body, 0)
+    message, offset = _decode_str(body, _HEAD.size, strings)
+    exception_info = None
+    if flags & FLAG_EXCEPTION:
+        exc_type, offset = _decode_str(body, offset, strings)
+        exc_value, offset = _decode_str(body, offset, strings)
+        exc_traceback, offset = _decode_str(body, offset, strings)
+        exception_info = dict(type=exc_type, value=exc_value, traceback=exc_traceback)
+    if flags & FLAG_FRAMES:
+        omitted, offset = decode_varint(body, offset)
+        count, offset = decode_varint(body, offset)
+        frames = []
+        for _ in range(count):
+            filename, offset = _decode_str(body, offset, strings)
+            name, offset = _decode_str(body, offset, strings)
+            lineno, offset = decode_varint(body, offset)
+            frame = dict(filename=filename, lineno=lineno, name=name)
+            locals_count, offset = decode_varint(body, offset)
+            if locals_count:
+                frame_locals = frame['locals'] = {}
+                for _ in range(locals_count):
+                    local_name, offset = _decode_str(body, offset, strings)
+                    frame_locals[local_name], offset = _decode_str(body, offset, strings)
+            frames.append(frame)
+        exception_info.update(frames=frames, omitted=omitted)
+    if level_id == LEVEL_CUSTOM:
+        level, offset = _decode_str(body, offset, strings)
+    else:
+        level = LEVELS[level_id]
+    raw = dict(message=message, level=level, exception_info=exception_info, timestamp=timestamp)
+    if flags & FLAG_EXTRA:
+        extra, offset = _decode_str(body, offset, strings)
+        raw.update(decode_json(extra))
+    if flags & FLAG_RECORD:
+        logger, offset = _decode_str(body, offset, strings)
+        pathname, offset = _decode_str(body, offset, strings)
+        func, offset = _decode_str(body, offset, strings)
+        lineno, offset = decode_varint(body, offset)
+        process, offset = decode_varint(body, offset)
+        thread, offset = decode_varint(body, offset)
+        thread_name, offset = _decode_str(body, offset, strings)
+        rest, offset = _decode_str(body, offset, strings)
+        record = raw['record'] = dict(logger=logger, pathname=pathname, func=func, lineno=lineno,
+                                      process=process, thread=thread, thread_name=thread_name)
+        if rest:
+            record.update(decode_json(rest))
+    return raw
+
+
+ENCODERS: t.Dict[bytes, t.Callable[[Message], bytes]] = {
+    FORMAT_JSON: encode_json,
+    FORMAT_BINARY: encode_binary,
+}
+
+DECODERS: t.Dict[bytes, t.Callable[[bytes], dict]] = {
+    FORMAT_JSON: decode_json,
+    FORMAT_BINARY: decode_binary,
+}
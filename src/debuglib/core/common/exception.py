@@ -0,0 +1,101 @@
+# -*- coding=utf-8 -*-
+r"""
+structured capture of exceptions
+
+the client only collects what is needed (filename, line, name and optionally the locals of every frame).
+reading the source-lines and building the text is done by the receiver (see render_traceback())
+"""
+import reprlib
+import linecache
+import typing as t
+from ..._typing import StructuredExceptionInfo, FrameInfo
+
+
+class CaptureOptions(t.NamedTuple):
+    max_frames: int = 32  # the innermost frames are kept
+    capture_locals: bool = False
+    max_locals: int = 16  # per frame
+    max_repr_length: int = 128  # per local
+
+
+DEFAULT_CAPTURE_OPTIONS = CaptureOptions()
+
+
+def _create_repr(max_length: int) -> reprlib.Repr:
+    bounded = reprlib.Repr()
+    bounded.maxstring = bounded.maxother = bounded.maxlong = max_length
+    return bounded
+
+
+_reprs: t.Dict[int, reprlib.Repr] = {}
+
+
+_SCALARS = frozenset((type(None), bool, float))
+
+
+def bounded_repr(value: t.Any, max_length: int) -> str:
+    kind = type(value)
+    if kind in _SCALARS or (kind is int and value.bit_length() < 64) or (kind is str and len(value) <= max_length):
+        text = repr(value)  # short anyway. reprlib is a lot slower
+        return text if len(text) <= max_length else text[:max_length - 3] + "..."
+    bounded = _reprs.get(max_length)
+    if bounded is None:
+        bounded = _reprs[max_length] = _create_repr(max_length)
+    try:
+        text = bounded.repr(value)
+    except Exception as error:  # broken __repr__
+        return f"<repr failed: {type(error).__name__}>"
+    return text if len(text) <= max_length else text[:max_length - 3] + "..."
+
+
+def capture_exception(exception: BaseException,
+                      options: CaptureOptions = DEFAULT_CAPTURE_OPTIONS) -> StructuredExceptionInfo:
+    tracebacks = []
+    tb = exception.__traceback__
+    while tb is not None:
+        tracebacks.append(tb)
+        tb = tb.tb_next
+    omitted = max(len(tracebacks) - options.max_frames, 0)
+    frames = []
+    for tb in tracebacks[omitted:]:
+        frame = tb.tb_frame
+        code = frame.f_code
+        info = FrameInfo(
+            filename=code.co_filename,
+            # None on 3.12+ if the instruction has no line (e.g. some generated code)
+            lineno=tb.tb_lineno if tb.tb_lineno is not None else frame.f_lineno or 0,
+            name=getattr(code, 'co_qualname', code.co_name),  # co_qualname: 3.11+
+        )
+        if options.capture_locals:
+            info['locals'] = {
+                name: bounded_repr(value, options.max_repr_length)
+                for name, value in list(frame.f_locals.items())[:options.max_locals]
+            }
+        frames.append(info)
+    return StructuredExceptionInfo(
+        type=type(exception).__name__,
+        value=str(exception),
+        traceback="",
+        frames=frames,
+        omitted=omitted,
+    )
+
+
+def render_traceback(exception_info: t.Mapping[str, t.Any]) -> str:
+    r"""
+    the traceback as text. like traceback.format_tb() for structured exceptions
+    """
+    frames = exception_info.get('frames')
+    if frames is None:  # already formatted by the client
+        return exception_info['traceback']
+    lines = ["Traceback (most recent call last):"]
+    if exception_info.get('omitted'):
+        lines.append(f"  ... {exception_info['omitted']} more frames")
+    for frame in frames:
+        lines.append(f"  File \"{frame['filename']}\", line {frame['lineno']}, in {frame['name']}")
+        source = linecache.getline(frame['filename'], frame['lineno']).strip()  # if available on this host
+        if source:
+            lines.append(f"    {source}")
+        for name, value in frame.get('locals', {}).items():
+            lines.append(f"      {name} = {value}")
+    return '\n'.join(lines)
@@ -2,7 +2,7 @@
 r"""
 
 """
-from ..._typing import DEFAULT_VALUE, ServerInfo, ServerInfoRaw
+from ..._typing import DEFAULT_VALUE, ServerInfo, ServerInfoRaw, TransportServerInfo
 from ...defaults import DEFAULT_SERVER_HOST, DEFAULT_SERVER_PORT
 
 
@@ -13,9 +13,20 @@ def extract_server_info(info: ServerInfoRaw) -> ServerInfo:
     - host
     - port
     - (host|None, port|None)
+    - scheme://address (e.g. unix:///path/to/socket or tcp://host:port)
     """
     if info is None or info is DEFAULT_VALUE:  # take default
         return DEFAULT_SERVER_HOST, DEFAULT_SERVER_PORT
+    elif isinstance(info, TransportServerInfo):
+        return info
+    elif isinstance(info, str) and "://" in info:  # scheme://address
+        scheme, _, address = info.partition("://")
+        if scheme == "tcp":
+            host, sep, port = address.rpartition(":")
+            if not sep or host.startswith("[") and not host.endswith("]"):  # tcp://host or tcp://[ipv6]
+                host, port = address, None
+            return extract_server_info((host.strip("[]") or None, int(port) if port else None))
+        return TransportServerInfo(scheme=scheme, address=address)
     elif isinstance(info, str):  # host specified
         return info, DEFAULT_SERVER_PORT
     elif isinstance(info, int):  # port specified
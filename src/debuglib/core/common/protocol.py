@@ -0,0 +1,261 @@
+# -*- coding=utf-8 -*-
+r"""
+parts of the protocol that are shared between the clients and the server
+
+Handshake:
+- the client offers features. the server answers with the ones it accepts
+> DEBUGLIB\0{len:1}{version}\0{len:1}{features}
+< 1{len:1}{accepted features}
+> {pid:4}  (only if p was accepted)
+
+Features:
+- b: binary message-body (json is used otherwise)
+- i: interning of repeated strings in binary message-bodies (see codec.py)
+- L: length of the frames as varint instead of 2 bytes (no limit of 64KiB)
+- z: large bodies are compressed with one zlib-stream per connection
+- s: the frames are written into a shared-memory ring-buffer (only offered by and for shm://. see shm.py)
+- r: structured log-records have their own section in binary message-bodies (see codec.py)
+- p: the client sends its process-id after the handshake (e.g. for the relay. the peer of tcp is only ip:port)
+
+Frame:
+{format:1}{len:2|varint}{body}
+- z: compressed frame. the decompressed data is {format:1}{body}
+"""
+import os
+import zlib
+import socket
+import functools
+import typing as t
+# noinspection PyPep8Naming
+from ... import __version__ as DEBUGLIB_VERSION
+from ..._typing import Message
+from .codec import FORMAT_JSON, FORMAT_BINARY, ENCODERS, DECODERS, InternTable, encode_varint, decode_varint
+
+
+HANDSHAKE_HEAD = b'DEBUGLIB\0'
+HANDSHAKE_ACCEPTED = b'1'
+PROCESS_ID_SIZE = 4
+
+FEATURE_BINARY = b'b'
+FEATURE_INTERNING = b'i'
+FEATURE_LARGE_FRAMES = b'L'
+FEATURE_COMPRESSION = b'z'
+FEATURE_SHARED_MEMORY = b's'
+FEATURE_RECORDS = b'r'
+FEATURE_PROCESS_ID = b'p'
+
+# offered by the clients
+CLIENT_FEATURES = (
+    FEATURE_BINARY + FEATURE_INTERNING + FEATURE_LARGE_FRAMES + FEATURE_COMPRESSION + FEATURE_RECORDS
+    + FEATURE_PROCESS_ID
+)
+# accepted by the server
+SERVER_FEATURES = (
+    FEATURE_BINARY + FEATURE_INTERNING + FEATURE_LARGE_FRAMES + FEATURE_COMPRESSION + FEATURE_RECORDS
+    + FEATURE_PROCESS_ID
+)
+
+FORMAT_ZLIB = b'z'
+MAX_SMALL_FRAME_SIZE = 0xFFFF
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # protection against garbage
+COMPRESSION_THRESHOLD = 1024  # smaller bodies aren't worth the compression
+
+
+def build_handshake(features: bytes = CLIENT_FEATURES) -> bytes:
+    r"""
+    DEBUGLIB\0{len:1}{version}\0{len:1}{features}
+    """
+    version = DEBUGLIB_VERSION.encode()
+    version_bytes = len(version).to_bytes(1, byteorder='big', signed=False) + version
+    features_bytes = len(features).to_bytes(1, byteorder='big', signed=False) + features
+    return HANDSHAKE_HEAD + version_bytes + b'\0' + features_bytes
+
+
+def build_handshake_response(features: bytes) -> bytes:
+    r"""
+    1{len:1}{accepted features}
+    """
+    return HANDSHAKE_ACCEPTED + len(features).to_bytes(1, byteorder='big', signed=False) + features
+
+
+def build_process_id() -> bytes:
+    r"""
+    {pid:4}
+    """
+    return os.getpid().to_bytes(PROCESS_ID_SIZE, byteorder='big', signed=False)
+
+
+def negotiate_features(offered: bytes, supported: bytes = SERVER_FEATURES) -> bytes:
+    return bytes(feature for feature in offered if feature in supported)
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    r"""
+    receives exactly `size` bytes (less only if the connection was closed)
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+class Encoder:
+    r"""
+    creates the frames for one connection based on the negotiated features
+
+    the frames have to be written in the order they were encoded (interning and compression depend on it)
+    """
+    features: bytes
+    body_format: bytes
+
+    def __init__(self, features: bytes = b''):
+        self.features = features
+        self.body_format = FORMAT_BINARY if FEATURE_BINARY in features else FORMAT_JSON
+        self._encode_body: t.Callable[[Message], bytes] = ENCODERS[self.body_format]
+        self._table: t.Optional[InternTable] = None
+        if self.body_format == FORMAT_BINARY:
+            if FEATURE_INTERNING in features:
+                self._table = InternTable()
+            self._encode_body = functools.partial(
+                self._encode_body, table=self._table, records=FEATURE_RECORDS in features,
+            )
+        self._large_frames = FEATURE_LARGE_FRAMES in features
+        self._compressor = zlib.compressobj() if FEATURE_COMPRESSION in features else None
+
+    def _frame_bound(self, size: int) -> int:
+        r"""
+        maximum size of the body in the frame (compressed bodies can be a bit bigger. see compressBound() of zlib)
+        """
+        if self._compressor is None or size < COMPRESSION_THRESHOLD:
+            return size
+        size += 1  # the body-format is compressed with it
+        return size + (size >> 12) + (size >> 14) + (size >> 25) + 13 + 5  # + the sync-flush marker
+
+    def encode(self, message: Message) -> bytes:
+        r"""
+        raises OverflowError if the message doesn't fit into a frame
+        """
+        if not self._large_frames and _text_length(message) > MAX_SMALL_TEXT_LENGTH:
+            # the server doesn't support bigger frames.
+            # has to happen before the encoding as that already changes the state of the connection (interning)
+            message = truncate_message(message, MAX_SMALL_TEXT_LENGTH)
+        body_format = self.body_format
+        table = self._table
+        try:
+            body = self._encode_body(message)
+            # before anything changes the state of the connection (interning and the compression-stream)
+            if self._frame_bound(len(body)) > (MAX_FRAME_SIZE if self._large_frames else MAX_SMALL_FRAME_SIZE):
+                raise OverflowError(f"message is too big for a frame ({len(body)} bytes)")
+        except BaseException:  # e.g. TypeError of an extra-field that isn't serializable
+            if table is not None:
+                table.rollback()  # the receiver never sees the definitions of this body
+            raise
+        if table is not None:
+            table.commit()
+        if self._compressor is not None and len(body) >= COMPRESSION_THRESHOLD:
+            body = self._compressor.compress(body_format + body) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            body_format = FORMAT_ZLIB
+        if self._large_frames:
+            return body_format + encode_varint(len(body)) + body
+        return body_format + len(body).to_bytes(2, byteorder='big', signed=False) + body
+
+
+# every character takes at most 4 bytes in utf-8
+MAX_SMALL_TEXT_LENGTH = MAX_SMALL_FRAME_SIZE // 4 - 256
+
+
+def _text_length(message: Message) -> int:
+    exception_info = message['exception_info']
+    if not exception_info:
+        return len(message['message'])
+    length = len(message['message']) + len(exception_info['value']) + len(exception_info['traceback'])
+    for frame in exception_info.get('frames', ()):
+        length += len(frame['filename']) + len(frame['name']) + 8
+        for name, value in frame.get('locals', {}).items():
+            length += len(name) + len(value) + 2
+    return length
+
+
+def truncate_message(message: Message, max_size: int) -> Message:
+    r"""
+    shortens the message and the traceback (keeping its end) to about max_size characters
+    """
+    message = message.copy()
+    quarter = max_size // 4
+    if len(message['message']) > quarter:
+        message['message'] = message['message'][:quarter] + "... (truncated)"
+    exception_info = message['exception_info']
+    if exception_info:
+        exception_info = message['exception_info'] = exception_info.copy()
+        exception_info['value'] = exception_info['value'][:quarter]
+        if len(exception_info['traceback']) > quarter * 2:
+            exception_info['traceback'] = "(truncated) ...\n" + exception_info['traceback'][-quarter * 2:]
+        if 'frames' in exception_info:  # without the locals and only the innermost frames that fit
+            frames = []
+            size = 0
+            for frame in reversed(exception_info['frames']):
+                size += len(frame['filename']) + len(frame['name']) + 8
+                if size > quarter * 2:
+                    break
+                frames.append(dict(filename=frame['filename'], lineno=frame['lineno'], name=frame['name']))
+            frames.reverse()
+            exception_info['omitted'] = exception_info.get('omitted', 0) + len(exception_info['frames']) - len(frames)
+            exception_info['frames'] = frames
+    return message
+
+
+class Decoder:
+    r"""
+    decodes the frames of one connection based on the negotiated features
+
+    the frames have to be decoded in the order they were received (interning and compression depend on it)
+    """
+    features: bytes
+
+    def __init__(self, features: bytes = b''):
+        self.features = features
+        self._parsers: t.Dict[bytes, t.Callable[[bytes], dict]] = dict(DECODERS)
+        if FEATURE_INTERNING in features:
+            self._parsers[FORMAT_BINARY] = functools.partial(DECODERS[FORMAT_BINARY], strings={})
+        self._large_frames = FEATURE_LARGE_FRAMES in features
+        self._decompressor = zlib.decompressobj() if FEATURE_COMPRESSION in features else None
+
+    def read_frame(self, buffer: t.Union[bytes, bytearray], offset: int) -> t.Optional[t.Tuple[bytes, int, int]]:
+        r"""
+        returns the body-format and where the body starts and ends in the buffer
+        or None if the frame isn't complete yet
+        raises ValueError if the frame is too big to be valid
+        """
+        if self._large_frames:
+            try:
+                length, start = decode_varint(buffer, offset + 1)
+            except IndexError:
+                return None
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"frame is too big ({length} bytes)")
+        else:
+            if len(buffer) - offset < 3:
+                return None
+            length, start = int.from_bytes(buffer[offset + 1:offset + 3], byteorder='big', signed=False), offset + 3
+        end = start + length
+        if len(buffer) < end:
+            return None
+        return bytes(buffer[offset:offset + 1]), start, end
+
+    def decode(self, body_format: bytes, body: t.Union[bytes, memoryview]) -> dict:
+        r"""
+        raises LookupError for unknown body-formats and ValueError if a compressed frame is too big
+        """
+        if body_format == FORMAT_ZLIB and self._decompressor is not None:
+            # bounded so a small frame can't expand without limit (zlib bomb)
+            data = self._decompressor.decompress(body, MAX_FRAME_SIZE + 1)  # + the body-format
+            if self._decompressor.unconsumed_tail:
+                raise ValueError(f"decompressed frame is bigger than {MAX_FRAME_SIZE} bytes")
+            body_format, body = data[:1], data[1:]
+        parser = self._parsers.get(body_format)
+        if parser is None:
+            raise LookupError(f"unknown parser code received: {body_format!r}")
+        return parser(body)
@@ -0,0 +1,78 @@
+# -*- coding=utf-8 -*-
+r"""
+structured log-records
+
+the client sends the %-template as message together with bounded values of the arguments and the attributes
+of the record. the receiver formats the message when it's displayed (see render_message()).
+so the logging thread doesn't pay for the formatting and the receiver can filter by logger or source location
+
+arguments that json can represent are kept (strings are shortened). others are sent as their bounded repr
+"""
+import re
+import logging
+import typing as t
+from ..._typing import LogRecordInfo
+from .exception import bounded_repr
+
+
+# attributes every record has. the remaining ones were passed with extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", logging.INFO, "", 0, "", (), None))) \
+    | {'message', 'asctime', 'taskName'}
+
+_PLAIN = frozenset((type(None), bool, float))
+
+
+def bounded_value(value: t.Any, max_length: int) -> t.Any:
+    kind = type(value)
+    if kind in _PLAIN or (kind is int and value.bit_length() < 64):
+        return value
+    if kind is str:
+        return value if len(value) <= max_length else value[:max_length - 3] + "..."
+    return bounded_repr(value, max_length)
+
+
+def capture_record(record: logging.LogRecord, max_repr_length: int = 128) -> LogRecordInfo:
+    info = LogRecordInfo(
+        logger=record.name,
+        pathname=record.pathname,
+        lineno=record.lineno,
+        func=record.funcName or "",
+        process=record.process or 0,  # None if disabled (logging.logProcesses)
+        thread=record.thread or 0,
+        thread_name=record.threadName or "",
+    )
+    args = record.args
+    if args:
+        if isinstance(args, t.Mapping):  # logging.info("%(name)s", {'name': ...})
+            info['args'] = {str(key): bounded_value(value, max_repr_length) for key, value in args.items()}
+        else:
+            info['args'] = [bounded_value(value, max_repr_length) for value in args]
+    attributes = vars(record)
+    extra = attributes.keys() - _RECORD_ATTRIBUTES
+    if extra:
+        info['extra'] = {key: bounded_repr(attributes[key], max_repr_length) for key in sorted(extra)}
+    return info
+
+
+# %-conversion like %s, %-5d or %(name).3f
+_CONVERSION = re.compile(r"%(\([^)]*\))?[#0 +-]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?[diouxXeEfFgGcrsa]")
+
+
+def render_message(message: t.Mapping[str, t.Any]) -> str:
+    r"""
+    the message with the arguments of a structured log-record. like logging.LogRecord.getMessage()
+    """
+    record = message.get('record')
+    args = record.get('args') if record else None
+    if not args:
+        return message['message']
+    template = message['message']
+    args = tuple(args) if isinstance(args, list) else args
+    try:
+        return template % args
+    except (TypeError, ValueError, KeyError):  # e.g. a repr for %d
+        pass
+    try:
+        return _CONVERSION.sub(lambda match: f"%{match.group(1) or ''}s", template) % args
+    except (TypeError, ValueError, KeyError):
+        return f"{template} {args!r}"
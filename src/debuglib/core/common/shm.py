@@ -0,0 +1,319 @@
+# -*- coding=utf-8 -*-
+r"""
+shared-memory transport for clients on the same host as the server
+
+shm:///path/to/socket
+- connects to the unix domain socket of the server and executes the normal handshake (offering the feature 's')
+- if the server accepts it, the client sends the path of a ring-buffer file
+  > {len:2}{path}
+- the server maps that file (only a regular file of the same user as the client. see RingReader)
+  < 1 (mapped. all further frames are written into the ring-buffer instead of the socket)
+  < 0 (failed. the unix domain socket is used as is)
+- the socket is only used for wakeups (and to detect a closed connection):
+  the client sends WAKEUP if the server sleeps and the server sends SPACE if the client waits for free space
+- if the server doesn't accept 's' the unix domain socket is used as is
+
+the server copies the data once from the ring-buffer into the buffer of the connection
+(a frame can wrap around) and decodes the frames from there without copying them again.
+the server only asks for wakeups once the ring-buffer was empty for SLEEP_AFTER seconds.
+so a busy client doesn't make a syscall per write
+
+Ring-Buffer File:
+{magic:8}{capacity:8}{head:8}{tail:8}{sleeping:4}{waiting:4}...{data:capacity}
+- head: total number of bytes written (only changed by the client)
+- tail: total number of bytes read (only changed by the server)
+- sleeping: set by the server before it waits for the wakeup-byte
+- waiting: set by the client before it waits for free space
+"""
+import os
+import mmap
+import stat
+import time
+import struct
+import socket
+import select
+import tempfile
+import typing as t
+from .protocol import FEATURE_SHARED_MEMORY, recv_exactly
+from .transport import UnixTransport, TransportFallback, register_transport, peer_credentials
+
+
+MAGIC = b'DBGRING1'
+HEADER_SIZE = 64
+DEFAULT_CAPACITY = 4 * 1024 * 1024
+WAKEUP = b'w'
+SPACE = b's'
+RING_MAPPED = b'1'
+RING_FAILED = b'0'
+SLEEP_AFTER = 0.002  # seconds without data before the server sleeps (a wakeup costs the client a syscall)
+SPACE_WAIT = 0.05  # the client checks the ring-buffer at least this often while it waits for free space
+
+_CAPACITY = struct.Struct('=Q')  # offset 8
+_HEAD = struct.Struct('=Q')  # offset 16
+_TAIL = struct.Struct('=Q')  # offset 24
+_SLEEPING = struct.Struct('=I')  # offset 32
+_WAITING = struct.Struct('=I')  # offset 36
+OFFSET_CAPACITY = 8
+OFFSET_HEAD = 16
+OFFSET_TAIL = 24
+OFFSET_SLEEPING = 32
+OFFSET_WAITING = 36
+
+
+def _ring_directory() -> str:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class RingWriter:
+    r"""
+    the client (single producer) side of the ring-buffer
+    """
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        fd, self.path = tempfile.mkstemp(prefix="debuglib-", suffix=".ring", dir=_ring_directory())
+        try:
+            os.ftruncate(fd, HEADER_SIZE + capacity)
+            self._mm = mmap.mmap(fd, HEADER_SIZE + capacity)
+        finally:
+            os.close(fd)
+        self._mm[0:8] = MAGIC
+        _CAPACITY.pack_into(self._mm, OFFSET_CAPACITY, capacity)
+        self.capacity = capacity
+        self._head = 0
+
+    def close(self):
+        self._mm.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:  # the server already removed it
+            pass
+
+    def free(self) -> int:
+        return self.capacity - (self._head - _TAIL.unpack_from(self._mm, OFFSET_TAIL)[0])
+
+    def set_waiting(self, waiting: bool):
+        r"""
+        asks the server to send SPACE after it read from the ring-buffer
+        """
+        _WAITING.pack_into(self._mm, OFFSET_WAITING, int(waiting))
+
+    def write(self, data: t.Union[bytes, memoryview]) -> bool:
+        r"""
+        writes the data and returns whether the server should be woken up
+        data is only written as a whole. so len(data) has to be <= free()
+        """
+        mm = self._mm
+        size = len(data)
+        start = self._head % self.capacity
+        first = min(size, self.capacity - start)
+        mm[HEADER_SIZE + start:HEADER_SIZE + start + first] = data[:first]
+        if first < size:  # wrap around
+            mm[HEADER_SIZE:HEADER_SIZE + size - first] = data[first:]
+        self._head += size
+        # publish the data only after it was written
+        _HEAD.pack_into(mm, OFFSET_HEAD, self._head)
+        if _SLEEPING.unpack_from(mm, OFFSET_SLEEPING)[0]:
+            _SLEEPING.pack_into(mm, OFFSET_SLEEPING, 0)
+            return True
+        return False
+
+
+class RingReader:
+    r"""
+    the server (consumer) side of the ring-buffer
+
+    the path comes from the client. so it has to be a regular file (no symlink) that belongs to `owner`.
+    otherwise a client could make the server map and delete files it can't access itself
+    """
+    def __init__(self, path: str, owner: int):
+        fd = os.open(path, os.O_RDWR | getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_NONBLOCK', 0))
+        try:
+            info = os.fstat(fd)
+            if not stat.S_ISREG(info.st_mode):
+                raise ValueError("ring-buffer is not a regular file")
+            if info.st_uid != owner:
+                raise PermissionError(f"ring-buffer belongs to uid {info.st_uid} instead of {owner}")
+            size = info.st_size
+            if size < HEADER_SIZE:
+                raise ValueError("invalid ring-buffer file")
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if self._mm[0:8] != MAGIC:
+            self._mm.close()
+            raise ValueError("invalid ring-buffer file")
+        self.capacity = _CAPACITY.unpack_from(self._mm, OFFSET_CAPACITY)[0]
+        if HEADER_SIZE + self.capacity > size:
+            self._mm.close()
+            raise ValueError("invalid ring-buffer file")
+        # both sides have it mapped. so the file isn't needed anymore (if the path still points to it)
+        try:
+            current = os.stat(path, follow_symlinks=False)
+        except FileNotFoundError:
+            pass
+        else:
+            if (current.st_dev, current.st_ino) == (info.st_dev, info.st_ino):
+                os.unlink(path)
+        self._view = memoryview(self._mm)
+        self._tail = 0
+        self._last_data = time.monotonic()
+
+    def close(self):
+        self._view.release()
+        self._mm.close()
+
+    def available(self) -> int:
+        return _HEAD.unpack_from(self._mm, OFFSET_HEAD)[0] - self._tail
+
+    def prepare_wait(self, now: float) -> t.Optional[float]:
+        r"""
+        called before the server waits. returns how long it may wait for this ring-buffer
+        (0 if there is data. None if the client sends a wakeup)
+        """
+        if self.available():
+            return 0.0
+        idle = now - self._last_data
+        if idle < SLEEP_AFTER:  # more data is likely to follow. looking again is cheaper than a wakeup per write
+            return SLEEP_AFTER - idle
+        if _SLEEPING.unpack_from(self._mm, OFFSET_SLEEPING)[0]:  # still asleep (no write since)
+            return None
+        _SLEEPING.pack_into(self._mm, OFFSET_SLEEPING, 1)
+        if self.available():  # written before the client could see the flag
+            _SLEEPING.pack_into(self._mm, OFFSET_SLEEPING, 0)
+            return 0.0
+        return None
+
+    def space_requested(self) -> bool:
+        r"""
+        whether the client waits for free space (then the server has to send SPACE). resets the request
+        """
+        if not _WAITING.unpack_from(self._mm, OFFSET_WAITING)[0]:
+            return False
+        _WAITING.pack_into(self._mm, OFFSET_WAITING, 0)
+        return True
+
+    def read_into(self, buffer: bytearray) -> int:
+        r"""
+        appends all available data to the buffer and returns how many bytes that were
+        """
+        size = self.available()
+        if not size:
+            return 0
+        start = self._tail % self.capacity
+        first = min(size, self.capacity - start)
+        view = self._view
+        buffer += view[HEADER_SIZE + start:HEADER_SIZE + start + first]
+        if first < size:  # wrapped around
+            buffer += view[HEADER_SIZE:HEADER_SIZE + size - first]
+        self._tail += size
+        _TAIL.pack_into(self._mm, OFFSET_TAIL, self._tail)
+        self._last_data = time.monotonic()
+        return size
+
+
+class ShmConnection:
+    r"""
+    socket-like object for the client that writes into the ring-buffer
+    """
+    def __init__(self, sock: socket.socket, ring: RingWriter, timeout: t.Optional[float]):
+        self._sock = sock
+        self._ring = ring
+        self._timeout = 1.0 if timeout is None else timeout
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def close(self):
+        self._sock.close()
+        self._ring.close()
+
+    def sendall(self, data: bytes):
+        r"""
+        raises socket.timeout if the server doesn't make room in time
+        (dropping data would break the per-connection state of the encoder)
+        """
+        view = memoryview(data)
+        chunk_size = self._ring.capacity // 2
+        for index in range(0, len(view), chunk_size):
+            chunk = view[index:index + chunk_size]
+            self._wait_for_space(len(chunk))
+            if self._ring.write(chunk):
+                self._sock.sendall(WAKEUP)
+
+    def _wait_for_space(self, size: int):
+        r"""
+        waits for the SPACE of the server (the sending thread keeps the lock of the client. the frames are ordered)
+        """
+        ring = self._ring
+        if ring.free() >= size:
+            return
+        deadline = time.monotonic() + self._timeout
+        ring.set_waiting(True)
+        try:
+            self._sock.sendall(WAKEUP)  # in case the server sleeps
+            while ring.free() < size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("ring-buffer is full")
+                # bounded. the flags aren't synchronized. so a SPACE could be missed
+                readable, *_ = select.select([self._sock], [], [], min(remaining, SPACE_WAIT))
+                if readable and not self._sock.recv(64):  # SPACE (maybe of an earlier wait)
+                    raise ConnectionResetError("connection was closed by the server")
+        finally:
+            ring.set_waiting(False)
+
+
+class ShmTransport(UnixTransport):
+    scheme = "shm"
+    client_features = FEATURE_SHARED_MEMORY
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+
+    def activate(self, connection: socket.socket, features: bytes, timeout: t.Optional[float]):
+        if FEATURE_SHARED_MEMORY not in features:  # plain unix domain socket
+            return connection
+        ring = RingWriter(capacity=self.capacity)
+        path = ring.path.encode()
+        try:
+            connection.sendall(len(path).to_bytes(2, byteorder='big', signed=False) + path)
+            response = recv_exactly(connection, 1)
+        except BaseException:
+            ring.close()
+            raise
+        if response == RING_FAILED:  # e.g. the server runs as another user. the socket still works
+            ring.close()
+            return connection
+        if response != RING_MAPPED:
+            ring.close()
+            raise ConnectionError("the server didn't answer the ring-buffer")
+        return ShmConnection(connection, ring, timeout=timeout)
+
+    def format_address(self, address: str) -> str:
+        return f"shm://{address}"
+
+
+def accept_ring(connection: socket.socket) -> RingReader:
+    r"""
+    server side of the activation. reads the path and maps the ring-buffer
+    the file has to belong to the user of the client (or of the server if the platform can't tell)
+    raises TransportFallback if the ring-buffer can't be used (the client was told to use the socket)
+    """
+    length = int.from_bytes(recv_exactly(connection, 2), byteorder='big', signed=False)
+    path = recv_exactly(connection, length)
+    if len(path) != length:
+        raise ConnectionError("path of the ring-buffer was not received")
+    creds = peer_credentials(connection)
+    try:
+        ring = RingReader(path.decode(), owner=os.geteuid() if creds is None else creds[1])
+    except (OSError, ValueError) as error:
+        connection.sendall(RING_FAILED)
+        raise TransportFallback(f"failed to map the ring-buffer of the client: {error}") from error
+    try:
+        connection.sendall(RING_MAPPED)
+    except BaseException:
+        ring.close()
+        raise
+    return ring
+
+
+register_transport(ShmTransport())
@@ -0,0 +1,186 @@
+# -*- coding=utf-8 -*-
+r"""
+how the clients connect to the server
+
+- tcp: (host, port) or tcp://host:port
+- unix: unix:///path/to/socket (unix domain socket. client and server on the same host)
+- shm: shm:///path/to/socket (shared-memory ring-buffer next to a unix domain socket. see shm.py)
+
+other transports can be added with register_transport()
+"""
+import os
+import stat
+import socket
+import struct
+import asyncio
+import itertools
+import typing as t
+from ..._typing import ServerInfo, TransportServerInfo
+from .protocol import FEATURE_SHARED_MEMORY
+
+
+class TransportFallback(Exception):
+    r"""
+    raised by Transport.accept() if the connection continues without the transport's own setup (the client knows)
+    """
+
+
+class Transport:
+    scheme: str
+    client_features: bytes = b''  # additionally offered in the handshake
+    server_features: bytes = b''  # additionally accepted by the server
+
+    def activate(self, connection: socket.socket, features: bytes, timeout: t.Optional[float]):
+        r"""
+        called by the client after the handshake with the accepted features. returns the connection to write to
+        """
+        return connection
+
+    def accept(self, connection: socket.socket, rfile: t.BinaryIO, features: bytes):
+        r"""
+        called by the server after the handshake with the accepted features. returns an additional source of data
+        raises TransportFallback if the connection is used as is
+        """
+        return None
+
+    def connect(self, address, timeout: t.Optional[float]) -> socket.socket:
+        raise NotImplementedError()
+
+    async def open_connection(self, address) -> t.Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        raise NotImplementedError()
+
+    def create_server(self, address) -> socket.socket:
+        raise NotImplementedError()
+
+    def close_server(self, server: socket.socket, address):
+        server.close()
+
+    def format_address(self, address) -> str:
+        raise NotImplementedError()
+
+    def format_peer(self, connection: socket.socket, peer) -> str:
+        raise NotImplementedError()
+
+
+class TCPTransport(Transport):
+    scheme = "tcp"
+
+    def connect(self, address: t.Tuple[str, int], timeout: t.Optional[float]) -> socket.socket:
+        return socket.create_connection(address, timeout=timeout)
+
+    async def open_connection(self, address: t.Tuple[str, int]):
+        return await asyncio.open_connection(*address)
+
+    def create_server(self, address: t.Tuple[str, int]) -> socket.socket:
+        return socket.create_server(address=address)
+
+    def format_address(self, address: t.Tuple[str, int]) -> str:
+        return f"{address[0]}:{address[1]}"
+
+    def format_peer(self, connection: socket.socket, peer: t.Tuple[str, int]) -> str:
+        return f"{peer[0]}:{peer[1]}"  # ip:port
+
+
+class UnixTransport(Transport):
+    scheme = "unix"
+    server_features = FEATURE_SHARED_MEMORY  # the clients can only offer it on the same host
+
+    def connect(self, address: str, timeout: t.Optional[float]) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(address)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def open_connection(self, address: str):
+        return await asyncio.open_unix_connection(address)
+
+    def create_server(self, address: str) -> socket.socket:
+        # remove the socket-file of a previous server that wasn't closed properly
+        try:
+            if stat.S_ISSOCK(os.stat(address).st_mode):
+                os.unlink(address)
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(address)
+            server.listen()
+        except BaseException:
+            server.close()
+            raise
+        return server
+
+    def close_server(self, server: socket.socket, address: str):
+        if server.fileno() != -1:
+            server.close()
+            try:
+                os.unlink(address)
+            except FileNotFoundError:
+                pass
+
+    def format_address(self, address: str) -> str:
+        return f"unix://{address}"
+
+    def accept(self, connection: socket.socket, rfile: t.BinaryIO, features: bytes):
+        if FEATURE_SHARED_MEMORY not in features:
+            return None
+        from .shm import accept_ring
+        return accept_ring(connection)
+
+    def format_peer(self, connection: socket.socket, peer) -> str:
+        # the process can have several connections (e.g. the async client). so they are numbered
+        pid = peer_pid(connection)
+        number = next(_unix_peers)
+        return f"unix:{pid}#{number}" if pid is not None else f"unix:#{number}"
+
+
+_unix_peers = itertools.count(1)  # the clients have no address (peer is '')
+
+
+def peer_credentials(connection: socket.socket) -> t.Optional[t.Tuple[int, int, int]]:
+    r"""
+    (pid, uid, gid) of the other side of a unix domain socket (if the platform supports it)
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    try:
+        creds = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    except OSError:
+        return None
+    return struct.unpack('3i', creds)
+
+
+def peer_pid(connection: socket.socket) -> t.Optional[int]:
+    r"""
+    process-id of the other side of a unix domain socket (if the platform supports it)
+    """
+    creds = peer_credentials(connection)
+    return None if creds is None else creds[0] or None
+
+
+TRANSPORTS: t.Dict[str, Transport] = {}
+
+
+def register_transport(transport: Transport):
+    TRANSPORTS[transport.scheme] = transport
+    return transport
+
+
+register_transport(TCPTransport())
+register_transport(UnixTransport())
+
+
+def get_transport(server_info: ServerInfo) -> t.Tuple[Transport, t.Any]:
+    r"""
+    returns the transport and the address for it
+    """
+    if isinstance(server_info, TransportServerInfo):
+        try:
+            return TRANSPORTS[server_info.scheme], server_info.address
+        except KeyError:
+            raise ValueError(f"unknown transport: {server_info.scheme!r}") from None
+    return TRANSPORTS["tcp"], server_info
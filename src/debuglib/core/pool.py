@@ -0,0 +1,127 @@
+# -*- coding=utf-8 -*-
+r"""
+process-wide registry of shared clients
+
+every front-end (Decorator, monitor(), logging-handlers, excepthook) acquires its client from here.
+so all of them share one connection (and one writer-thread) per server and options.
+
+the key is (client-type, server, options) and not only the server as the options can't be merged:
+- AsyncDebugClient writes from the event-loop and DebugClient from its writer-thread.
+  they can't share a socket (the async one only connects once it's used by a coroutine)
+- non_blocking, batch and spool change when and whether a message is delivered
+  (e.g. the NonBlockingDebugHandler must never block the logging thread)
+- rate_limit and sample_rate are part of the client. another front-end with other limits would change them
+front-ends that pass the same options (the default for most of them) share the connection
+
+- acquire_client() returns the shared client and increases its reference-count
+- release_client() decreases it. the client is closed once nobody uses it anymore
+- after os.fork() the clients reconnect on their own in the child (see BaseClient._after_fork)
+- all clients are closed at interpreter exit (or with shutdown_clients())
+"""
+import os
+import atexit
+import threading
+import typing as t
+from .._typing import DEFAULT_VALUE, ServerInfoRaw
+from .common import extract_server_info
+from .client import DebugClient
+from .client._base import BaseClient
+
+
+T_CLIENT = t.TypeVar('T_CLIENT', bound=BaseClient)
+
+
+class _Entry(t.NamedTuple):
+    key: tuple
+    client: BaseClient
+
+
+class ClientPool:
+    _lock: threading.Lock
+    _entries: t.Dict[tuple, _Entry]
+    _references: t.Dict[int, int]  # id(client) -> reference-count
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._references = {}
+
+    def acquire(self, server_info: ServerInfoRaw = DEFAULT_VALUE, *,
+                client_type: t.Type[T_CLIENT] = DebugClient, **options) -> T_CLIENT:
+        r"""
+        returns the shared client for the server and options (the client is created on first use)
+
+        :param server_info: information about the server
+        :param client_type: DebugClient or AsyncDebugClient
+        :param options: keyword-arguments for the client (DEFAULT_VALUE is ignored)
+        """
+        options = {name: value for name, value in options.items() if value is not DEFAULT_VALUE}
+        key = (client_type, extract_server_info(server_info),
+               tuple(sorted((name, _freeze(value)) for name, value in options.items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                client = client_type(server_info=server_info, **options)
+                entry = self._entries[key] = _Entry(key=key, client=client)
+                self._references[id(client)] = 0
+            self._references[id(entry.client)] += 1
+            return entry.client
+
+    def release(self, client: BaseClient):
+        r"""
+        gives back a client that was returned by acquire(). the last release closes it
+        """
+        with self._lock:
+            references = self._references.get(id(client))
+            if references is None:  # not from this pool (or already shut down)
+                return
+            if references > 1:
+                self._references[id(client)] = references - 1
+                return
+            del self._references[id(client)]
+            for key, entry in list(self._entries.items()):
+                if entry.client is client:
+                    del self._entries[key]
+        client.close()
+
+    def shutdown(self):
+        r"""
+        closes all clients of the pool (they reconnect if they are used again)
+        """
+        with self._lock:
+            clients = [entry.client for entry in self._entries.values()]
+            self._entries.clear()
+            self._references.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as error:  # noqa
+                client._handle_error(error)
+
+    def _after_fork(self):
+        # the lock could have been held by another thread of the parent
+        self._lock = threading.Lock()
+
+
+def _freeze(value: t.Any) -> t.Hashable:
+    # e.g. rate_limit={'INFO': 10}
+    if isinstance(value, t.Mapping):
+        return tuple(sorted((name, _freeze(item)) for name, item in value.items()))
+    if isinstance(value, (list, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+pool = ClientPool()
+
+acquire_client = pool.acquire
+release_client = pool.release
+
+
+@atexit.register
+def shutdown_clients():
+    pool.shutdown()
+
+
+if hasattr(os, 'register_at_fork'):  # not on windows
+    os.register_at_fork(after_in_child=pool._after_fork)
@@ -3,23 +3,25 @@ r"""
 
 """
 import sys
+import time
 import socket
 import select
 import threading
 import typing as t
 # noinspection PyPep8Naming
 from ... import __version__ as DEBUGLIB_VERSION
-from ..._packages import format_exception, json
+from ..._packages import format_exception
 from ..._typing import DEFAULT_VALUE, ServerInfoRaw, Message
-from ..common import extract_server_info
+from ..common import (
+    extract_server_info, get_transport, HANDSHAKE_HEAD, SERVER_FEATURES, FEATURE_PROCESS_ID, PROCESS_ID_SIZE,
+    build_handshake_response, negotiate_features, recv_exactly, Decoder,
+)
+from ..common.transport import TransportFallback, peer_pid
+from ..common.shm import RingReader, SPACE
 
 
-# BODY_PARSER = {
-#     b'j': json.loads,
-# }
-# if msgpack is not None:
-#     BODY_PARSER[b'm'] = msgpack.loads
-
+MESSAGE_KEYS = frozenset(Message.__annotations__)  # incl. the optional ones
+HANDSHAKE_TIMEOUT = 5.0  # seconds for the whole handshake (incl. the setup of the transport)
 
 T_CB_CONNECTION_OPEN = t.Callable[[str], None]
 T_CB_CONNECTION_CLOSED = t.Callable[[str], None]
@@ -27,9 +29,18 @@ T_CB_MESSAGE = t.Callable[[Message, str], None]
 T_CB_ERROR = t.Callable[[Exception], None]
 
 
+class Connection(t.NamedTuple):
+    sock: socket.socket
+    client: str
+    buffer: bytearray  # received but not yet handled data
+    decoder: Decoder  # per connection state (e.g. table of interned strings)
+    ring: t.Optional[RingReader]  # shared-memory. the socket is then only used for wakeups
+    pid: t.Optional[int]  # process-id of the client (if it's known)
+
+
 class DebugServer:
     _server: socket.socket
-    _connections: t.Dict[int, t.Tuple[socket.socket, str, t.BinaryIO]]
+    _connections: t.Dict[int, Connection]
     _on_connection_open: t.List[T_CB_CONNECTION_OPEN]
     _on_connection_closed: t.List[T_CB_CONNECTION_CLOSED]
     _on_message: t.List[T_CB_MESSAGE]
@@ -39,7 +50,8 @@ class DebugServer:
     _is_shut_down: threading.Event
 
     def __init__(self, server_info: ServerInfoRaw = DEFAULT_VALUE, *, skip_version_check: bool = DEFAULT_VALUE):
-        self._server = socket.create_server(address=extract_server_info(server_info))
+        self._transport, self._address = get_transport(extract_server_info(server_info))
+        self._server = self._transport.create_server(self._address)
         self._connections = {}
         self._on_message = []
         self._on_error = []
@@ -53,14 +65,26 @@ class DebugServer:
         self.close()
 
     def close(self):
-        self._server.close()
+        self._transport.close_server(self._server, self._address)
+
+    @property
+    def address(self) -> str:
+        return self._transport.format_address(self._address)
 
     def serve_forever(self):
         self._shutdown_requested = False
         self._is_shut_down.clear()
         try:
             while not self._shutdown_requested:
-                readable, *_ = select.select([self._server, *self._connections], [], [], 0.5)
+                # shared-memory connections with data don't need a wakeup. so don't wait for it
+                now = time.monotonic()
+                rings = [fd for fd, connection in self._connections.items() if connection.ring is not None]
+                timeout = 0.5
+                for fd in rings:
+                    wait = self._connections[fd].ring.prepare_wait(now)
+                    if wait is not None and wait < timeout:
+                        timeout = wait
+                readable, *_ = select.select([self._server, *self._connections], [], [], timeout)
                 # bpo-35017: shutdown() called during select(), exit immediately.
                 if self._shutdown_requested:
                     break
@@ -68,7 +92,10 @@ class DebugServer:
                     if fd is self._server:
                         self._handle_new_connection()
                     else:
-                        self._handle_one_message(fd)
+                        self._handle_incoming(fd)
+                for fd in rings:
+                    if fd not in readable and fd in self._connections and self._connections[fd].ring.available():
+                        self._handle_incoming(fd, readable=False)
         finally:
             self._shutdown_requested = False
             self._is_shut_down.set()
@@ -93,6 +120,15 @@ class DebugServer:
         self._on_error.append(callback)
         return callback
 
+    def pid_of(self, client: str) -> t.Optional[int]:
+        r"""
+        process-id of a connected client (None if it's unknown. e.g. an older client over tcp)
+        """
+        for connection in self._connections.values():
+            if connection.client == client:
+                return connection.pid
+        return None
+
     def _handle_error(self, error: Exception):
         if not self._on_error:  # no error handler registered
             sys.stderr.write('\n'.join(format_exception(type(error), error, error.__traceback__)))
@@ -111,72 +147,137 @@ class DebugServer:
 
     def _handle_new_connection(self):
         connection, client_info = self._server.accept()
-        client: str = f"{client_info[0]}:{client_info[1]}"  # ip:port
-        rfile = connection.makefile('rb', -1)
-
-        # @handshake
-        # check for the debuglib protocol
-        head = b'DEBUGLIB\0'
-        if rfile.read(len(head)) != head:
-            connection.close()
-            self._handle_error(ConnectionError("bad connection attempt was made"))
-            return
-        # compare versions (could be improved to only check major.minor)
-        version_length = int.from_bytes(rfile.read(1), byteorder='big', signed=False)
-        version = rfile.read1(version_length).decode()
-        if not self._skip_version_check and version != DEBUGLIB_VERSION:
+        client: str = self._transport.format_peer(connection, client_info)  # e.g. ip:port
+        # the server is single-threaded. a client that stops in the middle of the handshake mustn't block it
+        connection.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            features, pid, ring = self._handshake(connection)
+        except ConnectionError as error:  # rejected
             connection.close()
-            self._handle_error(ConnectionError(f"version mismatch ({version} != {DEBUGLIB_VERSION})"))
+            self._handle_error(error)
             return
-        # trailing head to ensure everything was read correctly
-        if rfile.read(1) != b'\0':
+        except (OSError, ValueError) as error:  # incl. the timeout
             connection.close()
-            self._handle_error(ConnectionError("trailing null-byte was not found"))
+            self._handle_error(ConnectionError(f"failed to set up the connection: {error}"))
             return
-        connection.sendall(b'1')  # accept the connection
+        connection.settimeout(None)
 
-        for callback in self._on_connection_open:
+        self._connections[connection.fileno()] = Connection(
+            sock=connection, client=client, buffer=bytearray(), decoder=Decoder(features=features), ring=ring, pid=pid,
+        )
+        for callback in self._on_connection_open:  # after it's registered (see pid_of())
             self._call_no_error(callback, client)
-        self._connections[connection.fileno()] = (connection, client, rfile)
-
-    # def _handle_one_message(self, fd: int):
-    #     sock, client, rfile = self._connections[fd]
-    #     body_format_identifier = rfile.read(1)
-    #     if not body_format_identifier:  # b'' connection was closed
-    #         self._close_connection(fd=fd)
-    #         return
-    #
-    #     length = int.from_bytes(rfile.read(2), byteorder='big', signed=False)
-    #     body = rfile.read(length)
-    #     body_parser = BODY_PARSER.get(body_format_identifier)
-    #     if body_parser is None:  # unsupported
-    #         self._handle_error(LookupError(f"unknown parser code received: {body_format_identifier.decode()!r}"))
-    #         # todo: add error feedback for the client so he doesn't connect again
-    #         # self._close_connection(fd=fd)  # assuming the format will stay the same
-    #         return
-    #
-    #     message: Message = body_parser(body)
-    #     for callback in self._on_message:
-    #         self._call_no_error(callback, message, client)
-
-    def _handle_one_message(self, fd: int):
-        sock, client, rfile = self._connections[fd]
-        body_format_identifier = rfile.read(1)
-        if not body_format_identifier:  # b'' -> connection was closed
+
+    def _handshake(self, connection: socket.socket) -> t.Tuple[bytes, t.Optional[int], t.Optional[RingReader]]:
+        r"""
+        returns the accepted features, the process-id and the ring-buffer (shm://) of the client
+        raises ConnectionError if the client is rejected
+        """
+        rfile = connection.makefile('rb', -1)
+        try:
+            # @handshake
+            # check for the debuglib protocol
+            if rfile.read(len(HANDSHAKE_HEAD)) != HANDSHAKE_HEAD:
+                raise ConnectionError("bad connection attempt was made")
+            # compare versions (could be improved to only check major.minor)
+            version_length = int.from_bytes(rfile.read(1), byteorder='big', signed=False)
+            version = rfile.read1(version_length).decode()
+            if not self._skip_version_check and version != DEBUGLIB_VERSION:
+                raise ConnectionError(f"version mismatch ({version} != {DEBUGLIB_VERSION})")
+            # trailing head to ensure everything was read correctly
+            if rfile.read(1) != b'\0':
+                raise ConnectionError("trailing null-byte was not found")
+            # features the client would like to use
+            features_length = int.from_bytes(rfile.read(1), byteorder='big', signed=False)
+            features = negotiate_features(
+                rfile.read(features_length), SERVER_FEATURES + self._transport.server_features,
+            )
+            connection.sendall(build_handshake_response(features))  # accept the connection
+            if FEATURE_PROCESS_ID in features:
+                # from the socket as the client sends the frames right after it (rfile could buffer them)
+                pid_bytes = recv_exactly(connection, PROCESS_ID_SIZE)
+                if len(pid_bytes) != PROCESS_ID_SIZE:
+                    raise ConnectionError("process-id was not received")
+                pid = int.from_bytes(pid_bytes, byteorder='big', signed=False)
+            else:  # older client
+                pid = peer_pid(connection) if connection.family == socket.AF_UNIX else None
+            try:
+                ring = self._transport.accept(connection, rfile, features)
+            except TransportFallback as error:  # e.g. the ring-buffer of another user. the socket is used instead
+                self._handle_error(error)
+                ring = None
+        finally:
+            rfile.close()  # the client waits for the acceptance. so nothing else was buffered (see the process-id)
+        return features, pid, ring
+
+    def _handle_incoming(self, fd: int, readable: bool = True):
+        connection = self._connections[fd]
+        data = b''
+        closed = False
+        if readable:
+            try:
+                data = connection.sock.recv(65536)
+            except socket.error:
+                pass
+            closed = not data  # b'' -> connection was closed
+        buffer = connection.buffer
+        if connection.ring is not None:  # the received data were only wakeups
+            connection.ring.read_into(buffer)  # (also what was written before the connection was closed)
+            if not closed and connection.ring.space_requested():
+                try:
+                    connection.sock.sendall(SPACE)
+                except OSError:  # closed. noticed by the next recv()
+                    pass
+        elif closed:
             self._close_connection(fd=fd)
             return
+        else:
+            buffer += data
+        # the client may send multiple messages at once (batching). so handle everything that is complete
+        offset = 0
+        try:
+            while True:
+                consumed = self._handle_one_message(connection, offset)
+                if not consumed:
+                    break
+                offset += consumed
+        except Exception as error:  # e.g. struct.error of a truncated body. the stream can't be recovered
+            # (the callbacks can't get here. see _call_no_error()) only this connection is closed
+            self._handle_error(ConnectionError(f"invalid data from {connection.client}: {error!r}"))
+            self._close_connection(fd=fd)
+            return
+        del buffer[:offset]
+        if closed:
+            self._close_connection(fd=fd)
 
-        length = int.from_bytes(rfile.read(2), byteorder='big', signed=False)
-        body = rfile.read(length)
-
-        message: Message = self.validate_message(json.loads(body))
+    def _handle_one_message(self, connection: Connection, offset: int) -> int:
+        r"""
+        handles the message at the offset and returns the number of consumed bytes (0 if the message is incomplete)
+        """
+        buffer = connection.buffer
+        frame = connection.decoder.read_frame(buffer, offset)
+        if frame is None:
+            return 0
+        body_format_identifier, start, end = frame
+
+        # decoded without copying the body. the view has to be released before the buffer is resized
+        with memoryview(buffer)[start:end] as body:
+            try:
+                raw = connection.decoder.decode(body_format_identifier, body)
+            except LookupError as error:  # unsupported format or unknown string-id
+                self._handle_error(error)
+                return end - offset  # the length is known. so only this message is skipped
+
+        message: Message = self.validate_message(raw)
         for callback in self._on_message:
-            self._call_no_error(callback, message, client)
+            self._call_no_error(callback, message, connection.client)
+        return end - offset
 
     def _close_connection(self, fd: int):
-        sock, client, rfile = self._connections[fd]
-        rfile.close()
+        sock, client, _buffer, _decoder, ring, _pid = self._connections[fd]
         sock.close()
+        if ring is not None:
+            ring.close()
         del self._connections[fd]
         for callback in self._on_connection_closed:
             self._call_no_error(callback, client)
@@ -191,7 +292,7 @@ class DebugServer:
             timestamp=time.time()
         )
 
-        unknown_keys = set(raw) - set(message)
+        unknown_keys = set(raw) - MESSAGE_KEYS
         if unknown_keys:
             self._handle_error(KeyError(f"Unknown keys received: {', '.join(unknown_keys)}"))
             # for key in unknown_keys:
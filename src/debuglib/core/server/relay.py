@@ -0,0 +1,96 @@
+# -*- coding=utf-8 -*-
+r"""
+relay for many processes on one host (e.g. the workers of gunicorn or multiprocessing)
+
+the processes connect to the relay (best via unix domain socket or shm://) instead of the debug-server.
+the relay forwards their messages over one connection with batched writes.
+every message is tagged with the connection it came from (`peer`) and the process-id (`pid`).
+the clients send their process-id in the handshake. so it's also known for tcp
+the debug-server receives normal messages. so all callbacks of DebugServer work as before
+
+$ debuglib relay --unix /tmp/debuglib.sock --upstream tcp://debug-host:35353
+"""
+import typing as t
+from ..._typing import DEFAULT_VALUE, ServerInfoRaw, Message
+from ..common import extract_server_info
+from ..client import DebugClient
+from . import DebugServer
+
+
+class Relay:
+    def __init__(self, server_info: ServerInfoRaw = DEFAULT_VALUE, upstream: ServerInfoRaw = DEFAULT_VALUE,
+                 *, timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
+                 batch_delay: float = DEFAULT_VALUE, spool: t.Union[bool, str] = DEFAULT_VALUE):
+        r"""
+        :param server_info: where the local processes connect to
+        :param upstream: the debug-server (or the next relay)
+        :param timeout: socket timeout of the upstream connection
+        :param connection_attempt_delta: delta between connection attempts to the upstream
+        :param batch_delay: maximum time in seconds a message is held back to be written together with others
+        :param spool: keep the messages on disk while the upstream is unreachable (see DebugClient)
+        """
+        self._server = DebugServer(server_info=extract_server_info(server_info))
+        self._server.on_connection_open(self.on_connection_open)
+        self._server.on_connection_closed(self.on_connection_closed)
+        self._server.on_message(self.on_message)
+        self._client = DebugClient(
+            server_info=upstream, timeout=timeout, connection_attempt_delta=connection_attempt_delta,
+            batch=True, batch_delay=batch_delay, spool=spool,
+            deduplicate=False,  # already done by the processes
+        )
+        self._pids: t.Dict[str, t.Optional[int]] = {}  # peer -> process-id
+
+    @property
+    def address(self) -> str:
+        return self._server.address
+
+    def on_error(self, callback: t.Callable[[Exception], None]):
+        r"""
+        errors of the local server and of the upstream connection
+        """
+        self._server.on_error(callback)
+        self._client.on_error(callback)
+        return callback
+
+    def run(self):
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            self._server.shutdown()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+    def close(self):
+        self._server.close()
+        self._client.close()  # writes what is still buffered
+
+    def on_connection_open(self, client: str):
+        pid = self._pids[client] = self._server.pid_of(client)
+        self._client.send_message(self._notice(f"{client} connected to the relay", client, pid))
+
+    def on_connection_closed(self, client: str):
+        pid = self._pids.pop(client, None)
+        self._client.send_message(self._notice(f"{client} disconnected from the relay", client, pid))
+
+    def on_message(self, message: Message, client: str):
+        if 'peer' not in message:  # otherwise it came through another relay first
+            message['peer'] = client
+            pid = self._pids.get(client)
+            if pid is not None:
+                message['pid'] = pid
+        self._client.send_message(message)
+
+    def _notice(self, text: str, client: str, pid: t.Optional[int]) -> Message:
+        extra = dict(peer=client) if pid is None else dict(peer=client, pid=pid)
+        return self._client.build_message(message=text, level="DEBUG", extra=extra)
+
+
+def source_of(message: t.Mapping[str, t.Any], client: str) -> str:
+    r"""
+    the connection the message came from. incl. the connection at the relay if it was relayed
+    """
+    peer = message.get('peer')
+    return client if peer is None else f"{client}/{peer}"
@@ -0,0 +1,70 @@
+# -*- coding=utf-8 -*-
+r"""
+export of the received spans (see Decorator.monitor()) as chrome trace-events
+
+the file can be opened with https://ui.perfetto.dev or chrome://tracing
+every client is a process and every thread (or asyncio-task) of it a track
+
+recorder = TraceRecorder()
+server.on_message(recorder.on_message)
+...
+recorder.export("trace.json")
+"""
+import json
+import collections
+import typing as t
+from ..._typing import Message
+from .relay import source_of
+
+
+class TraceRecorder:
+    r"""
+    keeps the last `max_events` spans
+    """
+    dropped: int  # spans that didn't fit anymore
+
+    def __init__(self, max_events: int = 1_000_000):
+        self._events: t.Deque[dict] = collections.deque(maxlen=max_events)
+        self._processes: t.Dict[str, int] = {}  # client -> pid in the trace
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def on_message(self, message: Message, client: str):
+        span = message.get('span')
+        if span is None:
+            return
+        client = source_of(message, client)  # every process behind a relay is its own process
+        pid = self._processes.get(client)
+        if pid is None:
+            pid = self._processes[client] = len(self._processes) + 1
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        args = dict(span=f"{span['id']:x}", message=message['message'])
+        if span['parent'] is not None:
+            args['parent'] = f"{span['parent']:x}"
+        if message['exception_info']:
+            args['exception'] = f"{message['exception_info']['type']}: {message['exception_info']['value']}"
+        self._events.append(dict(
+            name=span['name'], cat="call", ph="X",
+            ts=span['start'] / 1000, dur=span['duration'] / 1000,  # microseconds
+            pid=pid, tid=span['thread'], args=args,
+        ))
+
+    def build(self) -> dict:
+        r"""
+        the trace in the chrome trace-event format
+        """
+        metadata = [
+            dict(name="process_name", ph="M", pid=pid, tid=0, args=dict(name=client))
+            for client, pid in self._processes.items()
+        ]
+        return dict(traceEvents=metadata + list(self._events), displayTimeUnit="ns")
+
+    def export(self, file: t.Union[str, t.TextIO]):
+        if isinstance(file, str):
+            with open(file, 'w') as fp:
+                json.dump(self.build(), fp)
+        else:
+            json.dump(self.build(), file)
@@ -15,3 +15,4 @@ my_function(1, 2)
     > ValueError: bad numbers
 """
 from .decorator import Decorator, monitor
+from ._instrument import Instrumentation
@@ -0,0 +1,150 @@
+# -*- coding=utf-8 -*-
+r"""
+aggregation of the calls of hot functions (see Decorator.monitor(aggregate=True))
+
+every function has a histogram with logarithmic buckets (like HdrHistogram):
+values below 2**SUB_BITS have their own bucket, above that every power of two is split into 2**(SUB_BITS-1)
+linear sub-buckets. so a percentile is accurate to 1/2**(SUB_BITS-1) (~3%) with a few hundred buckets at most.
+"""
+import time
+import threading
+import typing as t
+from .._typing import LatencySummary
+
+
+SUB_BITS = 6
+_HALF = 1 << (SUB_BITS - 1)
+
+
+def bucket_index(value: int) -> int:
+    shift = value.bit_length() - SUB_BITS
+    if shift <= 0:
+        return value
+    return shift * _HALF + (value >> shift)
+
+
+def bucket_value(index: int) -> int:
+    r"""
+    middle of the values in the bucket
+    """
+    if index < 2 * _HALF:
+        return index
+    shift = index // _HALF - 1
+    return ((index - shift * _HALF) << shift) + (1 << (shift - 1))
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'errors', 'total', 'max')
+
+    def __init__(self):
+        self.counts: t.Dict[int, int] = {}  # bucket-index -> count (sparse)
+        self.count = 0
+        self.errors = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int, failed: bool = False):
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if failed:
+            self.errors += 1
+
+    def percentiles(self, *percents: float) -> t.List[int]:
+        r"""
+        percents in ascending order
+        """
+        results = []
+        targets = iter(percents)
+        target = next(targets, None)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while target is not None and seen >= self.count * target / 100:
+                results.append(min(bucket_value(index), self.max))
+                target = next(targets, None)
+            if target is None:
+                break
+        return results
+
+    def summary(self) -> LatencySummary:
+        p50, p90, p99 = self.percentiles(50, 90, 99)
+        return LatencySummary(
+            count=self.count, errors=self.errors, mean=self.total // self.count,
+            p50=p50, p90=p90, p99=p99, max=self.max,
+        )
+
+
+class LatencyAggregator:
+    r"""
+    thread-safe. collects the durations of all functions of a Decorator and hands out one summary per interval
+    """
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._histograms: t.Dict[str, Histogram] = {}
+        self._started = time.monotonic()
+
+    def record(self, name: str, duration_ns: int, failed: bool = False) -> t.Optional[t.Dict[str, t.Any]]:
+        r"""
+        returns the extra-fields of the summary-message if the interval is over (the caller sends it)
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(duration_ns, failed)
+            if time.monotonic() - self._started < self.interval:
+                return None
+            return self._take()
+
+    def take(self) -> t.Optional[t.Dict[str, t.Any]]:
+        r"""
+        returns the extra-fields of the summary-message of what was collected so far (None if nothing)
+        """
+        with self._lock:
+            return self._take()
+
+    def take_due(self) -> t.Optional[t.Dict[str, t.Any]]:
+        r"""
+        like take() but only if the interval is over (e.g. the functions weren't called since)
+        """
+        with self._lock:
+            if time.monotonic() < self.next_due:
+                return None
+            return self._take()
+
+    @property
+    def next_due(self) -> float:
+        r"""
+        time.monotonic() when the current interval is over
+        """
+        return self._started + self.interval
+
+    def _take(self) -> t.Optional[t.Dict[str, t.Any]]:
+        # requires the lock
+        now = time.monotonic()
+        histograms, self._histograms = self._histograms, {}
+        interval, self._started = now - self._started, now
+        if not histograms:
+            return None
+        return dict(
+            latencies={name: histogram.summary() for name, histogram in histograms.items()},
+            interval=round(interval, 3),
+        )
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._started = time.monotonic()
+
+
+def format_latencies(summary: t.Mapping[str, t.Any]) -> str:
+    latencies = summary['latencies']
+    calls = sum(latency['count'] for latency in latencies.values())
+    functions = "function" if len(latencies) == 1 else "functions"
+    return f"latencies of {len(latencies)} {functions} ({calls} calls in {summary['interval']:.1f}s)"
@@ -0,0 +1,284 @@
+# -*- coding=utf-8 -*-
+r"""
+instrumentation of whole modules and classes without wrapping the functions (see Decorator.monitor_module())
+
+- python 3.12+: sys.monitoring (PEP 669). PY_START and PY_RETURN only for the selected code-objects
+  and PY_UNWIND (can only be set globally) filtered by the code-object
+- older versions: sys.setprofile() filtered by the code-object. slower as it's called for every function
+  of the program and only applies to the current and new threads
+
+the backend calls the hooks of the Instrumentation:
+    hooks.start(frame, info) -> state (or None if the call isn't reported)
+    hooks.returned(frame, info, state, value)
+    hooks.failed(frame, info, state, exception)  # exception is None if the backend doesn't know it
+    hooks.dropped(info, state)  # the call was still running when the instrumentation was disabled
+"""
+import os
+import sys
+import dis
+import types
+import inspect
+import threading
+import typing as t
+
+
+_PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CO_SKIPPED = inspect.CO_GENERATOR | inspect.CO_ASYNC_GENERATOR  # can be left unfinished
+
+
+class _Target(t.NamedTuple):
+    hooks: t.Any
+    info: t.Any  # passed to the hooks
+
+
+def collect_functions(target: t.Union[types.ModuleType, type], submodules: bool = True) -> t.List[types.FunctionType]:
+    r"""
+    functions and methods that are defined in the module (or its already imported submodules) or the class
+
+    decorated functions are unwrapped (inspect.unwrap()). code of another file is skipped
+    (e.g. the shared wrapper of a decorator that doesn't set __wrapped__)
+    """
+    if isinstance(target, types.ModuleType):
+        modules = [target]
+        if submodules and hasattr(target, '__path__'):  # package
+            prefix = f"{target.__name__}."
+            modules.extend(module for name, module in list(sys.modules.items())
+                           if name.startswith(prefix) and module is not None)
+        namespaces = []
+        for module in modules:
+            filename = _source_file(module)
+            for value in list(vars(module).values()):
+                if getattr(value, '__module__', None) != module.__name__:  # imported from elsewhere
+                    continue
+                namespaces.append((value, filename))
+    else:
+        namespaces = [(target, _source_file(sys.modules.get(target.__module__)))]
+    functions = {}
+    while namespaces:
+        value, filename = namespaces.pop()
+        if isinstance(value, type):
+            namespaces.extend(
+                (member, filename) for member in vars(value).values()
+                if not isinstance(member, type) or member.__qualname__.startswith(f"{value.__qualname__}.")
+            )
+            continue
+        if isinstance(value, (staticmethod, classmethod)):
+            value = value.__func__
+        elif isinstance(value, property):
+            namespaces.extend((accessor, filename) for accessor in (value.fget, value.fset, value.fdel)
+                              if accessor is not None)
+            continue
+        try:
+            value = inspect.unwrap(value)  # e.g. functools.wraps() or functools.lru_cache()
+        except ValueError:  # cycle of __wrapped__
+            continue
+        if not isinstance(value, types.FunctionType):
+            continue
+        code = value.__code__
+        if code.co_flags & _CO_SKIPPED or code.co_filename.startswith(_PACKAGE_DIRECTORY):  # incl. @monitor()
+            continue
+        if filename is not None and _normalize(code.co_filename) != filename:
+            continue
+        functions[code] = value
+    return list(functions.values())
+
+
+def _source_file(module: t.Optional[types.ModuleType]) -> t.Optional[str]:
+    filename = getattr(module, '__file__', None)
+    return None if filename is None else _normalize(filename)
+
+
+def _normalize(filename: str) -> str:
+    return os.path.normcase(os.path.abspath(filename))
+
+
+class Instrumentation:
+    r"""
+    returned by Decorator.monitor_module()/monitor_class(). the instrumentation can be switched on and off at runtime
+
+    with instrumentation:  # enabled inside the block
+        ...
+    """
+
+    def __init__(self, targets: t.Mapping[types.CodeType, t.Any], hooks: t.Any):
+        self._targets = {code: _Target(hooks, info) for code, info in targets.items()}
+        self._enabled = False
+
+    def __len__(self):
+        r"""
+        number of instrumented functions
+        """
+        return len(self._targets)
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disable()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def enable(self):
+        if not self._enabled and self._targets:
+            get_backend().add(self._targets)
+            self._enabled = True
+
+    def disable(self):
+        r"""
+        calls that are running at the moment aren't reported (their spans are ended)
+        """
+        if self._enabled:
+            get_backend().remove(self._targets)
+            self._enabled = False
+
+
+class _Backend:
+    name: str
+
+    def __init__(self):
+        self.targets: t.Dict[types.CodeType, _Target] = {}
+        self.calls: t.Dict[int, t.Tuple[_Target, t.Any]] = {}  # id(frame) -> running call
+
+    def add(self, targets: t.Mapping[types.CodeType, _Target]):
+        if not self.targets:
+            self._install()
+        self.targets.update(targets)
+
+    def remove(self, targets: t.Mapping[types.CodeType, _Target]):
+        for code, target in targets.items():
+            if self.targets.get(code) is target:  # not taken over by another instrumentation
+                del self.targets[code]
+        removed = set(map(id, targets.values()))
+        for key, (target, state) in reversed(list(self.calls.items())):  # running calls (the innermost first)
+            if id(target) in removed and self.calls.pop(key, None) is not None:
+                target.hooks.dropped(target.info, state)
+        if not self.targets:
+            self._uninstall()
+
+    def _install(self):
+        raise NotImplementedError()
+
+    def _uninstall(self):
+        raise NotImplementedError()
+
+    def _start(self, target: _Target, frame: types.FrameType):
+        state = target.hooks.start(frame, target.info)
+        if state is not None:
+            self.calls[id(frame)] = (target, state)
+
+    def _returned(self, frame: types.FrameType, value: t.Any):
+        call = self.calls.pop(id(frame), None)
+        if call is not None:
+            target, state = call
+            target.hooks.returned(frame, target.info, state, value)
+
+    def _failed(self, frame: types.FrameType, exception: t.Optional[BaseException]):
+        call = self.calls.pop(id(frame), None)
+        if call is not None:
+            target, state = call
+            target.hooks.failed(frame, target.info, state, exception)
+
+
+class _MonitoringBackend(_Backend):
+    name = "sys.monitoring"
+    TOOL_IDS = (2, 3, 4)  # PROFILER_ID and the unassigned ones
+
+    def __init__(self):
+        super().__init__()
+        self.tool_id: t.Optional[int] = None
+
+    def add(self, targets: t.Mapping[types.CodeType, _Target]):
+        super().add(targets)
+        events = sys.monitoring.events.PY_START | sys.monitoring.events.PY_RETURN
+        for code in targets:
+            sys.monitoring.set_local_events(self.tool_id, code, events)
+
+    def remove(self, targets: t.Mapping[types.CodeType, _Target]):
+        tool_id = self.tool_id
+        for code, target in targets.items():
+            if self.targets.get(code) is target:
+                sys.monitoring.set_local_events(tool_id, code, 0)
+        super().remove(targets)
+
+    def _install(self):
+        monitoring = sys.monitoring
+        for tool_id in self.TOOL_IDS:
+            if monitoring.get_tool(tool_id) is None:
+                break
+        else:
+            raise RuntimeError("all sys.monitoring tool-ids for profilers are in use")
+        monitoring.use_tool_id(tool_id, "debuglib")
+        monitoring.register_callback(tool_id, monitoring.events.PY_START, self._on_start)
+        monitoring.register_callback(tool_id, monitoring.events.PY_RETURN, self._on_return)
+        monitoring.register_callback(tool_id, monitoring.events.PY_UNWIND, self._on_unwind)
+        monitoring.set_events(tool_id, monitoring.events.PY_UNWIND)  # can't be set per code-object
+        self.tool_id = tool_id
+
+    def _uninstall(self):
+        monitoring, tool_id = sys.monitoring, self.tool_id
+        self.tool_id = None
+        monitoring.set_events(tool_id, 0)
+        for event in (monitoring.events.PY_START, monitoring.events.PY_RETURN, monitoring.events.PY_UNWIND):
+            monitoring.register_callback(tool_id, event, None)
+        monitoring.free_tool_id(tool_id)
+        self.calls.clear()
+
+    # the callbacks are called from the instrumented frame. so sys._getframe(1) is its frame
+
+    def _on_start(self, code: types.CodeType, offset: int):
+        target = self.targets.get(code)
+        if target is not None:
+            self._start(target, sys._getframe(1))
+
+    def _on_return(self, code: types.CodeType, offset: int, value: t.Any):
+        if code in self.targets:
+            self._returned(sys._getframe(1), value)
+
+    def _on_unwind(self, code: types.CodeType, offset: int, exception: BaseException):
+        if code in self.targets:
+            self._failed(sys._getframe(1), exception)
+
+
+_RETURN_OPS = frozenset(dis.opmap[name] for name in ("RETURN_VALUE", "RETURN_CONST") if name in dis.opmap)
+_SUSPEND_OPS = frozenset(dis.opmap[name] for name in ("YIELD_VALUE", "SEND") if name in dis.opmap)
+
+
+class _ProfileBackend(_Backend):
+    name = "sys.setprofile"
+
+    def _install(self):
+        if sys.getprofile() is not None:
+            raise RuntimeError("another profiler is active (sys.setprofile)")
+        sys.setprofile(self._profile)
+        threading.setprofile(self._profile)  # for new threads
+
+    def _uninstall(self):
+        sys.setprofile(None)
+        threading.setprofile(None)
+        self.calls.clear()
+
+    def _profile(self, frame: types.FrameType, event: str, arg: t.Any):
+        if event == 'call':
+            target = self.targets.get(frame.f_code)
+            if target is not None and id(frame) not in self.calls:  # otherwise a coroutine is resumed
+                self._start(target, frame)
+        elif event == 'return' and id(frame) in self.calls:
+            # 'return' is also the event of a suspended coroutine and of an exception. the current instruction tells
+            op = frame.f_code.co_code[frame.f_lasti]
+            if op in _RETURN_OPS:
+                self._returned(frame, arg)
+            elif op not in _SUSPEND_OPS:
+                self._failed(frame, None)  # the exception isn't passed to the profile-function
+
+
+_backend: t.Optional[_Backend] = None
+
+
+def get_backend() -> _Backend:
+    global _backend
+    if _backend is None:
+        _backend = _MonitoringBackend() if hasattr(sys, 'monitoring') else _ProfileBackend()
+    return _backend
@@ -0,0 +1,75 @@
+# -*- coding=utf-8 -*-
+r"""
+memory of the monitored calls (see Decorator.monitor(memory=True))
+
+tracemalloc counts the traced memory of the whole process. the peak of a call is measured with reset_peak().
+a nested call would reset the peak of its caller. so the peak before the reset is passed up through
+a context-variable.
+
+calls that run at the same time in other threads (or asyncio-tasks) aren't separated:
+- their allocations are counted in `allocated` and `peak` of every overlapping call
+- their start resets the process-wide peak. that isn't passed up (other context). so the reported peak
+  is then only the highest value since the last reset and can be lower than the real one
+the numbers are only exact for calls that don't overlap with other monitored calls
+"""
+import tracemalloc
+import contextvars
+import typing as t
+from .._typing import CallMemory
+
+
+# [highest traced memory seen by nested calls] of the current monitored call
+_scope: "contextvars.ContextVar[t.Optional[t.List[int]]]" = contextvars.ContextVar("debuglib_memory", default=None)
+_required = False  # a monitored function needs tracemalloc. so nobody else should stop it (see MemoryTracker)
+
+
+class MemoryState(t.NamedTuple):
+    start: int  # traced memory at the start of the call
+    scope: t.List[int]
+    token: contextvars.Token
+
+
+def ensure_tracing(depth: int = 1):
+    r"""
+    starts tracemalloc if it isn't running yet (depth is the number of frames stored per allocation)
+    """
+    global _required
+    _required = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(depth)
+
+
+def tracing_required() -> bool:
+    r"""
+    whether tracemalloc has to keep running for monitor(memory=True)
+    """
+    return _required
+
+
+def enter_memory() -> t.Optional[MemoryState]:
+    if not tracemalloc.is_tracing():  # e.g. stopped by the program
+        return None
+    current, peak = tracemalloc.get_traced_memory()
+    parent = _scope.get()
+    if parent is not None and peak > parent[0]:  # would be lost by the reset
+        parent[0] = peak
+    tracemalloc.reset_peak()
+    scope = [current]
+    return MemoryState(start=current, scope=scope, token=_scope.set(scope))
+
+
+def exit_memory(state: t.Optional[MemoryState]) -> t.Optional[CallMemory]:
+    if state is None:
+        return None
+    try:
+        _scope.reset(state.token)
+    except ValueError:  # ended in another context than it started
+        pass
+    if not tracemalloc.is_tracing():
+        return None
+    current, peak = tracemalloc.get_traced_memory()
+    peak = max(peak, state.scope[0])
+    parent = _scope.get()
+    if parent is not None and peak > parent[0]:
+        parent[0] = peak
+    return CallMemory(allocated=current - state.start, peak=peak - state.start)
@@ -0,0 +1,39 @@
+# -*- coding=utf-8 -*-
+r"""
+selection of the slow calls (see Decorator.monitor(slow_threshold=...))
+
+the threshold is either fixed (seconds) or a percentile of the recent calls of the function (e.g. "p99").
+a percentile is taken from a histogram of the last WINDOW calls. till the first window is full no call is slow
+"""
+import typing as t
+from ._histogram import Histogram
+
+
+WINDOW = 1000  # calls per histogram. the threshold is updated after every window
+
+
+class SlowCalls:
+    threshold_ns: t.Optional[int]  # None while the first window is collected
+
+    def __init__(self, threshold: t.Union[float, str]):
+        if isinstance(threshold, str):  # "p99" | "p99.9"
+            self.percent = float(threshold.lstrip("pP"))
+            if not 0 < self.percent < 100:
+                raise ValueError(f"bad percentile for the slow_threshold: {threshold!r}")
+            self.threshold_ns = None
+            self._histogram = Histogram()
+        else:
+            self.percent = None
+            self.threshold_ns = int(threshold * 1_000_000_000)
+            self._histogram = None
+
+    def is_slow(self, duration_ns: int) -> bool:
+        # called for every call. not locked as a race only loses a count of the histogram
+        histogram = self._histogram
+        if histogram is not None:
+            histogram.record(duration_ns)
+            if histogram.count >= WINDOW:
+                self.threshold_ns, = histogram.percentiles(self.percent)
+                self._histogram = Histogram()
+        threshold_ns = self.threshold_ns
+        return threshold_ns is not None and duration_ns > threshold_ns
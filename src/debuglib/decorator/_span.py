@@ -0,0 +1,73 @@
+# -*- coding=utf-8 -*-
+r"""
+spans of the monitored calls
+
+the current span is a context-variable. so nested calls know their parent in threads and asyncio-tasks
+(a new thread starts without a parent unless it's started with contextvars.copy_context().run)
+"""
+import os
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+import typing as t
+from .._typing import SpanInfo
+
+
+current_span: "contextvars.ContextVar[t.Optional[int]]" = contextvars.ContextVar("debuglib_span", default=None)
+# spans that were ended outside of their context (see close_span()) -> their parent
+_closed: t.Dict[int, t.Optional[int]] = {}
+
+
+def _reset_ids():
+    global _ids
+    # unique per process. so the spans of a forked child don't collide with the ones of the parent
+    _ids = itertools.count((os.getpid() << 32) + 1)
+
+
+_reset_ids()
+
+
+def enter_span() -> t.Tuple[int, t.Optional[int], contextvars.Token]:
+    r"""
+    starts a new span as child of the current one. returns (span-id, parent-id, token for leave_span())
+    """
+    parent = current_span.get()
+    while parent in _closed:  # the context still points to a span that was closed
+        parent = _closed[parent]
+    span_id = next(_ids)
+    return span_id, parent, current_span.set(span_id)
+
+
+leave_span = current_span.reset
+
+
+def close_span(span_id: int, parent: t.Optional[int]):
+    r"""
+    ends a span whose token can't be reset (it was set in another thread or task).
+    the context keeps the span as current value. so the spans that are started there skip it
+    """
+    _closed[span_id] = parent
+
+
+def sync_track() -> int:
+    return threading.get_native_id()
+
+
+def async_track() -> int:
+    task = asyncio.current_task()
+    return threading.get_native_id() if task is None else id(task)
+
+
+def build_span(name: str, span_id: int, parent: t.Optional[int], duration_ns: int, track: int) -> SpanInfo:
+    r"""
+    built at the end of the call (so the start is now minus the duration)
+    """
+    return SpanInfo(
+        id=span_id, parent=parent, name=name, start=time.time_ns() - duration_ns, duration=duration_ns, thread=track,
+    )
+
+
+if hasattr(os, 'register_at_fork'):  # not on windows
+    os.register_at_fork(after_in_child=_reset_ids)
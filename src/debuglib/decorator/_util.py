@@ -3,17 +3,50 @@ r"""
 
 """
 from itertools import chain
-from inspect import iscoroutinefunction, getmodule
+from inspect import iscoroutinefunction, CO_VARARGS, CO_VARKEYWORDS
+from ..core.common.exception import bounded_repr
 
 
-def function_repr(fn, args, kwargs):
-    fn_name = f"{getmodule(fn).__name__}.{fn.__qualname__}"
-    args_repr = map(repr, args)
-    kwargs_repr = (f'{key}={repr(val)}' for key, val in kwargs.items())
-    fn_msg = f"{fn_name}({', '.join(chain(args_repr, kwargs_repr))})"
+def function_name(fn) -> str:
+    r"""
+    name used in the messages. computed once when the function is decorated
+    """
+    name = f"{fn.__module__}.{fn.__qualname__}"
     if iscoroutinefunction(fn):
-        return f"async {fn_msg}"
-    return fn_msg
+        return f"async {name}"
+    return name
+
+
+def format_call(name: str, args: tuple, kwargs: dict, max_length: int = 128) -> str:
+    r"""
+    the call with bounded representations of the arguments (max_length characters per argument)
+    """
+    args_repr = (bounded_repr(val, max_length) for val in args)
+    kwargs_repr = (f'{key}={bounded_repr(val, max_length)}' for key, val in kwargs.items())
+    return f"{name}({', '.join(chain(args_repr, kwargs_repr))})"
+
+
+def format_frame_call(name: str, frame, max_length: int = 128) -> str:
+    r"""
+    like format_call() but from the (current) values of the parameters in the frame (see Decorator.monitor_module())
+    """
+    code = frame.f_code
+    count = code.co_argcount + code.co_kwonlyargcount + \
+        bool(code.co_flags & CO_VARARGS) + bool(code.co_flags & CO_VARKEYWORDS)
+    local = frame.f_locals
+    parameters = (
+        f'{key}={bounded_repr(local[key], max_length)}' for key in code.co_varnames[:count] if key in local
+    )
+    return f"{name}({', '.join(parameters)})"
+
+
+def format_bytes(size: int) -> str:
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{sign}{size}{unit}" if unit == "B" else f"{sign}{size:.1f}{unit}"
+        size /= 1024
 
 
 TIME_UNITS = {
@@ -2,98 +2,547 @@
 r"""
 
 """
+import os
 import time
+import types
+import random
+import atexit
+import asyncio
+import weakref
+import threading
 import functools
+import importlib
+import contextvars
+import typing as t
 from inspect import iscoroutinefunction
-from ..core import DebugClient
-from .._typing import DEFAULT_VALUE, ServerInfoRaw
-from ._util import function_repr, format_delta_ns
+from ..core import DebugClient, AsyncDebugClient, acquire_client, release_client
+from .._typing import DEFAULT_VALUE, ServerInfoRaw, SpanInfo, CallMemory
+from ..core.common.exception import bounded_repr
+from ._util import function_name, format_call, format_frame_call, format_delta_ns, format_bytes
+from ._histogram import LatencyAggregator, format_latencies
+from ._slow import SlowCalls
+from ._span import enter_span, leave_span, close_span, build_span, sync_track, async_track
+from ._instrument import Instrumentation, collect_functions
+from ._memory import ensure_tracing, enter_memory, exit_memory
 
 
 class Decorator:
     def __init__(self, server_info: ServerInfoRaw = DEFAULT_VALUE,
-                 *, timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE):
-        self._client = DebugClient(
-            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta
+                 *, timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
+                 non_blocking: bool = DEFAULT_VALUE,
+                 rate_limit: t.Union[float, t.Mapping[str, float]] = DEFAULT_VALUE, sample_rate: float = DEFAULT_VALUE,
+                 aggregate_interval: float = 10.0):
+        self._client_options = dict(
+            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta,
+            rate_limit=rate_limit, sample_rate=sample_rate,
         )
+        self._non_blocking = non_blocking
+        self._acquire_clients()
+        # functions monitored with aggregate=True
+        self._aggregator = LatencyAggregator(interval=aggregate_interval)
+        self._flusher_lock = threading.Lock()
+        self._flusher: t.Optional[threading.Thread] = None  # sends the summaries (started by the first call)
+        _decorators.add(self)
 
     def __del__(self):
-        self._client.close()
+        self.flush()
+        release_client(self._client)
+        release_client(self._async_client)
+
+    def _after_fork(self):
+        self._aggregator._after_fork()
+        self._flusher_lock = threading.Lock()
+        self._flusher = None  # the thread didn't survive the fork. the next call starts it again
+
+    def flush(self):
+        r"""
+        sends the latencies that were aggregated so far (done automatically every interval and at exit)
+        """
+        summary = self._aggregator.take()
+        if summary is not None:
+            self._client.send(message=format_latencies(summary), extra=summary, limit=False)
+
+    def _start_flusher(self):
+        # the summary of an interval is sent on time even if the functions aren't called anymore
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=_flusher_loop, args=(weakref.ref(self),),
+                    name="debuglib-aggregator", daemon=True,
+                )
+                self._flusher.start()
+
+    def _acquire_clients(self):
+        # the clients are shared with the other decorators and handlers of the process
+        self._client = acquire_client(non_blocking=self._non_blocking, **self._client_options)
+        # used by coroutines so they don't block the event-loop
+        self._async_client = acquire_client(client_type=AsyncDebugClient, **self._client_options)
 
     def reset_connection(self):
-        self._client.close()
+        r"""
+        gives back the clients and acquires them again.
+        the connections are only renewed if no other decorator or handler shares them (they aren't closed for them)
+        """
+        self.flush()
+        release_client(self._client)
+        release_client(self._async_client)
+        self._acquire_clients()
 
-    def monitor(self, time_precision: int = 2):
+    def _coroutine_client(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:  # coroutine is not executed by asyncio
+            return self._client
+        return self._async_client
+
+    def monitor(self, time_precision: int = 2, max_repr_length: int = 128, aggregate: bool = False,
+                slow_threshold: t.Union[None, float, str] = None, sample_rate: t.Optional[float] = None,
+                memory: bool = False):
         r"""
         monitor a sync/async function and sending the information (arguments, return-value, time) to the debug-server
 
+        nothing is formatted (or measured) while no server receives the messages.
+        every call is a span (with the monitored call it's nested in as parent) that can be exported as trace
+
         :param time_precision: 1=>1s | 2=>1s+1ms | 3=>1s+1ms+1μs | ...
+        :param max_repr_length: maximal length of the representation of an argument or the return-value
+        :param aggregate: for hot functions. only the latencies are collected and sent once per interval
+                          (count, errors, mean, p50/p90/p99, max). failures are still sent (without the arguments)
+        :param slow_threshold: only calls that took longer are sent (and failures).
+                               seconds or a percentile of the recent calls of the function (e.g. "p99")
+        :param sample_rate: fraction (0..1) of the other calls that are sent anyway
+        :param memory: also the allocated and the peak memory of every call (starts tracemalloc).
+                       the memory of calls that run at the same time in other threads is included.
+                       their start resets the peak (it's process-wide). so then the peak can be too low
         :return: decorator
         """
 
         def decorator(fn):
+            # static metadata is computed once
+            name = function_name(fn)
+            if memory and (aggregate or slow_threshold is not None or sample_rate is not None):
+                raise ValueError("memory=True can't be combined with aggregate, slow_threshold or sample_rate")
+            if aggregate:
+                return self._aggregating(fn, name, time_precision)
+            origin = f"{fn.__module__}.{fn.__qualname__}"
+
+            def returned(client, call_repr: str, value, total_time_ns: int, span: SpanInfo, note: str = "",
+                         usage: t.Optional[CallMemory] = None):
+                time_repr = format_delta_ns(total_time_ns, precision=time_precision)
+                extra = dict(span=span)
+                if usage is not None:
+                    note += describe_memory(usage)
+                    extra['call_memory'] = usage
+                client.send(
+                    message=f"{call_repr} returned {bounded_repr(value, max_repr_length)} after {time_repr}{note}",
+                    origin=origin, limit=False, extra=extra,
+                )
+
+            def failed(client, call_repr: str, error: BaseException, total_time_ns: int, span: SpanInfo,
+                       usage: t.Optional[CallMemory] = None):
+                time_repr = format_delta_ns(total_time_ns, precision=time_precision)
+                extra = dict(span=span)
+                note = ""
+                if usage is not None:
+                    note = describe_memory(usage)
+                    extra['call_memory'] = usage
+                client.send(
+                    message=f"{call_repr} failed with {type(error).__name__} after {time_repr}{note}",
+                    exception=error, origin=origin, limit=False, extra=extra,
+                )
+
+            if memory:
+                ensure_tracing()
+
+            if slow_threshold is not None or sample_rate is not None:
+                return self._selecting(fn, name, origin, returned, failed, max_repr_length,
+                                       slow_threshold=slow_threshold, sample_rate=sample_rate or 0.0)
+
             if iscoroutinefunction(fn):
                 @functools.wraps(fn)
                 async def wrapper(*args, **kwargs):
-                    fn_repr = function_repr(fn, args, kwargs)
+                    client = self._coroutine_client()
+                    if not client.receiving():
+                        return await fn(*args, **kwargs)
+                    # formatted before the call (the function could modify the arguments) unless rate-limited
+                    call_repr = format_call(name, args, kwargs, max_repr_length) \
+                        if client.accepts("INFO", origin) else None
+                    span_id, parent, token = enter_span()
+                    memory_state = enter_memory() if memory else None
                     start_time = time.perf_counter_ns()
                     try:
                         value = await fn(*args, **kwargs)
-                        total_time_ns = time.perf_counter_ns() - start_time
-                        time_repr = format_delta_ns(total_time_ns, precision=time_precision)
-                        self._client.send(
-                            message=f"{fn_repr} returned {value!r} after {time_repr}",
-                        )
-                        return value
                     except BaseException as error:
                         total_time_ns = time.perf_counter_ns() - start_time
-                        time_repr = format_delta_ns(total_time_ns, precision=time_precision)
-                        self._client.send(
-                            message=f"{fn_repr} failed with {type(error).__name__} after {time_repr}",
-                            exception=error,
-                        )
-                        raise error
+                        usage = exit_memory(memory_state) if memory else None
+                        if call_repr is None:  # errors are never rate-limited
+                            call_repr = format_call(name, args, kwargs, max_repr_length)
+                        span = build_span(name, span_id, parent, total_time_ns, async_track())
+                        failed(client, call_repr, error, total_time_ns, span, usage)
+                        raise
+                    finally:
+                        leave_span(token)
+                    total_time_ns = time.perf_counter_ns() - start_time
+                    usage = exit_memory(memory_state) if memory else None
+                    if call_repr is not None:
+                        span = build_span(name, span_id, parent, total_time_ns, async_track())
+                        returned(client, call_repr, value, total_time_ns, span, usage=usage)
+                    return value
             else:
                 @functools.wraps(fn)
                 def wrapper(*args, **kwargs):
-                    fn_repr = function_repr(fn, args, kwargs)
+                    client = self._client
+                    if not client.receiving():
+                        return fn(*args, **kwargs)
+                    # formatted before the call (the function could modify the arguments) unless rate-limited
+                    call_repr = format_call(name, args, kwargs, max_repr_length) \
+                        if client.accepts("INFO", origin) else None
+                    span_id, parent, token = enter_span()
+                    memory_state = enter_memory() if memory else None
                     start_time = time.perf_counter_ns()
                     try:
                         value = fn(*args, **kwargs)
-                        total_time_ns = time.perf_counter_ns() - start_time
-                        time_repr = format_delta_ns(total_time_ns, precision=time_precision)
-                        self._client.send(
-                            message=f"{fn_repr} returned {value!r} after {time_repr}",
-                        )
-                        return value
                     except BaseException as error:
                         total_time_ns = time.perf_counter_ns() - start_time
-                        time_repr = format_delta_ns(total_time_ns, precision=time_precision)
-                        self._client.send(
-                            message=f"{fn_repr} failed with {type(error).__name__} after {time_repr}",
-                            exception=error,
-                        )
-                        raise error
+                        usage = exit_memory(memory_state) if memory else None
+                        if call_repr is None:  # errors are never rate-limited
+                            call_repr = format_call(name, args, kwargs, max_repr_length)
+                        span = build_span(name, span_id, parent, total_time_ns, sync_track())
+                        failed(client, call_repr, error, total_time_ns, span, usage)
+                        raise
+                    finally:
+                        leave_span(token)
+                    total_time_ns = time.perf_counter_ns() - start_time
+                    usage = exit_memory(memory_state) if memory else None
+                    if call_repr is not None:
+                        span = build_span(name, span_id, parent, total_time_ns, sync_track())
+                        returned(client, call_repr, value, total_time_ns, span, usage=usage)
+                    return value
             return wrapper
         return decorator
 
+    def monitor_module(self, module: t.Union[str, types.ModuleType], *, submodules: bool = True,
+                       time_precision: int = 2, max_repr_length: int = 128, enabled: bool = True) -> Instrumentation:
+        r"""
+        monitor every function and method that is defined in the module without changing it (no wrappers).
+        uses sys.monitoring (python 3.12+) or sys.setprofile() (slower and only the current and new threads)
+
+        the arguments are formatted at the end of the call (so they are the current values of the parameters)
+
+        :param module: module or its name
+        :param submodules: also the already imported submodules of a package
+        :param time_precision: 1=>1s | 2=>1s+1ms | 3=>1s+1ms+1μs | ...
+        :param max_repr_length: maximal length of the representation of an argument or the return-value
+        :param enabled: switch it on right away
+        :return: handle to switch the instrumentation on and off
+        """
+        if isinstance(module, str):
+            module = importlib.import_module(module)
+        return self._instrument(collect_functions(module, submodules=submodules),
+                                time_precision=time_precision, max_repr_length=max_repr_length, enabled=enabled)
+
+    def monitor_class(self, cls: type, *, time_precision: int = 2, max_repr_length: int = 128,
+                      enabled: bool = True) -> Instrumentation:
+        r"""
+        monitor every method of the class (see monitor_module())
+
+        :return: handle to switch the instrumentation on and off
+        """
+        return self._instrument(collect_functions(cls),
+                                time_precision=time_precision, max_repr_length=max_repr_length, enabled=enabled)
+
+    def _instrument(self, functions: t.List[types.FunctionType],
+                    time_precision: int, max_repr_length: int, enabled: bool) -> Instrumentation:
+        instrumentation = Instrumentation(
+            {
+                fn.__code__: _Function(
+                    name=function_name(fn), origin=f"{fn.__module__}.{fn.__qualname__}",
+                    coroutine=iscoroutinefunction(fn),
+                )
+                for fn in functions
+            },
+            hooks=_InstrumentHooks(self, time_precision=time_precision, max_repr_length=max_repr_length),
+        )
+        if enabled:
+            instrumentation.enable()
+        return instrumentation
+
+    def _selecting(self, fn, name: str, origin: str, returned, failed, max_repr_length: int,
+                   slow_threshold: t.Union[None, float, str], sample_rate: float):
+        # the duration is known before anything is formatted. so only the selected calls cost more than measuring
+        slow = None if slow_threshold is None else SlowCalls(slow_threshold)
+
+        def report(client, args, kwargs, value, total_time_ns: int, span_id: int, parent: t.Optional[int], track):
+            if slow is not None and slow.is_slow(total_time_ns):
+                note = f" (slower than {format_delta_ns(slow.threshold_ns)})"
+            elif sample_rate and random.random() < sample_rate:
+                note = ""
+            else:
+                return
+            if client.accepts("INFO", origin):
+                span = build_span(name, span_id, parent, total_time_ns, track())
+                returned(client, format_call(name, args, kwargs, max_repr_length), value, total_time_ns, span, note)
+
+        def report_failure(client, args, kwargs, error: BaseException, total_time_ns: int,
+                           span_id: int, parent: t.Optional[int], track):
+            span = build_span(name, span_id, parent, total_time_ns, track())
+            failed(client, format_call(name, args, kwargs, max_repr_length), error, total_time_ns, span)
+
+        if iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                client = self._coroutine_client()
+                if not client.receiving():
+                    return await fn(*args, **kwargs)
+                span_id, parent, token = enter_span()
+                start_time = time.perf_counter_ns()
+                try:
+                    value = await fn(*args, **kwargs)
+                except BaseException as error:
+                    total_time_ns = time.perf_counter_ns() - start_time
+                    report_failure(client, args, kwargs, error, total_time_ns, span_id, parent, async_track)
+                    raise
+                finally:
+                    leave_span(token)
+                total_time_ns = time.perf_counter_ns() - start_time
+                report(client, args, kwargs, value, total_time_ns, span_id, parent, async_track)
+                return value
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                client = self._client
+                if not client.receiving():
+                    return fn(*args, **kwargs)
+                span_id, parent, token = enter_span()
+                start_time = time.perf_counter_ns()
+                try:
+                    value = fn(*args, **kwargs)
+                except BaseException as error:
+                    total_time_ns = time.perf_counter_ns() - start_time
+                    report_failure(client, args, kwargs, error, total_time_ns, span_id, parent, sync_track)
+                    raise
+                finally:
+                    leave_span(token)
+                total_time_ns = time.perf_counter_ns() - start_time
+                report(client, args, kwargs, value, total_time_ns, span_id, parent, sync_track)
+                return value
+        return wrapper
+
+    def _aggregating(self, fn, name: str, time_precision: int):
+        aggregator = self._aggregator
+
+        def record(client, total_time_ns: int, error: t.Optional[BaseException] = None):
+            if self._flusher is None:
+                self._start_flusher()
+            summary = aggregator.record(name, total_time_ns, failed=error is not None)
+            if error is not None:
+                time_repr = format_delta_ns(total_time_ns, precision=time_precision)
+                client.send(
+                    message=f"{name} failed with {type(error).__name__} after {time_repr}",
+                    exception=error, limit=False,
+                )
+            if summary is not None:  # the interval is over
+                client.send(message=format_latencies(summary), extra=summary, limit=False)
+
+        if iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                client = self._coroutine_client()
+                if not client.receiving():
+                    return await fn(*args, **kwargs)
+                start_time = time.perf_counter_ns()
+                try:
+                    value = await fn(*args, **kwargs)
+                except BaseException as error:
+                    record(client, time.perf_counter_ns() - start_time, error)
+                    raise
+                record(client, time.perf_counter_ns() - start_time)
+                return value
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                client = self._client
+                if not client.receiving():
+                    return fn(*args, **kwargs)
+                start_time = time.perf_counter_ns()
+                try:
+                    value = fn(*args, **kwargs)
+                except BaseException as error:
+                    record(client, time.perf_counter_ns() - start_time, error)
+                    raise
+                record(client, time.perf_counter_ns() - start_time)
+                return value
+        return wrapper
+
+
+def describe_memory(usage: CallMemory) -> str:
+    return f" ({format_bytes(usage['allocated'])} allocated, peak {format_bytes(usage['peak'])})"
+
+
+class _Function(t.NamedTuple):
+    name: str
+    origin: str
+    coroutine: bool
+
+
+class _Call(t.NamedTuple):
+    client: t.Union[DebugClient, AsyncDebugClient]
+    accepted: bool  # by the rate-limit
+    span_id: int
+    parent: t.Optional[int]
+    token: contextvars.Token
+    start_time: int
+
+
+class _InstrumentHooks:
+    r"""
+    reports the calls of the functions of Decorator.monitor_module()/monitor_class() (see _instrument.py)
+    like the wrappers of Decorator.monitor()
+    """
+
+    def __init__(self, decorator: Decorator, time_precision: int, max_repr_length: int):
+        self._decorator = decorator
+        self._time_precision = time_precision
+        self._max_repr_length = max_repr_length
+
+    def start(self, frame: types.FrameType, function: _Function) -> t.Optional[_Call]:
+        decorator = self._decorator
+        client = decorator._coroutine_client() if function.coroutine else decorator._client
+        try:
+            if not client.receiving():
+                return None
+            accepted = client.accepts("INFO", function.origin)
+            span_id, parent, token = enter_span()
+        except Exception as error:  # would be raised in the instrumented function
+            client._handle_error(error)
+            return None
+        return _Call(client, accepted, span_id, parent, token, time.perf_counter_ns())
+
+    def returned(self, frame: types.FrameType, function: _Function, call: _Call, value: t.Any):
+        total_time_ns = time.perf_counter_ns() - call.start_time
+        self._leave(call)
+        if not call.accepted:
+            return
+        client = call.client
+        try:
+            call_repr = format_frame_call(function.name, frame, self._max_repr_length)
+            time_repr = format_delta_ns(total_time_ns, precision=self._time_precision)
+            client.send(
+                message=f"{call_repr} returned {bounded_repr(value, self._max_repr_length)} after {time_repr}",
+                origin=function.origin, limit=False, extra=dict(span=self._span(function, call, total_time_ns)),
+            )
+        except Exception as error:
+            client._handle_error(error)
+
+    def failed(self, frame: types.FrameType, function: _Function, call: _Call, exception: t.Optional[BaseException]):
+        total_time_ns = time.perf_counter_ns() - call.start_time
+        self._leave(call)
+        client = call.client
+        try:
+            call_repr = format_frame_call(function.name, frame, self._max_repr_length)
+            time_repr = format_delta_ns(total_time_ns, precision=self._time_precision)
+            failure = "failed" if exception is None else f"failed with {type(exception).__name__}"  # sys.setprofile()
+            client.send(
+                message=f"{call_repr} {failure} after {time_repr}", level="ERROR", exception=exception,
+                origin=function.origin, limit=False, extra=dict(span=self._span(function, call, total_time_ns)),
+            )
+        except Exception as error:
+            client._handle_error(error)
+
+    def dropped(self, function: _Function, call: _Call):
+        # the instrumentation was disabled during the call. its span mustn't stay the current one
+        try:
+            leave_span(call.token)
+        except ValueError:  # started in another thread or task
+            close_span(call.span_id, call.parent)
+
+    @staticmethod
+    def _leave(call: _Call):
+        try:
+            leave_span(call.token)
+        except ValueError:  # ended in another context than it started
+            pass
+
+    @staticmethod
+    def _span(function: _Function, call: _Call, total_time_ns: int) -> SpanInfo:
+        track = async_track() if function.coroutine else sync_track()
+        return build_span(function.name, call.span_id, call.parent, total_time_ns, track)
+
 
 def monitor(*, server_info: ServerInfoRaw = DEFAULT_VALUE,
             timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
-            time_precision: int = 2):
+            non_blocking: bool = DEFAULT_VALUE, time_precision: int = 2, max_repr_length: int = 128,
+            rate_limit: t.Union[float, t.Mapping[str, float]] = DEFAULT_VALUE, sample_rate: float = DEFAULT_VALUE,
+            aggregate: bool = False, aggregate_interval: float = 10.0,
+            slow_threshold: t.Union[None, float, str] = None, memory: bool = False):
     r"""
     monitor a sync/async function and sending the information (arguments, return-value, time) to the debug-server
 
-    recommended to use the Decorator-class for better performance through one connection to the server
+    the connection to the server is shared with every other monitor(), Decorator and handler with the same options
 
     :param server_info: server information
     :param timeout: socket timeout
     :param connection_attempt_delta: delta between connection attempts
+    :param non_blocking: send the messages from a background-thread
     :param time_precision: time-precision
+    :param max_repr_length: maximal length of the representation of an argument or the return-value
+    :param rate_limit: calls per second (per monitored function). failures are always sent
+    :param sample_rate: fraction (0..1) of the calls that are sent (of the fast ones with slow_threshold)
+    :param aggregate: only send the latencies (count, errors, mean, p50/p90/p99, max) once per interval
+    :param aggregate_interval: seconds between the summaries of aggregate=True
+    :param slow_threshold: only send calls that took longer (seconds or a percentile like "p99") and failures
+    :param memory: also the allocated and the peak memory of every call (starts tracemalloc. see Decorator.monitor())
     :return: decorator
     """
     return Decorator(
         server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta,
+        non_blocking=non_blocking, rate_limit=rate_limit, aggregate_interval=aggregate_interval,
     ).monitor(
-        time_precision=time_precision
+        time_precision=time_precision, max_repr_length=max_repr_length, aggregate=aggregate,
+        slow_threshold=slow_threshold, sample_rate=None if sample_rate is DEFAULT_VALUE else sample_rate,
+        memory=memory,
     )
+
+
+_decorators: "weakref.WeakSet[Decorator]" = weakref.WeakSet()
+
+
+def _flusher_loop(decorator_ref: "weakref.ReferenceType[Decorator]"):
+    # only holds a weak reference so the decorator can still be garbage-collected
+    while True:
+        decorator = decorator_ref()
+        if decorator is None:
+            return
+        delay = decorator._aggregator.next_due - time.monotonic()
+        del decorator
+        if delay > 0:
+            time.sleep(delay)
+        decorator = decorator_ref()
+        if decorator is None:
+            return
+        try:
+            summary = decorator._aggregator.take_due()
+            if summary is not None:
+                decorator._client.send(message=format_latencies(summary), extra=summary, limit=False)
+        except Exception as error:  # noqa
+            decorator._client._handle_error(error)
+        del decorator
+
+
+@atexit.register
+def _flush_decorators():
+    # the last (incomplete) interval of aggregate=True
+    for decorator in list(_decorators):
+        try:
+            decorator.flush()
+        except Exception as error:  # noqa
+            decorator._client._handle_error(error)
+
+
+def _after_fork_in_child():
+    for decorator in list(_decorators):
+        decorator._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):  # not on windows
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -4,7 +4,7 @@ r"""
 """
 import sys
 import typing as t
-from ..core.client import DebugClient
+from ..core import acquire_client, release_client
 
 
 __all__ = ['hook']
@@ -14,11 +14,11 @@ original_hook: t.Optional[t.Callable[[t.Type[Exception], Exception, t.Any], None
 
 
 def excepthook(exc, val, tb):
-    # yes. Create a client for one message as the script should be crashing if this is called.
-    # so no need to keep a connection longer alive
-    client = DebugClient()
+    # the script should be crashing if this is called. so the client is only kept if others use it too
+    client = acquire_client()
     client.send("sys.excepthook", exception=val)
-    client.close()
+    client.flush()
+    release_client(client)
     if original_hook is not None:
         original_hook(exc, val, tb)
 
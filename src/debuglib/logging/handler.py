@@ -2,54 +2,107 @@
 r"""
 logging-handler to send messages to the debug-server
 """
-import copy
-import queue
-import logging.handlers
+import logging
+import typing as t
 from .._typing import ServerInfoRaw, DEFAULT_VALUE
-from ..core import DebugClient
+from ..core import DebugClient, acquire_client, release_client
+from ..core.common.record import capture_record
 
 
 class BlockingDebugHandler(logging.Handler):
     r"""
     Logging-Handler that blocks as it waits till the message is sent to the server (if the server exists)
+
+    rate_limit/sample_rate are applied per logger and level before the message is formatted (see DebugClient)
+
+    with structured=True the message isn't formatted at all. the template is sent with the arguments
+    and the attributes of the record (logger, source location, thread, process, extra=).
+    the receiver formats it (see core/common/record.py)
     """
+    _deferred = False  # whether the record's template and arguments are formatted by the client
 
     def __init__(self, server_info: ServerInfoRaw = DEFAULT_VALUE,
-                 *, timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE):
+                 *, timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
+                 rate_limit: t.Union[float, t.Mapping[str, float]] = DEFAULT_VALUE, sample_rate: float = DEFAULT_VALUE,
+                 structured: bool = DEFAULT_VALUE):
         super().__init__()
-        self._client = DebugClient(
-            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta
+        self._structured = structured is not DEFAULT_VALUE and structured
+        self._client = self._create_client(
+            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta,
+            rate_limit=rate_limit, sample_rate=sample_rate,
         )
 
+    def _create_client(self, **kwargs) -> DebugClient:
+        return acquire_client(**kwargs)  # shared with the other handlers and decorators
+
     def emit(self, record: logging.LogRecord):
-        self._client.send(
-            message=record.getMessage(),
+        client = self._client
+        if client is None:  # closed
+            return
+        if not client.accepts(record.levelname, record.name):  # rate-limited. getMessage() isn't worth it
+            return
+        if self._structured:
+            client.send(
+                message=record.msg if isinstance(record.msg, str) else str(record.msg),
+                level=record.levelname,
+                exception=record.exc_info[1] if record.exc_info else None,
+                timestamp=record.created,
+                origin=record.name,
+                limit=False,
+                extra=dict(record=capture_record(record)),
+            )
+            return
+        if self._deferred and type(record).getMessage is logging.LogRecord.getMessage:
+            message, args = record.msg, record.args
+        else:  # e.g. a custom record-factory
+            message, args = record.getMessage(), None
+        client.send(
+            message=message,
             level=record.levelname,
             exception=record.exc_info[1] if record.exc_info else None,
             timestamp=record.created,
+            origin=record.name,
+            limit=False,
+            args=args,
         )
 
+    def close(self):
+        client, self._client = self._client, None
+        if client is not None:  # close() can be called multiple times
+            client.flush()
+            release_client(client)
+        super().close()
 
-class NonBlockingDebugHandler(logging.handlers.QueueHandler):
+
+class NonBlockingDebugHandler(BlockingDebugHandler):
     r"""
     Logging-Handler for high-performance code that queues the logs and sends them in another thread to the server
 
-    known to have problems with very short programs
+    the logging thread only queues the template, the arguments, the level, the time and the exception.
+    the writer-thread formats, encodes and writes everything that is queued at once.
+    so arguments that are changed after the logging-call are sent with the changes (like logging.handlers.QueueHandler
+    without prepare()). log a copy or an already formatted message in that case
+
+    the queue is bounded. if it is full new logs are dropped (see DebugClient(overflow=...)).
+    flush() and close() wait till the queue is written
     """
+    _deferred = True
 
     def __init__(self, server_info: ServerInfoRaw = DEFAULT_VALUE,
-                 *, timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE):
-        self._queue = queue.Queue()
-        super().__init__(self._queue)
-        self.__blocking_handler = BlockingDebugHandler(
-            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta
+                 *, timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE,
+                 queue_size: int = DEFAULT_VALUE, overflow: str = DEFAULT_VALUE,
+                 rate_limit: t.Union[float, t.Mapping[str, float]] = DEFAULT_VALUE, sample_rate: float = DEFAULT_VALUE,
+                 structured: bool = DEFAULT_VALUE):
+        self._queue_size = queue_size
+        self._overflow = overflow
+        super().__init__(
+            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta,
+            rate_limit=rate_limit, sample_rate=sample_rate, structured=structured,
         )
-        self._listener = logging.handlers.QueueListener(self._queue, self.__blocking_handler)
-        self._listener.start()
 
-    def __del__(self):
-        self._listener.stop()
+    def _create_client(self, **kwargs) -> DebugClient:
+        return acquire_client(non_blocking=True, queue_size=self._queue_size, overflow=self._overflow, **kwargs)
 
-    # custom one as the original removes unpickleable elements but we don't pickle
-    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
-        return copy.copy(record)
+    def flush(self):
+        if self._client is not None:
+            self._client.flush()
@@ -0,0 +1,12 @@
+# -*- coding=utf-8 -*-
+r"""
+profiler = debuglib.profiler.start()  # samples all threads 100 times per second
+...
+profiler.stop()
+
+$ debuglib profile --output profile.folded  # shows the top functions and writes the folded stacks on exit
+
+tracker = debuglib.profiler.track_memory(interval=10.0, top=10)  # the biggest changes of the allocation-sites
+"""
+from ._profiler import Profiler, start
+from ._memory import MemoryTracker, track_memory
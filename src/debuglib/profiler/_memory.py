@@ -0,0 +1,228 @@
+# -*- coding=utf-8 -*-
+r"""
+allocation-sites of the whole process (tracemalloc)
+
+every `interval` seconds a snapshot is taken and compared with the previous one.
+the `top` sites with the biggest changes are sent as one message (see _typing.MemoryInfo).
+
+the overhead can be tuned with
+- depth: frames that are stored per allocation (1 is the cheapest. more show who called the allocating line)
+- window: trace only `window` seconds of every interval (tracemalloc is stopped in between).
+  the report then shows what was allocated during the window and is still alive.
+  only if the tracker started tracemalloc itself and nothing else needs it (e.g. monitor(memory=True)).
+  otherwise the tracker traces continuously and leaves tracemalloc running
+"""
+import os
+import weakref
+import threading
+import tracemalloc
+import typing as t
+from .._typing import DEFAULT_VALUE, ServerInfoRaw, MemoryInfo, AllocationSite
+from ..core import acquire_client, release_client
+from ..decorator._util import format_bytes
+from ..decorator._memory import tracing_required
+
+
+_PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, os.path.join(_PACKAGE_DIRECTORY, "*")),  # incl. the client
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class MemoryTracker:
+    def __init__(self, server_info: ServerInfoRaw = DEFAULT_VALUE,
+                 *, interval: float = 10.0, top: int = 10, depth: int = 1, window: float = None,
+                 timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE):
+        r"""
+        :param server_info: information about the server
+        :param interval: seconds between the reports
+        :param top: number of allocation-sites per report
+        :param depth: frames per allocation
+        :param window: seconds of every interval that are traced (None: always. see above when it's ignored)
+        :param timeout: socket timeout
+        :param connection_attempt_delta: delta between connection attempts
+        """
+        if window is not None and not 0 < window <= interval:
+            raise ValueError("window has to be within the interval")
+        self.interval = interval
+        self.top = top
+        self.depth = depth
+        self.window = window
+        # shared with the other front-ends of the process
+        self._client = acquire_client(
+            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta,
+        )
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+        self._previous: t.Optional[tracemalloc.Snapshot] = None
+        self._owns_tracing = False  # started tracemalloc itself. so it may stop it (windows and stop())
+        _trackers.add(self)
+
+    def __del__(self):
+        self.stop()
+        release_client(self._client)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._owns_tracing = not tracemalloc.is_tracing() and not tracing_required()
+            if self._owns_tracing and self.window is None:  # otherwise the windows start it
+                tracemalloc.start(self.depth)
+            self._previous = self._snapshot()
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=_tracker_loop, args=(weakref.ref(self), self._stop),
+                name="debuglib-memory", daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self):
+        r"""
+        stops the tracking (and tracemalloc if it was started by the tracker and nothing else needs it)
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        if thread is not threading.current_thread():
+            thread.join()
+        if self._owns_tracing:
+            if tracemalloc.is_tracing() and not tracing_required():
+                tracemalloc.stop()
+            self._owns_tracing = False
+        self._previous = None
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        running, self._thread = self._thread is not None, None
+        self._stop = threading.Event()
+        if running:
+            self.start()
+
+    def _snapshot(self) -> t.Optional[tracemalloc.Snapshot]:
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def _run_window(self, stop: threading.Event) -> bool:
+        # tracemalloc only runs during the window. returns True if the tracker was stopped meanwhile
+        if stop.wait(self.interval - self.window):
+            return True
+        if tracemalloc.is_tracing() or tracing_required():  # started (or needed) by somebody else meanwhile
+            self._continue_tracing()
+            return False
+        tracemalloc.start(self.depth)
+        self._previous = self._snapshot()  # empty
+        stopped = stop.wait(self.window)
+        self._report()
+        if tracing_required():  # e.g. monitor(memory=True) was applied during the window
+            self._continue_tracing()
+        else:
+            tracemalloc.stop()
+        return stopped
+
+    def _continue_tracing(self):
+        # gives up the windows. tracemalloc keeps running (and isn't stopped by the tracker anymore)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.depth)
+        self._owns_tracing = False
+
+    def _report(self):
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return
+        previous, self._previous = self._previous, snapshot
+        if not self._client.receiving():
+            return
+        key = 'lineno' if self.depth <= 1 else 'traceback'
+        if previous is None:
+            differences = [
+                (statistic.traceback, statistic.size, statistic.size, statistic.count, statistic.count)
+                for statistic in snapshot.statistics(key)[:self.top]
+            ]
+        else:
+            differences = [
+                (statistic.traceback, statistic.size, statistic.size_diff, statistic.count, statistic.count_diff)
+                for statistic in snapshot.compare_to(previous, key)[:self.top]
+            ]
+        current, peak = tracemalloc.get_traced_memory()  # peak since the last reset_peak() (monitor(memory=True))
+        top = [
+            AllocationSite(site=_describe_site(traceback), size=size, size_diff=size_diff,
+                           count=count, count_diff=count_diff)
+            for traceback, size, size_diff, count, count_diff in differences
+        ]
+        self._client.send(
+            message=f"memory: {format_bytes(current)} traced (peak {format_bytes(peak)})",
+            level="DEBUG", limit=False, extra=dict(memory=MemoryInfo(current=current, peak=peak, top=top)),
+        )
+
+
+def _describe_site(traceback: tracemalloc.Traceback) -> str:
+    # most recent frame first
+    return " <- ".join(
+        f"{'/'.join(frame.filename.replace(chr(92), '/').rsplit('/', 2)[-2:])}:{frame.lineno}"
+        for frame in reversed(traceback)
+    )
+
+
+def _tracker_loop(tracker_ref: "weakref.ReferenceType[MemoryTracker]", stop: threading.Event):
+    # only holds a weak reference so the tracker can still be garbage-collected
+    while True:
+        tracker = tracker_ref()
+        if tracker is None:
+            return
+        try:
+            if tracker.window is None or not tracker._owns_tracing:
+                interval = tracker.interval
+                del tracker
+                if stop.wait(interval):
+                    return
+                tracker = tracker_ref()
+                if tracker is None:
+                    return
+                tracker._report()
+            elif tracker._run_window(stop):
+                return
+        except Exception as error:
+            tracker._client._handle_error(error)
+            if stop.wait(1.0):
+                return
+        del tracker
+
+
+def track_memory(server_info: ServerInfoRaw = DEFAULT_VALUE,
+                 *, interval: float = 10.0, top: int = 10, depth: int = 1, window: float = None) -> MemoryTracker:
+    r"""
+    creates and starts a MemoryTracker. keep a reference to it (the tracking stops once it's garbage-collected)
+    """
+    tracker = MemoryTracker(server_info=server_info, interval=interval, top=top, depth=depth, window=window)
+    tracker.start()
+    return tracker
+
+
+_trackers: "weakref.WeakSet[MemoryTracker]" = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for tracker in list(_trackers):
+        tracker._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):  # not on windows
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,193 @@
+# -*- coding=utf-8 -*-
+r"""
+statistical (wall-clock) profiler
+
+a background-thread samples the stacks of all other threads (sys._current_frames()) every `interval` seconds
+and counts how often every stack was seen. every `report_interval` seconds the counts since the last report
+are sent as one message (see _typing.ProfileInfo). the functions are sent once per message and the stacks
+refer to them by index.
+
+waiting threads are sampled too (e.g. in time.sleep() or select()).
+"""
+import os
+import sys
+import time
+import weakref
+import threading
+import collections
+import typing as t
+from .._typing import DEFAULT_VALUE, ServerInfoRaw, ProfileInfo
+from ..core import acquire_client, release_client
+
+
+class Profiler:
+    def __init__(self, server_info: ServerInfoRaw = DEFAULT_VALUE,
+                 *, interval: float = 0.01, report_interval: float = 1.0, max_depth: int = 128,
+                 timeout: float = DEFAULT_VALUE, connection_attempt_delta: float = DEFAULT_VALUE):
+        r"""
+        :param server_info: information about the server
+        :param interval: seconds between the samples
+        :param report_interval: seconds between the messages
+        :param max_depth: frames per stack (the outermost ones are cut off)
+        :param timeout: socket timeout
+        :param connection_attempt_delta: delta between connection attempts
+        """
+        self.interval = interval
+        self.report_interval = report_interval
+        self.max_depth = max_depth
+        # shared with the other front-ends of the process
+        self._client = acquire_client(
+            server_info=server_info, timeout=timeout, connection_attempt_delta=connection_attempt_delta,
+        )
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+        self._counts: t.Counter[t.Tuple[t.Any, ...]] = collections.Counter()  # stack (leaf first) -> samples
+        self._samples = 0
+        self._labels: t.Dict[t.Any, str] = {}  # code -> label
+        _profilers.add(self)
+
+    def __del__(self):
+        self.stop()
+        release_client(self._client)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=_sampler_loop, args=(weakref.ref(self), self._stop),
+                name="debuglib-profiler", daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self):
+        r"""
+        stops the sampling and sends what wasn't reported yet
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        if thread is not threading.current_thread():
+            thread.join()
+        self._report()
+        self._client.flush()
+
+    def _after_fork(self):
+        # the thread doesn't exist in the child
+        self._lock = threading.Lock()
+        running, self._thread = self._thread is not None, None
+        self._stop = threading.Event()
+        self._counts = collections.Counter()
+        self._samples = 0
+        if running:
+            self.start()
+
+    def _sample(self, ignored: t.Container[int]):
+        max_depth = self.max_depth
+        counts = self._counts
+        for ident, frame in sys._current_frames().items():
+            if ident in ignored:
+                continue
+            stack = []
+            while frame is not None and len(stack) < max_depth:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            counts[tuple(stack)] += 1
+        self._samples += 1
+
+    def _report(self):
+        counts, self._counts = self._counts, collections.Counter()
+        samples, self._samples = self._samples, 0
+        if not counts:
+            return
+        indexes: t.Dict[t.Any, int] = {}
+        frames = []
+        stacks = []
+        for stack, count in counts.items():
+            path = []
+            for code in reversed(stack):  # root first
+                index = indexes.get(code)
+                if index is None:
+                    index = indexes[code] = len(frames)
+                    frames.append(self._label(code))
+                path.append(index)
+            stacks.append((path, count))
+        self._client.send(
+            message=f"profile: {sum(counts.values())} samples of {len(stacks)} stacks",
+            level="DEBUG", limit=False,
+            extra=dict(profile=ProfileInfo(frames=frames, stacks=stacks, samples=samples, interval=self.interval)),
+        )
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = '/'.join(code.co_filename.replace('\\', '/').rsplit('/', 2)[-2:])
+            name = getattr(code, 'co_qualname', code.co_name)  # co_qualname: 3.11+
+            # ';' separates the frames in the folded format
+            label = self._labels[code] = f"{name} ({filename}:{code.co_firstlineno})".replace(';', ',')
+        return label
+
+
+def _sampler_loop(profiler_ref: "weakref.ReferenceType[Profiler]", stop: threading.Event):
+    # only holds a weak reference so the profiler can still be garbage-collected
+    own = threading.get_ident()
+    next_report = time.monotonic()
+    ignored: t.Set[int] = set()
+    while True:
+        profiler = profiler_ref()
+        if profiler is None:
+            return
+        try:
+            now = time.monotonic()
+            if now >= next_report:
+                # debuglib's own threads aren't profiled
+                ignored = {thread.ident for thread in threading.enumerate() if thread.name.startswith("debuglib-")}
+                ignored.add(own)
+                profiler._report()
+                next_report = now + profiler.report_interval
+            if profiler._client.receiving():  # nobody would receive the samples
+                profiler._sample(ignored)
+        except Exception as error:
+            profiler._client._handle_error(error)
+        interval = profiler.interval
+        del profiler
+        if stop.wait(interval):
+            return
+
+
+def start(server_info: ServerInfoRaw = DEFAULT_VALUE,
+          *, interval: float = 0.01, report_interval: float = 1.0, max_depth: int = 128) -> Profiler:
+    r"""
+    creates and starts a Profiler. keep a reference to it (the sampling stops once it's garbage-collected)
+    """
+    profiler = Profiler(server_info=server_info, interval=interval, report_interval=report_interval,
+                        max_depth=max_depth)
+    profiler.start()
+    return profiler
+
+
+_profilers: "weakref.WeakSet[Profiler]" = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for profiler in list(_profilers):
+        profiler._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):  # not on windows
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,44 @@
+# -*- coding=utf-8 -*-
+r"""
+the tests run against the sources (without installing the package)
+"""
+import os
+import sys
+import time
+import threading
+import typing as t
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from debuglib.core import DebugServer  # noqa: E402
+
+
+class RunningServer:
+    def __init__(self, server: DebugServer):
+        self.server = server
+        self.address = server.address
+        self.received: t.List[dict] = []
+        self.errors: t.List[Exception] = []
+        server.on_message(lambda message, client: self.received.append(message))
+        server.on_error(self.errors.append)
+
+    def wait(self, count: int, timeout: float = 10.0) -> t.List[dict]:
+        r"""
+        waits till `count` messages were received (or the timeout is over) and returns them
+        """
+        deadline = time.monotonic() + timeout
+        while len(self.received) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.received
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = DebugServer(server_info=f"unix://{tmp_path / 'debuglib.sock'}")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield RunningServer(server)
+    server.shutdown()
+    server.close()
+    thread.join()
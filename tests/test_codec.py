@@ -0,0 +1,129 @@
+# -*- coding=utf-8 -*-
+r"""
+frames of the Encoder have to be decoded into the same message by the Decoder of the negotiated features
+"""
+import os
+import zlib
+import pytest
+from debuglib.core.client._base import BaseClient
+from debuglib.core.common import protocol
+from debuglib.core.common.codec import InternTable, FORMAT_BINARY, encode_binary, decode_binary, encode_varint
+from debuglib.core.common.protocol import (
+    Encoder, Decoder, FEATURE_BINARY, FEATURE_INTERNING, FEATURE_LARGE_FRAMES, FEATURE_COMPRESSION, FORMAT_ZLIB,
+)
+
+
+def build(text: str, level: str = "INF", **extra) -> dict:
+    return dict(message=text, level=level, exception_info=None, timestamp=1.5, **extra)
+
+
+def roundtrip(encoder: Encoder, decoder: Decoder, message: dict) -> dict:
+    frame = encoder.encode(message)
+    body_format, start, end = decoder.read_frame(frame, 0)
+    assert end == len(frame)
+    return decoder.decode(body_format, frame[start:end])
+
+
+def capture(error: BaseException) -> dict:
+    try:
+        raise error
+    except BaseException as caught:
+        return BaseClient(server_info="unix:///nonexistent").build_message(
+            "failed", exception=caught, extra=dict(number=1, nested=dict(key=[1, 2])),
+        )
+
+
+@pytest.mark.parametrize("features", [b'', FEATURE_BINARY, FEATURE_BINARY + FEATURE_INTERNING])
+@pytest.mark.parametrize("message", [
+    build("plain"),
+    build("custom level", level="TRACE"),
+    build("unicode \u2603 \U0001f600"),
+    capture(ValueError("broken value")),
+], ids=["plain", "custom-level", "unicode", "exception"])
+def test_roundtrip(features, message):
+    encoder, decoder = Encoder(features), Decoder(features)
+    for _ in range(2):  # the second time with the interned strings
+        assert roundtrip(encoder, decoder, message) == message
+
+
+@pytest.fixture(params=[b'', FEATURE_COMPRESSION])
+def interning(request):
+    features = FEATURE_BINARY + FEATURE_INTERNING + request.param
+    return Encoder(features), Decoder(features)
+
+
+def test_interning_defines_repeated_strings(interning):
+    encoder, decoder = interning
+    message = build("repeated message")
+    sizes = []
+    for _ in range(3):  # literal, definition, reference
+        frame = encoder.encode(message)
+        sizes.append(len(frame))
+        body_format, start, end = decoder.read_frame(frame, 0)
+        assert decoder.decode(body_format, frame[start:end]) == message
+    assert sizes[2] < sizes[0]
+
+
+def test_interning_rollback_of_a_failed_body(interning):
+    encoder, decoder = interning
+    assert roundtrip(encoder, decoder, build("shared message")) == build("shared message")
+    with pytest.raises(TypeError):  # the message would be defined by this body
+        encoder.encode(build("shared message", broken=object()))
+    for _ in range(2):
+        assert roundtrip(encoder, decoder, build("shared message")) == build("shared message")
+
+
+def test_oversized_message_keeps_the_connection_in_sync(interning):
+    encoder, decoder = interning  # without large frames
+    assert roundtrip(encoder, decoder, build("shared message")) == build("shared message")
+    with pytest.raises(OverflowError):  # the message would be defined by this body
+        encoder.encode(build("shared message", blob=os.urandom(40_000).hex()))
+    for _ in range(2):
+        message = build("shared message", padding="x" * 2_000)
+        assert roundtrip(encoder, decoder, message) == message
+
+
+def test_intern_table_reuses_the_least_recently_used_id():
+    table = InternTable(capacity=2, min_length=1)
+    strings = {}  # of the receiver
+    for name in ("logger-a", "logger-b", "logger-a", "logger-c", "logger-a", "logger-b", "logger-c"):
+        for _ in range(2):  # defined on the second occurrence
+            message = build(name)
+            body = encode_binary(message, table=table)
+            table.commit()
+            assert decode_binary(body, strings=strings) == message
+    assert len(table._ids) == 2
+    assert len(strings) == 2
+
+
+def test_compressed_stream():
+    features = FEATURE_BINARY + FEATURE_INTERNING + FEATURE_LARGE_FRAMES + FEATURE_COMPRESSION
+    encoder, decoder = Encoder(features), Decoder(features)
+    for number in range(3):  # every frame continues the stream of the connection
+        message = build(f"traceback {number}", traceback=f"File 'x.py', line {number}, in f\n" * 5_000)
+        frame = encoder.encode(message)
+        assert frame[:1] == FORMAT_ZLIB and len(frame) < 10_000
+        body_format, start, end = decoder.read_frame(frame, 0)
+        assert decoder.decode(body_format, frame[start:end]) == message
+
+
+def test_large_frames():
+    features = FEATURE_BINARY + FEATURE_LARGE_FRAMES
+    message = build("x" * 100_000)
+    assert roundtrip(Encoder(features), Decoder(features), message) == message
+
+
+def test_decompression_is_bounded(monkeypatch):
+    monkeypatch.setattr(protocol, 'MAX_FRAME_SIZE', 1024 * 1024)
+    decoder = Decoder(FEATURE_BINARY + FEATURE_LARGE_FRAMES + FEATURE_COMPRESSION)
+    compressor = zlib.compressobj()
+    bomb = compressor.compress(FORMAT_BINARY + bytes(2 * 1024 * 1024)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    assert len(bomb) < 10_000
+    with pytest.raises(ValueError):
+        decoder.decode(FORMAT_ZLIB, bomb)
+
+
+def test_too_big_frame_is_rejected():
+    decoder = Decoder(FEATURE_BINARY + FEATURE_LARGE_FRAMES)
+    with pytest.raises(ValueError):
+        decoder.read_frame(FORMAT_BINARY + encode_varint(protocol.MAX_FRAME_SIZE + 1), 0)
@@ -0,0 +1,87 @@
+# -*- coding=utf-8 -*-
+r"""
+repeated exceptions are sent once per window and afterwards only as a counter
+"""
+from debuglib.core import DebugClient
+from debuglib.core.client._dedup import Deduplicator, MAX_VALUES
+
+
+def fail(key: str) -> BaseException:
+    try:
+        {}[key]
+    except KeyError as error:
+        return error
+
+
+def test_repeats_are_counted():
+    dedup = Deduplicator(window=5.0)
+    fingerprint = dedup.admit(fail("a"), "ERROR", now=0.0)
+    assert fingerprint is not None
+    for now in range(1, 4):
+        assert dedup.admit(fail("a"), "ERROR", now=float(now)) is None
+    assert dedup.next_due == 5.0
+    assert dedup.take_due(now=4.0) == []
+    [repeat] = dedup.take_due(now=5.0)
+    assert (repeat.fingerprint, repeat.repeats, repeat.values) == (fingerprint, 3, [])
+    assert dedup.admit(fail("a"), "ERROR", now=6.0) == fingerprint  # the next window
+    assert dedup.take_due(now=100.0) == []
+
+
+def test_differing_values_are_reported():
+    dedup = Deduplicator(window=5.0)
+    dedup.admit(fail("a"), "ERROR", now=0.0)
+    for key in ["a", "b", "b", "c"] + [f"many {number}" for number in range(10)]:
+        dedup.admit(fail(key), "ERROR", now=1.0)
+    [repeat] = dedup.take_due(now=0.0, everything=True)
+    assert repeat.repeats == 14
+    assert repeat.summary == "KeyError: 'a'"
+    assert repeat.values[:2] == ["'b'", "'c'"] and len(repeat.values) == MAX_VALUES
+
+
+def test_other_locations_are_not_repeats():
+    dedup = Deduplicator(window=5.0)
+    first = dedup.admit(fail("a"), "ERROR", now=0.0)
+    try:
+        raise KeyError("a")
+    except KeyError as error:
+        assert dedup.admit(error, "ERROR", now=0.0) not in (None, first)
+
+
+def test_forgotten_exception_is_sent_again():
+    dedup = Deduplicator(window=5.0)
+    dedup.admit(fail("a"), "ERROR", now=0.0)
+    dedup.admit(fail("a"), "ERROR", now=1.0)
+    dedup.forget(fail("a"))  # e.g. the queue was full
+    assert dedup.admit(fail("a"), "ERROR", now=2.0) is not None
+    assert [repeat.repeats for repeat in dedup.take_due(now=2.0)] == [1]
+
+
+def test_capacity_keeps_the_counts():
+    dedup = Deduplicator(window=5.0, capacity=1)
+    dedup.admit(fail("a"), "ERROR", now=0.0)
+    dedup.admit(fail("a"), "ERROR", now=1.0)
+    try:
+        raise ValueError("other")
+    except ValueError as error:
+        dedup.admit(error, "ERROR", now=1.0)  # evicts the entry of the first one
+    assert [repeat.repeats for repeat in dedup.take_due(now=1.0)] == [1]
+
+
+def test_client_is_opt_in(server):
+    client = DebugClient(server_info=server.address)
+    assert client._dedup is None
+    for key in "abc":
+        client.send("failed", exception=fail(key))
+    client.flush()
+    assert len(server.wait(3)) == 3
+    client.close()
+
+
+def test_client_sends_the_counter(server):
+    client = DebugClient(server_info=server.address, deduplicate=True, deduplicate_window=60.0)
+    for key in "abb":
+        client.send("failed", exception=fail(key))
+    client.close()  # sends the counts that are still open
+    first, repeat = server.wait(2)
+    assert first['exception_info'] is not None and first['fingerprint'] == repeat['fingerprint']
+    assert (repeat['repeats'], repeat['values']) == (2, ["'b'"])
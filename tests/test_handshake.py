@@ -0,0 +1,105 @@
+# -*- coding=utf-8 -*-
+r"""
+clients and servers only use the features both of them know. peers of an incompatible version are rejected
+"""
+import time
+import socket
+import pytest
+from debuglib import __version__
+from debuglib.core import DebugClient
+from debuglib.core import server as server_module
+from debuglib.core.client._base import BaseClient
+from debuglib.core.common.protocol import build_handshake, HANDSHAKE_HEAD, Encoder, recv_exactly
+
+
+def connect(address: str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    sock.connect(address[len("unix://"):])
+    return sock
+
+
+@pytest.mark.parametrize("features", [b'', b'b', b'bi', b'biLz', b'biLzrp'])
+def test_client_without_some_features(server, features):
+    sock = connect(server.address)
+    sock.sendall(build_handshake(features))
+    assert recv_exactly(sock, 1) == b'1'
+    accepted = recv_exactly(sock, recv_exactly(sock, 1)[0])
+    assert accepted == features
+    if b'p' in accepted:
+        sock.sendall((1234).to_bytes(4, byteorder='big'))
+    message = dict(message="from a restricted client", level="INF", exception_info=None, timestamp=1.0)
+    sock.sendall(Encoder(accepted).encode(message))
+    assert server.wait(1) == [message]
+    sock.close()
+
+
+def test_json_frame_of_the_first_protocol(server):
+    # the frames of the first protocol (json with 2 bytes length) are still understood
+    sock = connect(server.address)
+    sock.sendall(build_handshake(b''))
+    assert recv_exactly(sock, 2) == b'1\0'  # accepted without features
+    message = dict(message="json", level="INF", exception_info=None, timestamp=1.0)
+    sock.sendall(BaseClient.format_message(message))
+    assert server.wait(1) == [message]
+    sock.close()
+
+
+def test_server_without_some_features(server, monkeypatch):
+    monkeypatch.setattr(server_module, 'SERVER_FEATURES', b'')  # e.g. an older server
+    client = DebugClient(server_info=server.address)
+    client.send("to an older server", extra=dict(number=1))
+    client.flush()
+    received = server.wait(1)
+    client.close()
+    assert [(message['message'], message['number']) for message in received] == [("to an older server", 1)]
+
+
+def test_older_version_is_rejected(server):
+    # the handshake of 0.1 ends after the version (no features). it must not block the server
+    sock = connect(server.address)
+    version = b'0.1.0'
+    sock.sendall(HANDSHAKE_HEAD + bytes((len(version),)) + version + b'\0')
+    assert sock.recv(1) == b''  # closed
+    sock.close()
+    assert any("version mismatch" in str(error) for error in server.errors)
+    client = DebugClient(server_info=server.address)
+    client.send("still served")
+    client.flush()
+    assert [message['message'] for message in server.wait(1)] == ["still served"]
+    client.close()
+
+
+def test_stalled_handshake_times_out(server, monkeypatch):
+    monkeypatch.setattr(server_module, 'HANDSHAKE_TIMEOUT', 0.2)
+    stalled = connect(server.address)
+    stalled.sendall(HANDSHAKE_HEAD)
+    client = DebugClient(server_info=server.address, connect_timeout=2.0)
+    client.send("after the stalled one")
+    client.flush()
+    assert [message['message'] for message in server.wait(1)] == ["after the stalled one"]
+    client.close()
+    stalled.close()
+
+
+def test_version_is_part_of_the_handshake():
+    assert build_handshake(b'').startswith(HANDSHAKE_HEAD + bytes((len(__version__),)) + __version__.encode())
+
+
+def test_connections_of_one_process_are_distinct(server):
+    opened = []
+    server.server.on_connection_open(opened.append)
+    sockets = []
+    for pid in (1111, 2222):  # e.g. behind a relay or the sync and the async client of one process
+        sock = connect(server.address)
+        sock.sendall(build_handshake(b'p'))
+        assert recv_exactly(sock, 3) == b'1\x01p'
+        sock.sendall(pid.to_bytes(4, byteorder='big'))
+        sockets.append(sock)
+    deadline = time.monotonic() + 5
+    while len(opened) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(set(opened)) == 2
+    assert [server.server.pid_of(client) for client in opened] == [1111, 2222]
+    for sock in sockets:
+        sock.close()
@@ -0,0 +1,75 @@
+# -*- coding=utf-8 -*-
+r"""
+latencies of Decorator.monitor(aggregate=True): percentiles of the histogram and the summary per interval
+"""
+import random
+import pytest
+from debuglib.decorator import Decorator
+from debuglib.decorator._histogram import Histogram, LatencyAggregator, bucket_index, bucket_value, SUB_BITS
+
+
+PRECISION = 1 / 2 ** (SUB_BITS - 1)
+
+
+def test_buckets_are_monotonic():
+    previous = -1
+    for value in range(100_000):
+        index = bucket_index(value)
+        assert index >= previous
+        previous = index
+
+
+@pytest.mark.parametrize("value", [0, 1, 63, 64, 65, 1000, 12_345, 10 ** 6, 10 ** 9, 2 ** 40 + 17])
+def test_bucket_value_is_close(value):
+    assert abs(bucket_value(bucket_index(value)) - value) <= value * PRECISION
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    for value in range(1, 11):
+        histogram.record(value)
+    assert histogram.percentiles(10, 50, 90, 100) == [1, 5, 9, 10]
+
+
+def test_percentiles_of_a_distribution():
+    rng = random.Random(42)
+    values = sorted(int(rng.lognormvariate(12, 1.5)) for _ in range(20_000))
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    for percent, result in zip((50, 90, 99), histogram.percentiles(50, 90, 99)):
+        exact = values[int(len(values) * percent / 100) - 1]
+        assert abs(result - exact) <= exact * PRECISION * 2
+    summary = histogram.summary()
+    assert (summary['count'], summary['max'], summary['mean']) == (len(values), values[-1], sum(values) // len(values))
+
+
+def test_percentile_never_exceeds_the_max():
+    histogram = Histogram()
+    histogram.record(1_000_001)
+    assert histogram.percentiles(50, 99) == [1_000_001, 1_000_001]
+
+
+def test_errors_are_counted():
+    aggregator = LatencyAggregator(interval=60.0)
+    assert aggregator.record("f", 100) is None
+    assert aggregator.record("f", 200, failed=True) is None
+    assert aggregator.take_due() is None  # the interval isn't over
+    summary = aggregator.take()
+    assert summary['latencies']['f']['count'] == 2 and summary['latencies']['f']['errors'] == 1
+    assert aggregator.take() is None
+
+
+def test_summary_is_sent_without_further_calls(server):
+    decorator = Decorator(server_info=server.address, aggregate_interval=0.2)
+
+    @decorator.monitor(aggregate=True)
+    def hot(value):
+        return value
+
+    for value in range(100):
+        hot(value)
+    # no further call. the summary is sent once the interval is over anyway
+    [message] = server.wait(1, timeout=5)
+    [latency] = message['latencies'].values()
+    assert latency['count'] == 100
@@ -0,0 +1,76 @@
+# -*- coding=utf-8 -*-
+r"""
+rate-limiting and sampling per level and origin. errors always pass
+"""
+import types
+import pytest
+from debuglib.core import DebugClient
+from debuglib.core.client import _limit
+from debuglib.core.client._limit import RateLimiter, format_suppressed
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(_limit, 'time', types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_token_bucket(clock):
+    limiter = RateLimiter(rate=2.0, burst=3)
+    assert [limiter.admit("INF", "app") for _ in range(5)] == [True, True, True, False, False]
+    clock.now += 0.5  # one token
+    assert [limiter.admit("INF", "app") for _ in range(2)] == [True, False]
+    clock.now += 10.0  # not more than the burst
+    assert sum(limiter.admit("INF", "app") for _ in range(10)) == 3
+
+
+def test_buckets_per_level_and_origin(clock):
+    limiter = RateLimiter(rate={"DEBUG": 1.0})
+    assert [limiter.admit("DEB", "a"), limiter.admit("DEB", "a"), limiter.admit("DEB", "b")] == [True, False, True]
+    assert all(limiter.admit("INF", "a") for _ in range(100))  # levels without a rate aren't limited
+
+
+def test_errors_are_always_sent(clock):
+    limiter = RateLimiter(rate=1.0, sample_rate=0.0)
+    assert all(limiter.admit(level, "app") for level in ("ERR", "CRI") for _ in range(100))
+    assert not limiter.admit("WAR", "app")
+
+
+def test_sampling(clock, monkeypatch):
+    values = iter([0.1, 0.6, 0.4, 0.9])
+    monkeypatch.setattr(_limit, 'random', types.SimpleNamespace(random=lambda: next(values)))
+    limiter = RateLimiter(sample_rate=0.5)
+    assert [limiter.admit("INF") for _ in range(4)] == [True, False, True, False]
+
+
+def test_suppressed_counts(clock):
+    limiter = RateLimiter(rate=1.0, summary_interval=10.0)
+    for origin in ("a", "a", "a", "b", "b"):
+        limiter.admit("INF", origin)
+    assert limiter.next_due == clock.now + 10.0
+    assert limiter.take_suppressed(clock.now) == {}
+    clock.now += 10.0
+    suppressed = limiter.take_suppressed(clock.now)
+    assert suppressed == {("INF", "a"): 2, ("INF", "b"): 1}
+    assert format_suppressed(suppressed) == "suppressed 3 messages (rate-limit/sampling): INF/a: 2, INF/b: 1"
+    assert limiter.take_suppressed(clock.now, everything=True) == {}
+
+
+def test_client_reports_suppressed(server):
+    client = DebugClient(server_info=server.address, rate_limit=1.0, rate_burst=2)
+    for number in range(10):
+        client.send(f"info {number}", level="INFO")
+    client.send("error", level="ERROR")
+    client.close()  # sends the summary that isn't due yet
+    received = server.wait(4)
+    assert [message['message'] for message in received[:3]] == ["info 0", "info 1", "error"]
+    assert received[3]['suppressed'] == {"INF": 8}
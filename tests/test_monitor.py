@@ -0,0 +1,50 @@
+# -*- coding=utf-8 -*-
+r"""
+monitor() doesn't format anything while no server receives the messages
+"""
+import pytest
+from debuglib.decorator import Decorator
+
+
+class Argument:
+    formatted = 0
+
+    def __repr__(self):
+        Argument.formatted += 1
+        return "Argument()"
+
+
+@pytest.fixture
+def disconnected(tmp_path):
+    decorator = Decorator(server_info=f"unix://{tmp_path / 'nobody.sock'}")
+    decorator._client.flush()  # the first connection-attempt failed
+    assert not decorator._client.receiving()
+    return decorator
+
+
+@pytest.mark.parametrize("options", [dict(), dict(slow_threshold=0.0), dict(aggregate=True)],
+                         ids=["every-call", "slow-calls", "aggregate"])
+def test_nothing_is_formatted_while_disconnected(disconnected, options):
+    @disconnected.monitor(**options)
+    def function(argument, keyword=None):
+        return argument
+
+    Argument.formatted = 0
+    argument = Argument()
+    for _ in range(10):
+        assert function(argument, keyword=argument) is argument
+    assert Argument.formatted == 0
+
+
+def test_arguments_are_formatted_while_connected(server):
+    decorator = Decorator(server_info=server.address)
+
+    @decorator.monitor()
+    def function(argument):
+        return None
+
+    Argument.formatted = 0
+    function(Argument())
+    decorator._client.flush()
+    assert Argument.formatted == 1
+    assert "function(Argument()) returned None" in server.wait(1)[0]['message']
@@ -0,0 +1,104 @@
+# -*- coding=utf-8 -*-
+r"""
+the shared-memory transport (shm://): wakeups only when needed and the socket as fallback
+"""
+import os
+import socket
+import threading
+import pytest
+from debuglib.core import DebugClient
+from debuglib.core.common import shm
+from debuglib.core.common.shm import RingWriter, RingReader, ShmConnection, SLEEP_AFTER, WAKEUP, SPACE
+from debuglib.core.common.transport import TRANSPORTS, TransportFallback
+
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="needs unix domain sockets")
+
+
+@pytest.fixture
+def ring():
+    writer = RingWriter(capacity=1024)
+    reader = RingReader(writer.path, owner=os.geteuid())
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def test_no_wakeup_while_busy(ring):
+    writer, reader = ring
+    buffer = bytearray()
+    assert writer.write(b'first') is False
+    reader.read_into(buffer)
+    now = reader._last_data
+    assert 0 < reader.prepare_wait(now) <= SLEEP_AFTER  # doesn't ask for a wakeup right away
+    assert writer.write(b'second') is False
+    assert reader.prepare_wait(now) == 0.0
+    reader.read_into(buffer)
+    assert reader.prepare_wait(reader._last_data + SLEEP_AFTER) is None  # idle. sleeps
+    assert reader.prepare_wait(reader._last_data + SLEEP_AFTER) is None  # the flag is only set once
+    assert writer.write(b'third') is True  # the client sends the wakeup
+    assert writer.write(b'fourth') is False
+    reader.read_into(buffer)
+    assert bytes(buffer) == b'firstsecondthirdfourth'
+
+
+def test_wrap_around(ring):
+    writer, reader = ring
+    buffer = bytearray()
+    for number in range(100):
+        data = bytes((number,)) * 300
+        assert writer.free() >= len(data)
+        writer.write(data)
+        reader.read_into(buffer)
+        assert bytes(buffer[-300:]) == data
+    assert len(buffer) == 100 * 300
+
+
+def test_client_waits_for_space(ring):
+    writer, reader = ring
+    client, server = socket.socketpair()
+    connection = ShmConnection(client, writer, timeout=5.0)
+    try:
+        connection.sendall(b'a' * 1000)
+        thread = threading.Thread(target=connection.sendall, args=(b'b' * 500,))
+        thread.start()
+        assert server.recv(1) == WAKEUP  # the ring-buffer is full. the client waits
+        assert reader.space_requested() is True
+        assert reader.space_requested() is False  # only once
+        buffer = bytearray()
+        reader.read_into(buffer)
+        server.sendall(SPACE)
+        thread.join(5)
+        assert not thread.is_alive()
+        reader.read_into(buffer)
+        assert bytes(buffer) == b'a' * 1000 + b'b' * 500
+    finally:
+        client.close()
+        server.close()
+
+
+def test_messages_over_shared_memory(server, monkeypatch):
+    monkeypatch.setattr(TRANSPORTS['shm'], 'capacity', 8 * 1024)  # the client has to wait for space
+    client = DebugClient(server_info=server.address.replace("unix://", "shm://"), timeout=5.0)
+    expected = [f"message {number} " + "x" * 100 for number in range(2000)]
+    for message in expected:
+        client.send(message)
+    client.flush()  # the first connection-attempt is made in the background
+    assert isinstance(client._conn, ShmConnection)
+    client.close()
+    assert [message['message'] for message in server.wait(2000)] == expected
+    assert server.errors == []
+
+
+def test_socket_is_used_if_the_ring_fails(server, monkeypatch):
+    def refuse(path, owner):
+        raise PermissionError("mapping is not allowed")
+
+    monkeypatch.setattr(shm, 'RingReader', refuse)
+    client = DebugClient(server_info=server.address.replace("unix://", "shm://"))
+    client.send("over the socket")
+    client.flush()
+    assert not isinstance(client._conn, ShmConnection)
+    assert [message['message'] for message in server.wait(1)] == ["over the socket"]
+    client.close()
+    assert [type(error) for error in server.errors] == [TransportFallback]
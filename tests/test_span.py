@@ -0,0 +1,55 @@
+# -*- coding=utf-8 -*-
+r"""
+the current span of a context after the instrumentation was disabled during a call
+"""
+import threading
+import pytest
+from debuglib.decorator import Decorator
+from debuglib.decorator._span import current_span, enter_span, leave_span
+
+
+class Service:
+    def __init__(self, instrumentation=None):
+        self.instrumentation = instrumentation
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+
+    def disable_inside(self):
+        self.instrumentation.disable()
+        return current_span.get()
+
+    def wait(self):
+        self.started.set()
+        self.proceed.wait(5)
+
+
+@pytest.fixture
+def decorator(server):
+    return Decorator(server_info=server.address)
+
+
+def test_span_is_reset_in_the_same_context(decorator):
+    service = Service()
+    service.instrumentation = decorator.monitor_class(Service)
+    assert service.disable_inside() is None  # the span of the running call was left
+    assert current_span.get() is None
+
+
+def test_span_is_closed_in_another_context(decorator):
+    service = Service()
+    instrumentation = decorator.monitor_class(Service)
+    parents = []
+
+    def run():
+        service.wait()
+        span_id, parent, token = enter_span()  # after the dropped call. in the same context
+        leave_span(token)
+        parents.append(parent)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert service.started.wait(5)
+    instrumentation.disable()
+    service.proceed.set()
+    thread.join(5)
+    assert parents == [None]
@@ -0,0 +1,113 @@
+# -*- coding=utf-8 -*-
+r"""
+messages that are sent while there is no connection are kept on disk and replayed in order
+"""
+import errno
+import threading
+import time
+import pytest
+from debuglib.core import DebugClient, DebugServer
+from debuglib.core.client._spool import Spool
+
+
+def build(number: int) -> dict:
+    return dict(message=f"message {number}", level="INF", exception_info=None, timestamp=float(number))
+
+
+def take_all(spool: Spool) -> list:
+    messages = []
+    while True:
+        taken = spool.take()
+        if not taken:
+            return messages
+        messages.extend(taken)
+
+
+def test_replay_order_over_segments(tmp_path):
+    spool = Spool(directory=str(tmp_path), max_size=1024 * 1024, segment_size=1024)
+    for number in range(100):
+        spool.append([build(number)])
+    assert len(spool) == 100
+    assert len(list(tmp_path.glob("*.spool"))) > 1
+    assert take_all(spool) == [build(number) for number in range(100)]
+    assert not spool
+
+
+def test_orphans_are_adopted(tmp_path):
+    previous = Spool(directory=str(tmp_path), segment_size=1024)
+    previous.append([build(number) for number in range(50)])
+    previous.close()
+    second = Spool(directory=str(tmp_path), segment_size=1024)  # the previous one is still alive
+    assert not second
+    del previous  # e.g. the process ended
+    third = Spool(directory=str(tmp_path), segment_size=1024)
+    assert take_all(third) == [build(number) for number in range(50)]
+
+
+def test_directory_is_bounded(tmp_path):
+    spool = Spool(directory=str(tmp_path), max_size=8 * 1024, segment_size=1024)
+    for number in range(1000):
+        spool.append([build(number)])
+    spool.close()
+    assert sum(path.stat().st_size for path in tmp_path.glob("*.spool")) <= 8 * 1024
+    messages = take_all(spool)
+    assert spool.evicted + len(messages) == 1000
+    assert messages == [build(number) for number in range(1000 - len(messages), 1000)]  # the newest are kept
+
+
+def test_not_serializable_message_is_skipped(tmp_path):
+    spool = Spool(directory=str(tmp_path))
+    with pytest.raises(TypeError):
+        spool.append([build(1), dict(build(2), broken=object()), build(3)])
+    assert take_all(spool) == [build(1), build(3)]
+
+
+def test_client_replays_after_reconnect(tmp_path):
+    address = f"unix://{tmp_path / 'debuglib.sock'}"
+    client = DebugClient(server_info=address, spool=str(tmp_path / "spool"), connection_attempt_delta=0.05,
+                         max_connection_attempt_delta=0.1, deduplicate=False)
+    errors = []
+    client.on_error(errors.append)
+    for number in range(20):
+        client.send(f"offline {number}")
+    client.flush()
+    assert len(client._spool) == 20
+
+    server = DebugServer(server_info=address)
+    received = []
+    connected = threading.Event()
+    server.on_message(lambda message, peer: received.append(message['message']))
+    server.on_connection_open(lambda peer: connected.set())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert connected.wait(5)
+        client.send("online")
+        client.close()
+        deadline = time.monotonic() + 5
+        while len(received) < 21 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        server.shutdown()
+        server.close()
+        thread.join()
+    assert received == [f"offline {number}" for number in range(20)] + ["online"]
+
+
+def test_disk_errors_are_not_raised_into_the_application(tmp_path, monkeypatch):
+    client = DebugClient(server_info=f"unix://{tmp_path / 'missing.sock'}", spool=str(tmp_path / "spool"))
+    errors = []
+    client.on_error(errors.append)
+    client.flush()  # the first connection-attempt failed
+
+    def disk_full(messages):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(client._spool, 'append', disk_full)
+    client.send("lost")
+    client.send("not serializable", extra=dict(broken=object()))
+    assert any(isinstance(error, OSError) and error.errno == errno.ENOSPC for error in errors)
+    monkeypatch.undo()
+    client.send("not serializable", extra=dict(broken=object()))
+    assert isinstance(errors[-1], TypeError)
+    client.close()
@@ -0,0 +1,42 @@
+# -*- coding=utf-8 -*-
+r"""
+many threads share one DebugClient. every frame has to arrive intact and the order of each thread is kept
+"""
+import threading
+import pytest
+from debuglib.core import DebugClient
+
+
+THREADS = 8
+MESSAGES = 2_000  # per thread
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_concurrent_send(server, batch):
+    received, errors = server.received, server.errors
+    client = DebugClient(server_info=server.address, batch=batch, deduplicate=False)
+    client.on_error(errors.append)
+    start = threading.Barrier(THREADS)
+
+    def produce(index: int):
+        start.wait()
+        for number in range(MESSAGES):
+            client.send(f"{index}:{number}", level="INFO", extra=dict(span=dict(thread=index, number=number)))
+
+    producers = [threading.Thread(target=produce, args=(index,)) for index in range(THREADS)]
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    client.flush()
+    server.wait(THREADS * MESSAGES)
+    client.close()
+
+    assert errors == []  # every frame could be decoded
+    assert len(received) == THREADS * MESSAGES
+    last = [-1] * THREADS
+    for message in received:
+        index, number = map(int, message['message'].split(":"))
+        assert message['span'] == dict(thread=index, number=number)  # body matches the head of the frame
+        assert number == last[index] + 1  # nothing lost, duplicated or reordered within the thread
+        last[index] = number